@@ -83,6 +83,11 @@ async def router_node(state: AgentState):
         print(f"DEBUG ROUTER | Proceeding with Explicit Intent: {explicit_intent}")
         return {"intent": explicit_intent}
 
+    # Intent already decided before the graph run (routed concurrently with document extraction)
+    if state.get("intent"):
+        print(f"DEBUG ROUTER | Using Pre-Routed Intent: {state['intent']}")
+        return {"intent": state["intent"]}
+
     descriptions_text = "\n".join([f"- '{key}': {desc}" for key, desc in agent_descriptions.items()])
 
     system_prompt = f"""You are an intelligent DeepDiagram Router.
@@ -149,11 +154,17 @@ async def router_node(state: AgentState):
     from app.core.llm import get_time_instructions
     routing_instructions += get_time_instructions()
     
-    # We pass the instruction as a SystemMessage and the ACTUAL last message as is.
-    # This ensures that if the last message has image_url, the LLM will see it as an image, NOT as long text tokens.
+    # Routing is decided from text alone: image parts of the last message are replaced by a
+    # placeholder so the router never pays vision tokens for the uploaded pixels.
+    last_content = messages[-1].content
+    if isinstance(last_content, list):
+        last_content = " ".join(
+            item.get("text", "") if item.get("type") == "text" else "[User uploaded an image]"
+            for item in last_content if isinstance(item, dict)
+        )
     msgs_to_invoke = [
         SystemMessage(content=routing_instructions),
-        messages[-1] # The real last message with multimodal content
+        HumanMessage(content=last_content)
     ]
     
     llm = get_configured_llm(state)
@@ -179,6 +190,14 @@ async def router_node(state: AgentState):
     else:
         return {"intent": "general"} # Default to general for safety
 
+async def pre_route(messages: list, model_config: dict | None = None) -> str:
+    """
+    Runs the router outside of the graph so its LLM call can overlap other work
+    (e.g. document extraction). The returned intent is passed to the graph as state["intent"].
+    """
+    result = await router_node({"messages": messages, "model_config": model_config})
+    return result["intent"]
+
 def route_decision(state: AgentState) -> Literal["mindmap_agent", "flow_agent", "mermaid_agent", "charts_agent", "drawio_agent", "infographic_agent", "general_agent"]:
     intent = state.get("intent")
     if intent == "mindmap":
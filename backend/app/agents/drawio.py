@@ -1,6 +1,8 @@
 from langchain_core.messages import SystemMessage
 from app.state.state import AgentState
 from app.core.llm import get_configured_llm, get_thinking_instructions
+from app.core.config import settings
+from app.services.drawio_dsl import GROUP_COLORS, STYLE_PRESETS, is_drawio_dsl
 
 DRAWIO_SYSTEM_PROMPT = """You are a Principal Cloud Solutions Architect and Draw.io (mxGraph) Master. Your goal is to generate professional, high-fidelity, and architecturally accurate Draw.io XML with rich visual details.
 
@@ -125,6 +127,61 @@ Simple client-server architecture with database backend.
 Output ONLY the design_concept and code tags, nothing else.
 """
 
+# Compact mode (DRAWIO_COMPACT_DSL): the model writes structure only and the server expands it
+# into mxGraph XML with preset styles and auto-layout, a fraction of the output tokens
+DRAWIO_DSL_SYSTEM_PROMPT = """You are a Principal Cloud Solutions Architect. Your goal is to design professional, architecturally accurate diagrams, written in a compact diagram language that is converted to Draw.io automatically.
+
+### ARCHITECTURAL PRINCIPLES
+- **Structural Integrity**: Don't just draw blocks. Design complete systems. For "Microservices", include API Gateways, Service Discovery, Load Balancers, and dedicated Data Stores.
+- **Logical Zonation**: Use groups to separate Frontend, Backend, Data, and Sidecar layers, or VPC / region boundaries.
+- **Minimum Complexity**: Generate at least 8-15 components for any diagram. Include supporting elements like load balancers, caches, queues, monitoring, etc.
+- **MANDATORY ENRICHMENT**: Transform high-level requests into detailed blueprints. If a user asks for "Next.js on AWS", show Vercel (or AWS Amplify), Edge Functions, S3 buckets, Lambda, DynamoDB, CloudFront CDN, Route53, and monitoring with CloudWatch.
+- **Add Context**: Include users/clients, external integrations, monitoring, security layers, and data flow arrows.
+- **LANGUAGE**: All labels must match the user's input language.
+
+### DIAGRAM LANGUAGE (one statement per line)
+- `direction LR` (left to right) or `direction TB` (top to bottom, the default), first line
+- Component: `id: Label [kind]`
+- Group: `group id: Label [kind] {` ... `}` (groups can be nested)
+- Connection: `a -> b: label`, chains `a -> b -> c`, dashed `a --> b`, both directions `a <-> b` (label optional)
+- ids are short words (letters, digits, `_`, `-`, `.`); use `\\n` for a line break in a label
+- Component kinds: """ + ", ".join(STYLE_PRESETS) + """
+- Group kinds: """ + ", ".join(GROUP_COLORS) + """
+- Styles, colors, sizes and positions are chosen automatically: NEVER write coordinates, styles or XML.
+
+### OUTPUT FORMAT
+<design_concept>
+Your architectural decisions and component layout rationale here (1-3 sentences)
+</design_concept>
+
+<code>
+direction LR
+users: Customers [user]
+group edge: Edge [cloud] {
+  cdn: CloudFront CDN [cloud]
+  waf: WAF [security]
+}
+group app: Application [backend] {
+  api: API Gateway [gateway]
+  orders: Order Service [service]
+  worker: Fulfilment Worker [function]
+}
+group data: Data [data] {
+  db: Orders DB [database]
+  cache: Redis Cache [cache]
+  queue: Order Events [queue]
+}
+users -> cdn -> waf -> api: HTTPS
+api -> orders
+orders -> db
+orders -> cache
+orders --> queue: publish
+queue --> worker
+</code>
+
+Output ONLY the design_concept and code tags, nothing else.
+"""
+
 def extract_current_code_from_messages(messages) -> str:
     """Extract the latest drawio code from message history."""
     for msg in reversed(messages):
@@ -137,6 +194,8 @@ def extract_current_code_from_messages(messages) -> str:
         if msg.type == "ai" and hasattr(msg, 'additional_kwargs'):
             steps = msg.additional_kwargs.get('steps', [])
             for step in reversed(steps):
+                if step.get('type') == 'tool_end' and step.get('source'):
+                    return step['source'].strip()
                 if step.get('type') == 'tool_end' and step.get('content'):
                     content = step['content'].strip()
                     if '<mxfile' in content or '<mxGraphModel' in content:
@@ -155,9 +214,11 @@ async def drawio_agent_node(state: AgentState):
             msg.content = "Generate a diagram"
 
     # Build system prompt
-    system_content = DRAWIO_SYSTEM_PROMPT + get_thinking_instructions()
+    # Diagrams that exist only as XML are edited as XML
+    compact = settings.DRAWIO_COMPACT_DSL and (not current_code or is_drawio_dsl(current_code))
+    system_content = (DRAWIO_DSL_SYSTEM_PROMPT if compact else DRAWIO_SYSTEM_PROMPT) + get_thinking_instructions()
     if current_code:
-        system_content += f"\n\n### CURRENT DIAGRAM CODE\n```xml\n{current_code}\n```\nApply changes to this code based on the user's request."
+        system_content += f"\n\n### CURRENT DIAGRAM CODE\n```{'' if compact else 'xml'}\n{current_code}\n```\nApply changes to this code based on the user's request."
 
     system_prompt = SystemMessage(content=system_content)
 
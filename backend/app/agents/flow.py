@@ -1,6 +1,8 @@
+import re
 from langchain_core.messages import SystemMessage
 from app.state.state import AgentState
 from app.core.llm import get_configured_llm, get_thinking_instructions
+from app.core.config import settings
 
 FLOW_SYSTEM_PROMPT = """You are a Senior Business Process Architect and workflow optimization expert. Your goal is to generate premium, enterprise-grade flowcharts in JSON for React Flow.
 
@@ -76,6 +78,19 @@ Your process design decisions and optimization rationale here (1-3 sentences)
 Output ONLY these two tags, nothing else. The JSON must be valid and complete.
 """
 
+# FLOW_AUTO_LAYOUT: the same prompt without node positions, which the server computes
+# (app/services/flow_layout.py); positions are a large share of the output tokens
+FLOW_AUTO_LAYOUT_SYSTEM_PROMPT = re.sub(r'"position": \{[^}]*\},\s*', "", FLOW_SYSTEM_PROMPT).replace(
+    "Use logical spacing (250px vertical, 400px horizontal) to create a clean grid.",
+    "Node positions are computed automatically by a layout engine, so list nodes in process order and focus on structure.",
+).replace(
+    "Every node MUST have unique `id`, `type`, `position`, and `data.label`",
+    "Every node MUST have unique `id`, `type`, and `data.label`",
+).replace(
+    "Position coordinates must be numbers, not strings",
+    "NEVER include `position`: nodes are laid out automatically",
+)
+
 def extract_current_code_from_messages(messages) -> str:
     """Extract the latest flowchart code from message history."""
     for msg in reversed(messages):
@@ -106,7 +121,7 @@ async def flow_agent_node(state: AgentState):
             msg.content = "Generate a flowchart"
 
     # Build system prompt
-    system_content = FLOW_SYSTEM_PROMPT + get_thinking_instructions()
+    system_content = (FLOW_AUTO_LAYOUT_SYSTEM_PROMPT if settings.FLOW_AUTO_LAYOUT else FLOW_SYSTEM_PROMPT) + get_thinking_instructions()
     if current_code:
         system_content += f"\n\n### CURRENT FLOWCHART CODE (JSON)\n```json\n{current_code}\n```\nApply changes to this code based on the user's request."
 
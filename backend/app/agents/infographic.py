@@ -1,14 +1,18 @@
 from langchain_core.messages import SystemMessage, HumanMessage
 from app.state.state import AgentState
 from app.core.llm import get_configured_llm, get_thinking_instructions
+from app.core.config import settings
 from app.data.template_syntax import (
     TEMPLATES,
     ALL_TEMPLATES,
+    TEMPLATE_SELECTION_GUIDE,
+    TEMPLATE_SYNTAX_RULES,
     get_template_category,
     get_syntax_rules_for_template,
     get_data_field_for_template,
     get_common_syntax_rules,
 )
+from app.services.template_selector import select_template_locally
 
 # Step 1: Template selection prompt
 TEMPLATE_SELECTOR_PROMPT = """You are a professional infographic design consultant. Your task is to select the BEST template for the user's needs.
@@ -94,6 +98,42 @@ The AntV Infographic DSL code here (raw DSL, no markdown fences)
 Output ONLY these two tags, nothing else.
 """
 
+# Single-call mode: the model picks the template from a compact catalogue and writes its DSL
+COMBINED_GENERATOR_PROMPT = """You are a World-Class Graphic Designer. Pick the best AntV Infographic template for the user's request and generate its DSL syntax.
+
+### TEMPLATE CATALOGUE
+{catalogue}
+
+### TEMPLATE SELECTION GUIDE
+{selection_guide}
+
+### SYNTAX EXAMPLES PER CATEGORY
+{syntax_examples}
+
+{common_syntax_rules}
+
+### DESIGN PHILOSOPHY
+- **Narrative Flow**: Tell a story, not just present data
+- **Visual Metaphor**: Select meaningful icons
+- **Aesthetic Balance**: Professional color palettes
+- **LANGUAGE**: Match user's input language
+- **CRITICAL**: ALL field values MUST be plain strings. NEVER use arrays, objects, or nested structures.
+- **NO COMMENTS**: NEVER include comments (// or /* */) in the DSL.
+
+### OUTPUT FORMAT
+Output your response using these XML-style tags:
+
+<design_concept>
+The chosen template and your creative direction (1-3 sentences)
+</design_concept>
+
+<code>
+The AntV Infographic DSL code here (raw DSL, no markdown fences), starting with `infographic <template-name>` for a template from the catalogue
+</code>
+
+Output ONLY these two tags, nothing else.
+"""
+
 
 def build_template_selector_prompt() -> str:
     """Build the template selector prompt with all available templates."""
@@ -140,6 +180,32 @@ def build_code_generator_prompt(template_name: str) -> str:
     )
 
 
+def build_combined_generator_prompt() -> str:
+    """Build the single-call prompt: every template, one syntax example per category."""
+    catalogue, examples = [], []
+    for category, templates in TEMPLATES.items():
+        rules = TEMPLATE_SYNTAX_RULES.get(category, {})
+        names = [
+            name if get_data_field_for_template(name) == rules.get("data_field") else f"{name} (uses `{get_data_field_for_template(name)}`)"
+            for name in templates
+        ]
+        catalogue.append(f"- **{category}** (`{rules.get('data_field')}`: {', '.join(rules.get('item_fields', []))}): {', '.join(names)}")
+        examples.append(f"**{category}**\n```\n{rules.get('syntax_example', '')}\n```")
+        if rules.get("relation_syntax"):
+            examples.append("Relation edges:\n" + "\n".join(f"- {line}" for line in rules["relation_syntax"]))
+        for name, example in rules.get("special_syntax", {}).items():
+            examples.append(f"**{name}-***\n```\n{example}\n```")
+    selection_guide = "\n".join(
+        f"- {guide['description']}: {', '.join(guide['templates'])}" for guide in TEMPLATE_SELECTION_GUIDE.values()
+    )
+    return COMBINED_GENERATOR_PROMPT.format(
+        catalogue="\n".join(catalogue),
+        selection_guide=selection_guide,
+        syntax_examples="\n\n".join(examples),
+        common_syntax_rules=get_common_syntax_rules(),
+    )
+
+
 def extract_current_code_from_messages(messages) -> str:
     """Extract the latest infographic code from message history."""
     for msg in reversed(messages):
@@ -207,19 +273,21 @@ async def infographic_agent_node(state: AgentState):
         if msg.type == "human":
             user_request = msg.content
             break
-
-    # Determine template to use
-    if current_code:
-        # If modifying existing code, use the same template
-        template_name = extract_template_from_code(current_code)
-        if not template_name:
-            template_name = await select_template(llm, user_request)
-    else:
-        # Step 1: Select the best template
+    if isinstance(user_request, list):
+        user_request = " ".join(part.get("text", "") for part in user_request if isinstance(part, dict))
+
+    # Determine template to use: the current one when editing, else (INFOGRAPHIC_TEMPLATE_SELECTION)
+    # the local index, or one combined call that picks the template while writing the DSL
+    template_name = extract_template_from_code(current_code) if current_code else ""
+    mode = settings.INFOGRAPHIC_TEMPLATE_SELECTION
+    if not template_name and mode == "local":
+        template_name = select_template_locally(user_request) or ""
+    if not template_name and mode == "llm":
+        # Two serial calls: select, then generate
         template_name = await select_template(llm, user_request)
 
-    # Step 2: Generate code using template-specific prompt
-    code_prompt = build_code_generator_prompt(template_name)
+    # Generate code using the template-specific prompt, or the catalogue when no template is known
+    code_prompt = build_code_generator_prompt(template_name) if template_name else build_combined_generator_prompt()
     system_content = code_prompt + get_thinking_instructions()
 
     if current_code:
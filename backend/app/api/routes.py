@@ -1,19 +1,41 @@
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, Request, Response, HTTPException, Query
 from fastapi.responses import StreamingResponse
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from langchain_core.messages import HumanMessage, AIMessage
 from app.agents.graph import graph
-from app.core.database import get_session
+from app.agents.dispatcher import pre_route
+from app.core.database import get_session, session_scope, pool_metrics, query_metrics
 from sqlmodel.ext.asyncio.session import AsyncSession
+from app.services.archive_service import ArchiveService
 from app.services.chat import ChatService
+from app.services.drawio_dsl import expand_drawio_dsl, is_drawio_dsl
+from app.services.drawio_repair import DrawioRepairer
+from app.services.flow_layout import layout_flow_code
+from app.services.partial_artifact import DrawioPartial, partial_artifact
+from app.services.search_service import SearchService
+from app.services.snapshot_service import SessionSnapshotService
+from app.models.chat import MESSAGE_COMPLETE, MESSAGE_INTERRUPTED, MESSAGE_STREAMING
+from app.services.blob_store import DEFAULT_CONTENT_TYPE, get_blob_store, store_file, load_images, load_file
+from app.services.image_service import ImageCaptionService, select_pixel_images, store_image
+from app.services.write_behind import WriteBehindQueue
+import asyncio
+import gzip
+import ipaddress
 import json
 import re
+from contextlib import aclosing
 from typing import AsyncGenerator
 from app.core.logger import logger
+from app.core.config import settings
 from datetime import datetime
 
 router = APIRouter()
 
+CONTINUE_PROMPT = (
+    "Your previous response was cut off. Continue it exactly where it stopped: output only the "
+    "remaining part, without repeating anything already written and without any preamble."
+)
+
 class ChatRequest(BaseModel):
     session_id: int | None = None
     agent_id: str | None = None
@@ -28,6 +50,11 @@ class ChatRequest(BaseModel):
     model_id: str | None = None
     api_key: str | None = None
     base_url: str | None = None
+    doc_mode: str | None = None  # "summarize" | "retrieval", defaults to settings.DOC_CONTEXT_MODE
+    retrieval_top_k: int | None = None
+    pdf_pages: str | None = None  # e.g. "1-20,35" (1-based)
+    pdf_max_pages: int | None = Field(default=None, ge=1)
+    resume_message_id: int | None = None  # with is_retry: continue an interrupted assistant message
 
 
 class StreamingTagParser:
@@ -195,159 +222,94 @@ def extract_tag_fields(content: str) -> tuple[str, str]:
 extract_json_fields = extract_tag_fields
 
 
-def sanitize_drawio_xml(xml_content: str) -> str:
-    """Remove invalid <Array> elements from Draw.io XML that cause parsing errors."""
-    if not xml_content or '<mxfile' not in xml_content:
-        return xml_content
-
-    # Remove <Array .../> elements (self-closing) - handles multiline
-    xml_content = re.sub(r'<Array[^/>]*?/>', '', xml_content, flags=re.DOTALL)
-    # Remove <Array ...>...</Array> elements (with content)
-    xml_content = re.sub(r'<Array[^>]*>[\s\S]*?</Array>', '', xml_content)
-    # Remove standalone <Array points="..."/> patterns with various whitespace
-    xml_content = re.sub(r'\s*<Array\s+points="[^"]*"\s*/>\s*', '', xml_content)
-    # Clean up any resulting empty lines inside mxGeometry
-    xml_content = re.sub(r'(<mxGeometry[^>]*>)\s+(</(mxGeometry|mxCell)>)', r'\1\2', xml_content)
-    # Clean up multiple newlines
-    xml_content = re.sub(r'\n\s*\n\s*\n', '\n\n', xml_content)
-
-    return xml_content
+async def event_generator(request: ChatRequest, client_id: str = "anonymous") -> AsyncGenerator[str, None]:
+    # Database work happens in short units of work (session_scope) so no pooled connection is
+    # held while the LLM streams, which can take minutes.
+    model_config = {
+        "model_id": request.model_id,
+        "api_key": request.api_key,
+        "base_url": request.base_url
+    } if (request.model_id or request.api_key or request.base_url) else None
+    caption_service = ImageCaptionService(model_config)
 
+    # Retries resend stored images as blob URLs; new uploads are downscaled and stored
+    stored_images = [await store_image(img) for img in request.images]
+    stored_files = [await store_file(f) for f in request.files]
 
-async def event_generator(request: ChatRequest, db: AsyncSession) -> AsyncGenerator[str, None]:
-    chat_service = ChatService(db)
+    session_id = request.session_id
 
     # 1. Manage Session
-    session_id = request.session_id
+    # Created before anything is streamed: the frontend filters every later event by session_id
     if not session_id:
-        chat_session = await chat_service.create_session(title=request.prompt[:30])
+        async with session_scope() as db:
+            chat_session = await ChatService(db).create_session(title=request.prompt[:30])
         session_id = chat_session.id
         yield f"event: session_created\ndata: {json.dumps({'session_id': session_id})}\n\n"
 
-    # 2. Load History for context reconstruction
-    all_history = await chat_service.get_history(session_id)
-    history_map = {msg.id: msg for msg in all_history}
-
-    # 3. Manage User Message
+    # 2. Manage User Message
+    # Written behind: only the history feeds the prompt, so the insert runs while the prompt is
+    # assembled and the LLM is called. Later writes of this turn go through the same queue.
+    writer = WriteBehindQueue(label=f"session {session_id}")
+    # An archived session gets its rows back first (queued ahead of the writes that reference them)
+    restore_write = None
+    if request.session_id:
+        restore_write = writer.submit(lambda chat: ArchiveService(chat.session).restore_if_archived(session_id))
+    user_write = None
     last_user_msg_id = None
-    user_msg = None
     if request.is_retry and request.parent_id:
         # If retrying, the parent_id IS the user message we are retrying
         last_user_msg_id = request.parent_id
     else:
-        # Save new User Message
-        user_msg = await chat_service.add_message(
+        # Save new User Message; binary payloads go to the blob store, the row keeps references
+        user_write = writer.submit(lambda chat: chat.add_message(
             session_id, "user", request.prompt,
-            images=request.images,
-            files=request.files,
+            images=stored_images,
+            files=stored_files,
             parent_id=request.parent_id
-        )
-        last_user_msg_id = user_msg.id
-
-    turn_index = 0
-    if user_msg:
-        turn_index = user_msg.turn_index
-    elif last_user_msg_id in history_map:
-        turn_index = history_map[last_user_msg_id].turn_index
-
-    yield f"event: message_created\ndata: {json.dumps({'id': last_user_msg_id, 'role': 'user', 'turn_index': turn_index})}\n\n"
-
-    # 4. Handle Document Parsing & Extraction
-    doc_context = ""
-    accumulated_steps = []
-
-    # Check if we can reuse existing context (Retry case)
-    if request.is_retry and last_user_msg_id in history_map:
-        existing_msg = history_map[last_user_msg_id]
-        if existing_msg.file_context:
-            doc_context = existing_msg.file_context
-            yield f"event: status\ndata: {json.dumps({'content': 'Reusing previous document analysis...'})}\n\n"
-            logger.info(f"♻️ Reusing existing file context for message {last_user_msg_id}")
-
-    if not doc_context and request.files:
-        from app.services.file_service import FileParsingService, LLMExtractionService
-        parsing_service = FileParsingService()
-        extraction_service = LLMExtractionService({
-            "model_id": request.model_id,
-            "api_key": request.api_key,
-            "base_url": request.base_url
-        })
-
-        all_parsed_text = ""
-        for file_info in request.files:
-            filename = file_info.get("name", "document")
-            yield f"event: status\ndata: {json.dumps({'content': f'Parsing {filename}...'})}\n\n"
-            parsed_text = await parsing_service.parse_file(filename, file_info.get("data", ""))
-            all_parsed_text += f"\n\n--- Document: {filename} ---\n{parsed_text}"
-
-        if all_parsed_text.strip():
-            yield f"event: status\ndata: {json.dumps({'content': 'Extracting core data from documents...'})}\n\n"
-
-            # Use dedicated events for document analysis to separate from tool flow
-            yield f"event: doc_analysis_start\ndata: {json.dumps({'session_id': session_id})}\n\n"
-
-            analysis_buffers = {}
-
-            async for result in extraction_service.extract_and_summarize(
-                all_parsed_text,
-                concurrency=request.concurrency,
-                status_callback=None
-            ):
-                chunk_idx = result["index"]
-                content = result.get("content", "")
-                status = result.get("status", "running")
-
-                # Initialize buffer if needed
-                if chunk_idx not in analysis_buffers:
-                    analysis_buffers[chunk_idx] = ""
-
-                if status == "running":
-                    analysis_buffers[chunk_idx] += content
-                    yield f"event: doc_analysis_chunk\ndata: {json.dumps({'content': content, 'index': chunk_idx, 'status': 'running', 'session_id': session_id})}\n\n"
-
-                elif status in ["done", "error"]:
-                    # Final content for this block
-                    final_text = analysis_buffers[chunk_idx]
-
-                    if chunk_idx == -1:
-                        doc_context = final_text
-                        step_name = "doc_analysis_synthesis"
-                    else:
-                        step_name = f"doc_analysis_chunk_{chunk_idx}"
-
-                    # Deduplication: Check if we already have a step for this index
-                    existing_step = False
-                    for step in accumulated_steps:
-                        if step["type"] == "doc_analysis":
-                            try:
-                                content_json = json.loads(step["content"])
-                                if content_json.get("index") == chunk_idx:
-                                    existing_step = True
-                                    break
-                            except:
-                                pass
-
-                    if not existing_step:
-                        accumulated_steps.append({
-                            "type": "doc_analysis",
-                            "name": step_name,
-                            "content": json.dumps({"index": chunk_idx, "content": final_text}),
-                            "status": "done",
-                            "start_time": datetime.utcnow().timestamp(),
-                            "end_time": datetime.utcnow().timestamp()
-                        })
-
-                    # Send final empty chunk to signal done state to frontend
-                    yield f"event: doc_analysis_chunk\ndata: {json.dumps({'content': '', 'index': chunk_idx, 'status': 'done', 'session_id': session_id})}\n\n"
-
-            yield f"event: doc_analysis_end\ndata: {json.dumps({'content': doc_context, 'session_id': session_id})}\n\n"
-
-            yield f"event: status\ndata: {json.dumps({'content': 'Document processing complete.'})}\n\n"
-
-            # Persist newly generated context to the user message
-            if doc_context:
-                await chat_service.update_message(last_user_msg_id, file_context=doc_context)
+        ))
+        if not settings.DB_WRITE_BEHIND:
+            await user_write
+
+    # 3. Load History for context reconstruction (a new session has none)
+    all_history = []
+    if request.session_id:
+        await restore_write
+        async with session_scope() as db:
+            all_history = await ChatService(db).get_history(session_id)
+    history_map = {msg.id: msg for msg in all_history}
 
+    # "Continue from here": an unfinished assistant reply to this user message, resumed from its checkpoint
+    resume_msg = history_map.get(request.resume_message_id) if request.resume_message_id else None
+    if request.resume_message_id and not (
+        resume_msg and resume_msg.role == "assistant" and resume_msg.status != MESSAGE_COMPLETE
+        and resume_msg.draft_output and resume_msg.parent_id == last_user_msg_id
+    ):
+        logger.warning(f"Message {request.resume_message_id} cannot be resumed, regenerating instead")
+        resume_msg = None
+
+    user_msg_announced = False
+
+    def announce_user_message() -> list[str]:
+        """The user message_created event, once its row exists (always before the assistant's)."""
+        nonlocal user_msg_announced, last_user_msg_id
+        if user_msg_announced or (user_write and not user_write.done()):
+            return []
+        user_msg_announced = True
+        if user_write:
+            user_msg = user_write.result()  # re-raises a failed insert into the stream
+            last_user_msg_id, turn_index = user_msg.id, user_msg.turn_index
+        else:
+            turn_index = history_map[last_user_msg_id].turn_index if last_user_msg_id in history_map else 0
+        return [f"event: message_created\ndata: {json.dumps({'id': last_user_msg_id, 'role': 'user', 'turn_index': turn_index})}\n\n"]
+
+    if user_write:
+        # Caption now, while the image is still sent as pixels, so the caption is ready once it ages out
+        await caption_service.precaption(stored_images)
+
+    for created_event in announce_user_message():
+        yield created_event
+
+    # 4. Assemble the branch history (needed by both the router and the agents)
     # Group messages by turn_index and pick the latest of each
     turn_to_latest = {}
     for msg in all_history:
@@ -372,13 +334,19 @@ async def event_generator(request: ChatRequest, db: AsyncSession) -> AsyncGenera
 
     logger.info(f"⏱️ History assembly took {(time.time() - start_time) * 1000:.2f}ms, {len(branch_messages)} messages")
 
+    # Only the newest images are sent as pixels (the current ones first); older ones as cached captions
+    history_images = [msg.images for msg in branch_messages if msg.role == "user" and msg.images]
+    pixel_refs = select_pixel_images(history_images, settings.IMAGE_RETAIN_LATEST - len(stored_images))
+    captions = await caption_service.captions(
+        [ref for images in history_images for ref in images if ref not in pixel_refs]
+    )
+
     formatted_history = []
     for msg in branch_messages:
         if msg.role == "user":
             if msg.images:
                 human_content = [{"type": "text", "text": msg.content}]
-                for img_url in msg.images:
-                    human_content.append({"type": "image_url", "image_url": {"url": img_url}})
+                human_content += await caption_service.history_parts(msg.images, pixel_refs, captions)
                 formatted_history.append(HumanMessage(content=human_content))
             else:
                 formatted_history.append(HumanMessage(content=msg.content))
@@ -397,13 +365,14 @@ async def event_generator(request: ChatRequest, db: AsyncSession) -> AsyncGenera
                     elif s["type"] == "tool_start":
                         last_tool_desc = f"toolName: {s['name']}, toolArgs: {s.get('content', '')}"
                     elif s["type"] == "tool_end" and last_tool_desc:
-                        output = s.get('content', '')
+                        # Diagrams expanded from the compact DSL are shown to the model as that DSL
+                        output = s.get('source') or s.get('content', '')
                         # Combine start and end into a single execution line
                         execution_details.append(f"{last_tool_desc}, toolsOutput: {output}")
                         last_tool_desc = ""
                     elif s["type"] == "tool_end":
                          # Fallback if no tool_start found
-                         output = s.get('content', '')
+                         output = s.get('source') or s.get('content', '')
                          execution_details.append(f"toolName: {s['name']}, toolsOutput: {output}")
 
                 if last_tool_desc:
@@ -418,14 +387,208 @@ async def event_generator(request: ChatRequest, db: AsyncSession) -> AsyncGenera
 
             formatted_history.append(AIMessage(content=content))
 
+    request_images = await load_images(stored_images)
+
+    # Routing only needs the prompt and the file types, so when documents are attached the
+    # router's LLM round trip runs concurrently with parsing/extraction instead of after it.
+    routing_task = None
+    if request.files:
+        file_names = ", ".join(f.get("name", "document") for f in request.files)
+        routing_text = f"{request.prompt}\n\n[Attached documents: {file_names}]"
+        if request_images:
+            routing_text += f"\n[User uploaded {len(request_images)} image(s)]"
+        routing_message = HumanMessage(content=routing_text)
+        routing_task = asyncio.create_task(pre_route(formatted_history + [routing_message], model_config))
+
+    doc_context = ""
+    accumulated_steps = []
+    routed_intent = None
+    # Deferred edits to the user message, written in the same transaction as the assistant message
+    user_msg_update = {}
+
+    try:
+        # 5. Handle Document Parsing & Extraction
+        # Check if we can reuse existing context (Retry case)
+        if request.is_retry and last_user_msg_id in history_map:
+            existing_msg = history_map[last_user_msg_id]
+            if existing_msg.file_context:
+                doc_context = existing_msg.file_context
+                yield f"event: status\ndata: {json.dumps({'content': 'Reusing previous document analysis...'})}\n\n"
+                logger.info(f"♻️ Reusing existing file context for message {last_user_msg_id}")
+
+        doc_mode = (request.doc_mode or settings.DOC_CONTEXT_MODE).lower()
+        retrieval_mode = doc_mode == "retrieval"
+
+        if not doc_context and request.files and not retrieval_mode:
+            from app.services.file_service import FileParsingService, LLMExtractionService
+            from app.services.spreadsheet_service import is_spreadsheet
+            parsing_service = FileParsingService()
+            extraction_service = LLMExtractionService({
+                "model_id": request.model_id,
+                "api_key": request.api_key,
+                "base_url": request.base_url
+            })
+
+            # Charting needs the actual rows of a spreadsheet, not just its profile. Only spreadsheets
+            # depend on the routed intent, so other documents are parsed without waiting for it
+            keep_full_data = False
+            if routing_task and any(is_spreadsheet(f.get("name", "")) for f in request.files):
+                try:
+                    keep_full_data = await routing_task == "charts"
+                except Exception:
+                    pass  # reported where the routing decision is used
+
+            all_parsed_text = ""
+            for file_info in request.files:
+                file_info = await load_file(file_info)
+                filename = file_info.get("name", "document")
+                yield f"event: status\ndata: {json.dumps({'content': f'Parsing {filename}...'})}\n\n"
+                parsed_text = await parsing_service.parse_file(
+                    filename, file_info.get("data", ""),
+                    keep_full_data=keep_full_data,
+                    pdf_pages=request.pdf_pages,
+                    pdf_max_pages=request.pdf_max_pages
+                )
+                all_parsed_text += f"\n\n--- Document: {filename} ---\n{parsed_text}"
+
+            if all_parsed_text.strip():
+                yield f"event: status\ndata: {json.dumps({'content': 'Extracting core data from documents...'})}\n\n"
+
+                # Use dedicated events for document analysis to separate from tool flow
+                yield f"event: doc_analysis_start\ndata: {json.dumps({'session_id': session_id})}\n\n"
+
+                analysis_buffers = {}
+                chunks_finished = 0
+
+                # aclosing: if the client disconnects mid-extraction, the extraction generator
+                # is closed right away so its in-flight LLM tasks get cancelled.
+                async with aclosing(extraction_service.extract_and_summarize(
+                    all_parsed_text,
+                    concurrency=request.concurrency,
+                    status_callback=None,
+                    user_key=client_id
+                )) as extraction_stream:
+                    async for result in extraction_stream:
+                        for created_event in announce_user_message():
+                            yield created_event
+                        chunk_idx = result["index"]
+                        content = result.get("content", "")
+                        status = result.get("status", "running")
+
+                        # Initialize buffer if needed
+                        if chunk_idx not in analysis_buffers:
+                            analysis_buffers[chunk_idx] = ""
+
+                        if status == "queued":
+                            # Waiting for a slot in the shared extraction worker pool
+                            queue_status = f"Waiting for a document extraction worker (queue position {result['position']})..."
+                            yield f"event: status\ndata: {json.dumps({'content': queue_status})}\n\n"
+
+                        elif status == "running":
+                            analysis_buffers[chunk_idx] += content
+                            yield f"event: doc_analysis_chunk\ndata: {json.dumps({'content': content, 'index': chunk_idx, 'status': 'running', 'session_id': session_id})}\n\n"
+
+                        elif status in ["done", "error"]:
+                            # Final content for this block
+                            final_text = analysis_buffers[chunk_idx]
+
+                            if chunk_idx == -1:
+                                doc_context = final_text
+                                step_name = "doc_analysis_synthesis"
+                            else:
+                                step_name = f"doc_analysis_chunk_{chunk_idx}"
+
+                            # Deduplication: Check if we already have a step for this index
+                            existing_step = False
+                            for step in accumulated_steps:
+                                if step["type"] == "doc_analysis":
+                                    try:
+                                        content_json = json.loads(step["content"])
+                                        if content_json.get("index") == chunk_idx:
+                                            existing_step = True
+                                            break
+                                    except:
+                                        pass
+
+                            if not existing_step:
+                                accumulated_steps.append({
+                                    "type": "doc_analysis",
+                                    "name": step_name,
+                                    "content": json.dumps({"index": chunk_idx, "content": final_text}),
+                                    "status": "done",
+                                    "start_time": datetime.utcnow().timestamp(),
+                                    "end_time": datetime.utcnow().timestamp()
+                                })
+
+                            # Send final empty chunk to signal done state to frontend
+                            yield f"event: doc_analysis_chunk\ndata: {json.dumps({'content': '', 'index': chunk_idx, 'status': 'done', 'session_id': session_id})}\n\n"
+
+                            if chunk_idx != -1 and result.get("total"):
+                                chunks_finished += 1
+                                progress = f"Extracted {chunks_finished}/{result['total']} document chunks..."
+                                yield f"event: status\ndata: {json.dumps({'content': progress})}\n\n"
+
+                yield f"event: doc_analysis_end\ndata: {json.dumps({'content': doc_context, 'session_id': session_id})}\n\n"
+
+                yield f"event: status\ndata: {json.dumps({'content': 'Document processing complete.'})}\n\n"
+
+                # Persist newly generated context to the user message (together with the assistant message)
+                if doc_context:
+                    user_msg_update["file_context"] = doc_context
+
+        # 5b. Retrieval mode: select the most relevant chunks of every document in this branch
+        # (indexes are cached by file hash, so follow-up turns only cost an index query)
+        if retrieval_mode and not doc_context:
+            doc_files = list(request.files)
+            for msg in branch_messages:
+                if msg.role == "user" and msg.files:
+                    doc_files.extend(msg.files)
+
+            if doc_files:
+                from app.services.retrieval_service import RetrievalService
+                yield f"event: status\ndata: {json.dumps({'content': 'Retrieving relevant document sections...'})}\n\n"
+                yield f"event: doc_analysis_start\ndata: {json.dumps({'session_id': session_id})}\n\n"
+
+                retrieval_start = time.time()
+                doc_context = await RetrievalService().retrieve_context(
+                    doc_files,
+                    request.prompt,
+                    top_k=request.retrieval_top_k or settings.RETRIEVAL_TOP_K
+                )
+                logger.info(f"🔎 Retrieval took {(time.time() - retrieval_start) * 1000:.2f}ms over {len(doc_files)} file(s)")
+
+                if doc_context:
+                    accumulated_steps.append({
+                        "type": "doc_analysis",
+                        "name": "doc_analysis_retrieval",
+                        "content": json.dumps({"index": -1, "content": doc_context}),
+                        "status": "done",
+                        "start_time": retrieval_start,
+                        "end_time": time.time()
+                    })
+                yield f"event: doc_analysis_end\ndata: {json.dumps({'content': doc_context, 'session_id': session_id})}\n\n"
+
+                if doc_context and request.files:
+                    user_msg_update["file_context"] = doc_context
+
+        # The routing decision is held until the agent is about to receive the document context
+        if routing_task:
+            try:
+                routed_intent = await routing_task
+            except Exception as route_err:
+                logger.warning(f"Concurrent routing failed, falling back to in-graph routing: {route_err}")
+    finally:
+        if routing_task and not routing_task.done():
+            routing_task.cancel()
+
     # Current Message Construction (same as before)
     current_prompt = request.prompt
     if doc_context:
         current_prompt = f"Document Context:\n{doc_context}\n\nUser Question:\n{current_prompt}"
 
-    if request.images:
+    if request_images:
         content = [{"type": "text", "text": current_prompt}]
-        for image_data in request.images:
+        for image_data in request_images:
             content.append({
                 "type": "image_url",
                 "image_url": {"url": image_data}
@@ -436,32 +599,122 @@ async def event_generator(request: ChatRequest, db: AsyncSession) -> AsyncGenera
 
     # Combine
     full_messages = formatted_history + [message]
+    if resume_msg:
+        full_messages += [AIMessage(content=resume_msg.draft_output), HumanMessage(content=CONTINUE_PROMPT)]
 
     inputs = {
         "messages": full_messages,
-        "model_config": {
-            "model_id": request.model_id,
-            "api_key": request.api_key,
-            "base_url": request.base_url
-        } if (request.model_id or request.api_key or request.base_url) else None
+        "model_config": model_config
     }
+    if resume_msg and resume_msg.agent:
+        routed_intent = resume_msg.agent
+    if routed_intent:
+        # Router node will reuse this decision instead of classifying again
+        inputs["intent"] = routed_intent
 
     full_response_content = ""
     selected_agent = None
 
     # JSON streaming parser for new agent format
     json_parser = StreamingJsonParser()
+    # Artifact code is parsed as it streams in: Draw.io XML is repaired (and its DSL expanded) on
+    # the fly and every format sends throttled, renderable artifact_snapshot events
+    code_artifact = None
+    last_snapshot = ""
+    last_snapshot_time = 0.0
     design_concept_started = False
     code_started = False
 
     logger.info(f"🚀 Starting LLM stream with {len(full_messages)} messages, is_retry={request.is_retry}")
 
     assistant_msg_saved = False
+    # The resumed output is replayed through the parsers ahead of the continuation
+    resume_prefix = resume_msg.draft_output if resume_msg else ""
+
+    # Incremental checkpointing: the reply is upserted into one draft row through the write queue
+    draft_id = None
+    draft_write = None
+    last_checkpoint = time.monotonic()
+
+    def checkpoint(status: str, content: str, updates: dict | None = None) -> asyncio.Future:
+        steps = list(accumulated_steps)
+        agent = selected_agent
+        draft_output = full_response_content if status != MESSAGE_COMPLETE else None
+
+        async def write(chat: ChatService):
+            nonlocal draft_id
+            parent_id = (await user_write).id if user_write else last_user_msg_id
+            message = await chat.checkpoint_message(
+                draft_id, session_id, content,
+                steps=steps,
+                agent=agent,
+                parent_id=parent_id,
+                status=status,
+                draft_output=draft_output,
+                updates=updates
+            )
+            draft_id = message.id
+            return message
+
+        return writer.submit(write)
+
+    async def finish_drawio(code: str) -> tuple[str, str | None, list[str]]:
+        """
+        The final Draw.io XML: compact DSL is expanded, XML is repaired. Returns the XML, the DSL
+        source (kept on the tool_end step for follow-up edits) and the events of a diagnostics step.
+        Layout runs in a worker thread, off the event loop.
+        """
+        if is_drawio_dsl(code):
+            return await asyncio.to_thread(expand_drawio_dsl, code), code, []
+        repairer = code_artifact.repairer if isinstance(code_artifact, DrawioPartial) else None
+        if repairer is None or repairer.received != len(code):
+            repairer = DrawioRepairer()
+            repairer.feed(code)
+        result = repairer.finish()
+        if not result.diagnostics:
+            return result.xml, None, []
+        logger.info(f"🩹 Repaired Draw.io XML: {'; '.join(d['message'] for d in result.diagnostics)}")
+        accumulated_steps.append({
+            "type": "diagnostics",
+            "name": "drawio_repair",
+            "content": json.dumps(result.diagnostics),
+            "status": "done",
+            "timestamp": int(datetime.utcnow().timestamp() * 1000)
+        })
+        return result.xml, None, [f"event: diagnostics\ndata: {json.dumps({'diagnostics': result.diagnostics, 'session_id': session_id})}\n\n"]
+
+    async def artifact_snapshot_event() -> str | None:
+        """
+        An artifact_snapshot event if one is due and the renderable code has grown since the last.
+        Snapshots of flowcharts and Draw.io DSL are laid out, so they are taken in a worker thread.
+        """
+        nonlocal last_snapshot, last_snapshot_time
+        if not code_artifact or not settings.STREAM_SNAPSHOT_SECONDS:
+            return None
+        if time.monotonic() - last_snapshot_time < settings.STREAM_SNAPSHOT_SECONDS:
+            return None
+        last_snapshot_time = time.monotonic()
+        snapshot = await asyncio.to_thread(code_artifact.snapshot)
+        if not snapshot or snapshot == last_snapshot:
+            return None
+        last_snapshot = snapshot
+        return f"event: artifact_snapshot\ndata: {json.dumps({'content': snapshot, 'agent': selected_agent, 'session_id': session_id})}\n\n"
 
     try:
         try:
             # Stateless execution: No thread_id, so it runs fresh with provided history
             async for event in graph.astream_events(inputs, version="v1"):
+                for created_event in announce_user_message():
+                    yield created_event
+                if (
+                    settings.DRAFT_CHECKPOINT_SECONDS and full_response_content
+                    and (draft_write is None or draft_write.done())
+                    and time.monotonic() - last_checkpoint >= settings.DRAFT_CHECKPOINT_SECONDS
+                ):
+                    draft_write = checkpoint(MESSAGE_STREAMING, full_response_content if selected_agent == "general" else "")
+                    # Failures are logged by the queue; the next checkpoint simply tries again
+                    draft_write.add_done_callback(lambda f: f.cancelled() or f.exception())
+                    last_checkpoint = time.monotonic()
                 event_type = event["event"]
                 data = event["data"]
                 metadata = event.get("metadata", {})
@@ -501,6 +754,8 @@ async def event_generator(request: ChatRequest, db: AsyncSession) -> AsyncGenera
                     chunk = data.get("chunk")
                     if chunk:
                         content = chunk.content
+                        if content and resume_prefix:
+                            content, resume_prefix = resume_prefix + content, ""
                         if content:
                             full_response_content += content
 
@@ -535,6 +790,7 @@ async def event_generator(request: ChatRequest, db: AsyncSession) -> AsyncGenera
                                     elif evt_type == 'code_start':
                                         if not code_started:
                                             code_started = True
+                                            code_artifact = partial_artifact(selected_agent)
                                             # Signal start of code (equivalent to tool_start)
                                             accumulated_steps.append({
                                                 "type": "tool_start",
@@ -546,18 +802,31 @@ async def event_generator(request: ChatRequest, db: AsyncSession) -> AsyncGenera
                                             yield f"event: tool_start\ndata: {json.dumps({'tool': f'create_{selected_agent}', 'input': {}, 'session_id': session_id})}\n\n"
                                     elif evt_type == 'code':
                                         if evt_content:
+                                            if code_artifact:
+                                                code_artifact.feed(evt_content)
                                             yield f"event: tool_code\ndata: {json.dumps({'content': evt_content, 'session_id': session_id})}\n\n"
+                                            snapshot_event = await artifact_snapshot_event() if is_streaming else None
+                                            if snapshot_event:
+                                                yield snapshot_event
                                     elif evt_type == 'code_end':
                                         # Finalize tool_end with the complete code
                                         final_code = json_parser.code
+                                        source, repair_events = None, []
+                                        if selected_agent == 'drawio':
+                                            final_code, source, repair_events = await finish_drawio(final_code)
+                                        elif selected_agent == 'flowchart':
+                                            final_code = await asyncio.to_thread(layout_flow_code, final_code)
                                         accumulated_steps.append({
                                             "type": "tool_end",
                                             "name": f"create_{selected_agent}",
                                             "content": final_code,
+                                            **({"source": source} if source else {}),
                                             "status": "done",
                                             "timestamp": int(datetime.utcnow().timestamp() * 1000)
                                         })
                                         yield f"event: tool_end\ndata: {json.dumps({'output': final_code, 'session_id': session_id})}\n\n"
+                                        for repair_event in repair_events:
+                                            yield repair_event
                             else:
                                 # For general agent, just stream as thought
                                 yield f"event: thought\ndata: {json.dumps({'content': content, 'session_id': session_id})}\n\n"
@@ -591,6 +860,7 @@ async def event_generator(request: ChatRequest, db: AsyncSession) -> AsyncGenera
                     elif evt_type == 'code_start':
                         if not code_started:
                             code_started = True
+                            code_artifact = partial_artifact(selected_agent)
                             accumulated_steps.append({
                                 "type": "tool_start",
                                 "name": f"create_{selected_agent}",
@@ -600,20 +870,27 @@ async def event_generator(request: ChatRequest, db: AsyncSession) -> AsyncGenera
                             })
                             yield f"event: tool_start\ndata: {json.dumps({'tool': f'create_{selected_agent}', 'input': {}, 'session_id': session_id})}\n\n"
                     elif evt_type == 'code' and evt_content:
+                        if code_artifact:
+                            code_artifact.feed(evt_content)
                         yield f"event: tool_code\ndata: {json.dumps({'content': evt_content, 'session_id': session_id})}\n\n"
                     elif evt_type == 'code_end':
                         final_code = json_parser.code
-                        # Sanitize Draw.io XML to remove invalid <Array> elements
+                        source, repair_events = None, []
                         if selected_agent == 'drawio':
-                            final_code = sanitize_drawio_xml(final_code)
+                            final_code, source, repair_events = await finish_drawio(final_code)
+                        elif selected_agent == 'flowchart':
+                            final_code = await asyncio.to_thread(layout_flow_code, final_code)
                         accumulated_steps.append({
                             "type": "tool_end",
                             "name": f"create_{selected_agent}",
                             "content": final_code,
+                            **({"source": source} if source else {}),
                             "status": "done",
                             "timestamp": int(datetime.utcnow().timestamp() * 1000)
                         })
                         yield f"event: tool_end\ndata: {json.dumps({'output': final_code, 'session_id': session_id})}\n\n"
+                        for repair_event in repair_events:
+                            yield repair_event
 
                 # Fallback: If parser didn't extract properly, try full extraction
                 if not json_parser.code and full_response_content:
@@ -627,78 +904,193 @@ async def event_generator(request: ChatRequest, db: AsyncSession) -> AsyncGenera
                                 "status": "done",
                                 "timestamp": int(datetime.utcnow().timestamp() * 1000)
                             })
-                        # Sanitize Draw.io XML to remove invalid <Array> elements
+                        source, repair_events = None, []
                         if selected_agent == 'drawio':
-                            code = sanitize_drawio_xml(code)
+                            code, source, repair_events = await finish_drawio(code)
+                        elif selected_agent == 'flowchart':
+                            code = await asyncio.to_thread(layout_flow_code, code)
                         accumulated_steps.append({
                             "type": "tool_end",
                             "name": f"create_{selected_agent}",
                             "content": code,
+                            **({"source": source} if source else {}),
                             "status": "done",
                             "timestamp": int(datetime.utcnow().timestamp() * 1000)
                         })
                         yield f"event: tool_end\ndata: {json.dumps({'output': code, 'session_id': session_id})}\n\n"
+                        for repair_event in repair_events:
+                            yield repair_event
+
+            # The assistant row needs the user message id, and its event must follow the user's
+            if user_write:
+                await user_write
+            for created_event in announce_user_message():
+                yield created_event
 
             # 4. Save Assistant Message (Normal completion)
             if full_response_content or accumulated_steps:
                 # For general agent, save full_response_content; for other agents, content is in steps
                 content_to_save = full_response_content if selected_agent == "general" else ""
-                assistant_msg = await chat_service.add_message(
-                    session_id, "assistant",
-                    content_to_save,
-                    steps=accumulated_steps,
-                    agent=selected_agent,
-                    parent_id=last_user_msg_id
+                assistant_msg = await checkpoint(
+                    MESSAGE_COMPLETE, content_to_save,
+                    updates={last_user_msg_id: user_msg_update} if user_msg_update else None
                 )
                 assistant_msg_saved = True
                 yield f"event: message_created\ndata: {json.dumps({'id': assistant_msg.id, 'role': 'assistant', 'turn_index': assistant_msg.turn_index, 'session_id': session_id})}\n\n"
 
         finally:
-            import asyncio
+            if not assistant_msg_saved and user_write:
+                # The stream ended early; the queued user insert still completes in the background
+                try:
+                    last_user_msg_id = (await asyncio.shield(user_write)).id
+                except Exception:
+                    last_user_msg_id = None
+            pending_updates = {last_user_msg_id: user_msg_update} if user_msg_update else None
+            can_save = not assistant_msg_saved and last_user_msg_id
+
             # Robust Persistence: Ensure partial data is saved if connection was aborted
-            if not assistant_msg_saved and (full_response_content or accumulated_steps):
+            if can_save and (full_response_content or accumulated_steps):
                 error_marker = "\n\n[Generation stopped by user/connection lost]"
                 try:
                     # Use asyncio.shield to prevent the save operation from being cancelled
-                    await asyncio.shield(chat_service.add_message(
-                        session_id, "assistant",
-                        error_marker,
-                        steps=accumulated_steps,
-                        agent=selected_agent,
-                        parent_id=last_user_msg_id
-                    ))
+                    # The draft row keeps the raw output, so the reply can be resumed later
+                    await asyncio.shield(checkpoint(MESSAGE_INTERRUPTED, error_marker, updates=pending_updates))
                     logger.info(f"💾 Robust Persistence: Saved partial assistant message for session {session_id}")
                 except Exception as save_err:
                     logger.error(f"Failed to save partial message: {save_err}")
+            elif can_save and pending_updates:
+                try:
+                    await asyncio.shield(writer.submit(lambda chat: chat.update_messages(pending_updates)))
+                except Exception as save_err:
+                    logger.error(f"Failed to save document context: {save_err}")
 
     except Exception as e:
         import traceback
         error_msg = str(e)
         logger.error(f"Error in chat stream: {error_msg}")
         logger.error(traceback.format_exc())
+        # The user row exists even when the LLM call fails; the client needs its id before the
+        # error (Retry sends it back as parent_id). The finally above has already awaited it.
+        try:
+            for created_event in announce_user_message():
+                yield created_event
+        except Exception as insert_err:
+            logger.error(f"Failed to save user message: {insert_err}")
         yield f"event: error\ndata: {json.dumps({'message': error_msg})}\n\n"
 
+TRUSTED_PROXY_NETWORKS = [ipaddress.ip_network(proxy, strict=False) for proxy in settings.TRUSTED_PROXIES]
+
+
+def is_trusted_proxy(address: str) -> bool:
+    try:
+        ip = ipaddress.ip_address(address)
+    except ValueError:
+        return False
+    return any(ip in network for network in TRUSTED_PROXY_NETWORKS)
+
+
+def get_client_id(http_request: Request) -> str:
+    """
+    Best-effort client identity for fair scheduling (no auth): the peer IP, or behind a trusted
+    proxy the nearest X-Forwarded-For hop that isn't one (hops further left are client-supplied).
+    """
+    peer = http_request.client.host if http_request.client else None
+    forwarded = http_request.headers.get("x-forwarded-for")
+    if forwarded and peer and is_trusted_proxy(peer):
+        for address in reversed([hop.strip() for hop in forwarded.split(",")]):
+            if address and not is_trusted_proxy(address):
+                return address
+    return peer or "anonymous"
+
 @router.post("/chat/completions")
-async def chat_completions(request: ChatRequest, db: AsyncSession = Depends(get_session)):
+async def chat_completions(request: ChatRequest, http_request: Request):
+
+    return StreamingResponse(event_generator(request, get_client_id(http_request)), media_type="text/event-stream")
 
-    return StreamingResponse(event_generator(request, db), media_type="text/event-stream")
+@router.get("/metrics/db")
+async def db_metrics(top: int = Query(20, ge=1, le=500)):
+    """Pool saturation plus per-query-shape timing histograms (the `top` shapes by total time)."""
+    return {
+        "pool": pool_metrics.snapshot(),
+        "queries": query_metrics.snapshot(top),
+    }
 
 @router.get("/sessions")
-async def list_sessions(db: AsyncSession = Depends(get_session)):
+async def list_sessions(
+    limit: int = Query(30, ge=1, le=200),
+    cursor: str | None = None,
+    db: AsyncSession = Depends(get_session)
+):
+    """Sessions, most recently updated first. Pass `next_cursor` back as `cursor` for the next page."""
     chat_service = ChatService(db)
-    sessions = await chat_service.get_all_sessions()
-    return sessions
+    try:
+        sessions, next_cursor = await chat_service.get_sessions_page(limit, cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"items": sessions, "next_cursor": next_cursor}
+
+@router.get("/search")
+async def search(
+    q: str = Query(..., min_length=1, max_length=200),
+    limit: int = Query(20, ge=1, le=100),
+    cursor: str | None = None,
+    db: AsyncSession = Depends(get_session)
+):
+    """
+    Ranked full-text search over session titles, prompts, design concepts and diagram labels.
+    Each hit names its session and message (none for titles) with a <mark>-highlighted snippet.
+    """
+    if cursor is not None and not cursor.isdigit():
+        raise HTTPException(status_code=400, detail=f"Invalid cursor: {cursor!r}")
+    hits, next_offset = await SearchService(db).search(q, limit, int(cursor or 0))
+    return {"items": hits, "next_cursor": str(next_offset) if next_offset is not None else None}
 
 @router.get("/sessions/{session_id}")
-async def get_session_history(session_id: int, db: AsyncSession = Depends(get_session)):
+async def get_session_history(session_id: int, request: Request, db: AsyncSession = Depends(get_session)):
+    """
+    Full history of a session, served from its gzip'd snapshot (see SessionSnapshotService):
+    revalidates with ETag / If-None-Match and is sent compressed to clients that accept gzip.
+    """
+    snapshots = SessionSnapshotService(db)
+    snapshot = await snapshots.get(session_id)
+    if snapshot is None:
+        await ArchiveService(db).restore_if_archived(session_id)
+        snapshot = await snapshots.build(session_id)
+
+    etag = f'"{snapshot.etag}"'
+    headers = {"ETag": etag, "Cache-Control": "no-cache", "Vary": "Accept-Encoding"}
+    if_none_match = request.headers.get("if-none-match", "")
+    if etag in [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]:
+        return Response(status_code=304, headers=headers)
+    if "gzip" in request.headers.get("accept-encoding", ""):
+        return Response(content=snapshot.data, media_type="application/json", headers={**headers, "Content-Encoding": "gzip"})
+    return Response(content=gzip.decompress(snapshot.data), media_type="application/json", headers=headers)
+
+@router.get("/sessions/{session_id}/messages")
+async def list_session_messages(
+    session_id: int,
+    limit: int = Query(100, ge=1, le=500),
+    cursor: str | None = None,
+    db: AsyncSession = Depends(get_session)
+):
+    """Lightweight, paginated history: no steps/images/files (see GET /messages/{id})."""
+    if not cursor:
+        await ArchiveService(db).restore_if_archived(session_id)
     chat_service = ChatService(db)
-    history = await chat_service.get_history(session_id)
-    session = await chat_service.get_session(session_id)
-
-    return {
-        "messages": history,
-        "session": session
-    }
+    try:
+        messages, next_cursor = await chat_service.get_messages_page(session_id, limit, cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"items": messages, "next_cursor": next_cursor}
+
+@router.get("/messages/{message_id}")
+async def get_message(message_id: int, db: AsyncSession = Depends(get_session)):
+    """Full message including steps (diagram code), images, files and document context."""
+    chat_service = ChatService(db)
+    message = await chat_service.get_message(message_id)
+    if not message:
+        raise HTTPException(status_code=404, detail="Message not found")
+    return message
 
 @router.delete("/sessions/{session_id}")
 async def delete_session(session_id: int, db: AsyncSession = Depends(get_session)):
@@ -707,6 +1099,63 @@ async def delete_session(session_id: int, db: AsyncSession = Depends(get_session
     return {"status": "success"}
 
 
+def parse_range(range_header: str, size: int) -> tuple[int, int] | None:
+    """Parses a single "bytes=start-end" range into a half-open [start, end) span; None if unsatisfiable."""
+    match = re.fullmatch(r"bytes=(\d*)-(\d*)", range_header.strip())
+    if not match or not (match.group(1) or match.group(2)):
+        return None
+    if match.group(1):
+        start = int(match.group(1))
+        end = int(match.group(2)) + 1 if match.group(2) else size
+    else:
+        # Suffix range: the last N bytes
+        start, end = max(size - int(match.group(2)), 0), size
+    end = min(end, size)
+    if start >= end:
+        return None
+    return start, end
+
+
+@router.get("/blobs/{digest}")
+async def get_blob(digest: str, request: Request):
+    """Serves a stored image/file. Blobs are immutable, so the digest is a strong ETag."""
+    store = get_blob_store()
+    info = await store.stat(digest)
+    if not info:
+        raise HTTPException(status_code=404, detail="Blob not found")
+
+    etag = f'"{digest}"'
+    headers = {
+        "ETag": etag,
+        "Cache-Control": "public, max-age=31536000, immutable",
+        "Accept-Ranges": "bytes",
+        "X-Content-Type-Options": "nosniff",
+    }
+    # Only raster images render in the browser; everything else is an opaque download
+    media_type = info.content_type if info.inline else DEFAULT_CONTENT_TYPE
+    if not info.inline:
+        headers["Content-Disposition"] = "attachment"
+    if_none_match = request.headers.get("if-none-match", "")
+    if etag in [tag.strip() for tag in if_none_match.split(",")] or if_none_match.strip() == "*":
+        return Response(status_code=304, headers=headers)
+
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if range_header and (not if_range or if_range.strip() == etag):
+        span = parse_range(range_header, info.size)
+        if span is None:
+            return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{info.size}"})
+        start, end = span
+        data = await store.read(digest, start, end)
+        headers["Content-Range"] = f"bytes {start}-{end - 1}/{info.size}"
+        return Response(content=data, status_code=206, media_type=media_type, headers=headers)
+
+    data = await store.read(digest)
+    if data is None:
+        raise HTTPException(status_code=404, detail="Blob not found")
+    return Response(content=data, media_type=media_type, headers=headers)
+
+
 class TestModelRequest(BaseModel):
     model_id: str
     api_key: str
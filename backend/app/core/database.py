@@ -1,22 +1,117 @@
+import os
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict
+from sqlalchemy import event, inspect
+from sqlalchemy.engine import make_url
 from sqlmodel import SQLModel, create_engine
 from sqlmodel.ext.asyncio.session import AsyncSession
-from sqlalchemy.ext.asyncio import create_async_engine
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine, async_sessionmaker
 from app.core.config import settings
+from app.core.db_metrics import PoolMetrics, QueryMetrics
+import app.models.chat  # registers the tables on SQLModel.metadata (also for the migrations CLI)
 
-engine = create_async_engine(settings.DATABASE_URL, echo=True, future=True)
 
-from app.core.migrations import run_migrations
+def engine_options(url: str) -> Dict[str, Any]:
+    """Engine keyword arguments from Settings (pool options only apply to pooled server databases)."""
+    options: Dict[str, Any] = {"echo": settings.DB_ECHO, "future": True}
+    if url.startswith("sqlite"):
+        # Seconds a writer waits for the database lock before failing with "database is locked"
+        options["connect_args"] = {"timeout": settings.DB_COMMAND_TIMEOUT}
+        return options
 
-async def init_db():
-    async with engine.begin() as conn:
+    options.update(
+        pool_size=settings.DB_POOL_SIZE,
+        max_overflow=settings.DB_MAX_OVERFLOW,
+        pool_timeout=settings.DB_POOL_TIMEOUT,
+        pool_recycle=settings.DB_POOL_RECYCLE,
+        pool_pre_ping=settings.DB_POOL_PRE_PING,
+    )
+    if "+asyncpg" in url:
+        options["connect_args"] = {
+            # SQLAlchemy's per-connection prepared statement LRU and asyncpg's own statement cache;
+            # set DB_STATEMENT_CACHE_SIZE=0 behind PgBouncer in transaction mode
+            "prepared_statement_cache_size": settings.DB_STATEMENT_CACHE_SIZE,
+            "statement_cache_size": settings.DB_STATEMENT_CACHE_SIZE,
+            "command_timeout": settings.DB_COMMAND_TIMEOUT,
+        }
+    return options
+
+
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    """WAL lets readers run alongside the single writer; SQLite leaves foreign keys off by default."""
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute("PRAGMA foreign_keys=ON")
+    cursor.close()
+
+
+def create_db_engine(url: str) -> AsyncEngine:
+    """Async engine for Postgres (asyncpg) or SQLite (aiosqlite, single node)."""
+    if url.startswith("sqlite"):
+        database = make_url(url).database
+        if database and database != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(database)), exist_ok=True)
+    db_engine = create_async_engine(url, **engine_options(url))
+    if db_engine.dialect.name == "sqlite":
+        event.listen(db_engine.sync_engine, "connect", set_sqlite_pragmas)
+    return db_engine
+
+
+engine = create_db_engine(settings.DATABASE_URL)
+
+# Created once; every request / unit of work takes its own short-lived session from it
+async_session_factory = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+
+from app.core.migrations import acquire_migration_lock, check_migrations, run_migrations
+
+
+pool_metrics = PoolMetrics(engine.sync_engine.pool)
+event.listen(engine.sync_engine.pool, "checkout", pool_metrics.on_checkout)
+event.listen(engine.sync_engine.pool, "checkin", pool_metrics.on_checkin)
+
+query_metrics = QueryMetrics(slow_query_ms=settings.DB_SLOW_QUERY_MS)
+event.listen(engine.sync_engine, "before_cursor_execute", query_metrics.before_execute)
+event.listen(engine.sync_engine, "after_cursor_execute", query_metrics.after_execute)
+event.listen(engine.sync_engine, "handle_error", query_metrics.on_error)
+
+
+async def migrate(bind: AsyncEngine | None = None):
+    """Creates tables and applies pending migrations, one process at a time."""
+    async with (bind or engine).begin() as conn:
+        await acquire_migration_lock(conn)
+        existing = await conn.run_sync(lambda sync_conn: set(inspect(sync_conn).get_table_names()))
+        fresh = "chatmessage" not in existing
         # await conn.run_sync(SQLModel.metadata.drop_all)
         await conn.run_sync(SQLModel.metadata.create_all)
-        await run_migrations(conn)
+        # A schema created from the current models already contains what the migrations add
+        await run_migrations(conn, baseline=fresh)
+        if not fresh and "searchdocument" not in existing:
+            await backfill_search_index(conn)
+
+
+async def backfill_search_index(conn):
+    """Indexes the history of a database that predates full-text search (once, under the migration lock)."""
+    from app.services.search_service import SearchService
+
+    print("--- Building the search index for existing sessions ---")
+    async with AsyncSession(bind=conn) as db:
+        await SearchService(db).backfill()
+
+async def init_db():
+    if settings.DB_MIGRATE_ON_STARTUP:
+        await migrate()
+        return
+    # Schema is managed by `python -m app.core.migrations`; workers only check it is current
+    async with engine.connect() as conn:
+        await check_migrations(conn)
 
 async def get_session() -> AsyncSession:
-    async_session = sessionmaker(
-        engine, class_=AsyncSession, expire_on_commit=False
-    )
-    async with async_session() as session:
+    async with async_session_factory() as session:
+        yield session
+
+@asynccontextmanager
+async def session_scope() -> AsyncIterator[AsyncSession]:
+    """Short unit of work: the pooled connection goes back to the pool when the block exits."""
+    async with async_session_factory() as session:
         yield session
@@ -0,0 +1,181 @@
+import bisect
+import re
+import time
+from collections import OrderedDict
+from app.core.logger import logger
+
+# Upper bounds (ms) of the query timing histogram buckets; the last bucket is open-ended
+LATENCY_BUCKETS_MS = [1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000]
+
+# Literals inlined in raw SQL become placeholders, so they group with the bound form of the query
+LITERAL = re.compile(r"'(?:[^']|'')*'|(?<![\w$:])\d+(?:\.\d+)?\b")
+# Expanded IN lists / VALUES rows produce a different statement per length; collapse them
+_PLACEHOLDER = r"(?:\$\d+|\?|%\(\w+\)s|:\w+)(?:::[\w ]+?)?"
+PLACEHOLDER_LIST = re.compile(rf"\(\s*{_PLACEHOLDER}(?:\s*,\s*{_PLACEHOLDER})*\s*\)")
+WHITESPACE = re.compile(r"\s+")
+
+
+def query_shape(statement: str) -> str:
+    """Normalizes a parameterized SQL statement so executions of the same query share one key."""
+    shape = WHITESPACE.sub(" ", LITERAL.sub("?", statement)).strip()
+    return PLACEHOLDER_LIST.sub("(...)", shape)
+
+
+class PoolMetrics:
+    """
+    Tracks connection pool usage through pool checkout/checkin events: connections in use,
+    the peak, how often a checkout found the pool at capacity, and how long connections are held.
+    """
+
+    # Connections held longer than this are logged (usually a session kept open across slow work)
+    LONG_HOLD_SECONDS = 5.0
+    SATURATION_WARNING = 0.8
+
+    def __init__(self, pool):
+        self.pool = pool
+        self.checkouts = 0
+        self.in_use = 0
+        self.peak_in_use = 0
+        self.saturated_checkouts = 0
+        self.total_hold_seconds = 0.0
+        self.max_hold_seconds = 0.0
+        self.long_holds = 0
+        self._checked_out_at = {}
+
+    @property
+    def capacity(self) -> int | None:
+        size = getattr(self.pool, "size", None)
+        overflow = getattr(self.pool, "_max_overflow", 0)
+        if not callable(size):
+            return None
+        return size() + max(overflow, 0)
+
+    def on_checkout(self, dbapi_conn, record, proxy):
+        self.checkouts += 1
+        self.in_use += 1
+        self.peak_in_use = max(self.peak_in_use, self.in_use)
+        self._checked_out_at[id(record)] = time.monotonic()
+
+        capacity = self.capacity
+        if capacity:
+            if self.in_use >= capacity:
+                self.saturated_checkouts += 1
+            # Warn once per crossing of the threshold, not on every checkout above it
+            if self.in_use - 1 < capacity * self.SATURATION_WARNING <= self.in_use:
+                logger.warning(f"⚠️ DB pool near saturation: {self.in_use}/{capacity} connections in use")
+
+    def on_checkin(self, dbapi_conn, record):
+        started = self._checked_out_at.pop(id(record), None)
+        if started is None:
+            return
+        self.in_use -= 1
+        held = time.monotonic() - started
+        self.total_hold_seconds += held
+        self.max_hold_seconds = max(self.max_hold_seconds, held)
+        if held > self.LONG_HOLD_SECONDS:
+            self.long_holds += 1
+            logger.warning(f"⚠️ DB connection held for {held:.1f}s")
+
+    def snapshot(self) -> dict:
+        returned = self.checkouts - self.in_use
+        return {
+            "capacity": self.capacity,
+            "in_use": self.in_use,
+            "peak_in_use": self.peak_in_use,
+            "checkouts": self.checkouts,
+            "saturated_checkouts": self.saturated_checkouts,
+            "avg_hold_ms": round(self.total_hold_seconds / returned * 1000, 2) if returned else None,
+            "max_hold_ms": round(self.max_hold_seconds * 1000, 2),
+            "long_holds": self.long_holds,
+            "pool_status": self.pool.status(),
+        }
+
+
+class QueryShapeStats:
+    __slots__ = ("count", "total_ms", "max_ms", "buckets")
+
+    def __init__(self):
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.buckets = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+
+    def add(self, elapsed_ms: float):
+        self.count += 1
+        self.total_ms += elapsed_ms
+        self.max_ms = max(self.max_ms, elapsed_ms)
+        self.buckets[bisect.bisect_left(LATENCY_BUCKETS_MS, elapsed_ms)] += 1
+
+    def percentile(self, p: float) -> float | None:
+        """Upper bound of the bucket holding the p-th percentile (None if it's the open bucket)."""
+        target = p * self.count
+        seen = 0
+        for i, n in enumerate(self.buckets):
+            seen += n
+            if seen >= target and n:
+                return LATENCY_BUCKETS_MS[i] if i < len(LATENCY_BUCKETS_MS) else None
+        return None
+
+
+class QueryMetrics:
+    """
+    Times every statement through cursor execute events and keeps a latency histogram per
+    query shape. Statements slower than the threshold are logged with their shape.
+    """
+
+    def __init__(self, slow_query_ms: float, max_shapes: int = 500):
+        self.slow_query_ms = slow_query_ms
+        self.max_shapes = max_shapes
+        self.slow_queries = 0
+        self.shapes: "OrderedDict[str, QueryShapeStats]" = OrderedDict()
+
+    def before_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    def after_execute(self, conn, cursor, statement, parameters, context, executemany):
+        starts = conn.info.get("query_start")
+        if not starts:
+            return
+        elapsed_ms = (time.perf_counter() - starts.pop()) * 1000
+        shape = query_shape(statement)
+
+        stats = self.shapes.get(shape)
+        if stats is not None:
+            self.shapes.move_to_end(shape)
+        else:
+            stats = self.shapes[shape] = QueryShapeStats()
+            # Bound memory if something generates unbounded distinct statements
+            while len(self.shapes) > self.max_shapes:
+                self.shapes.popitem(last=False)
+        stats.add(elapsed_ms)
+
+        if self.slow_query_ms and elapsed_ms >= self.slow_query_ms:
+            self.slow_queries += 1
+            logger.warning(f"🐢 Slow query ({elapsed_ms:.1f}ms): {shape[:500]}")
+
+    def on_error(self, context):
+        # The statement failed, so after_execute won't run: drop its start time
+        starts = context.connection.info.get("query_start") if context.connection is not None else None
+        if starts:
+            starts.pop()
+
+    def snapshot(self, top: int = 20) -> dict:
+        ranked = sorted(self.shapes.items(), key=lambda item: item[1].total_ms, reverse=True)[:top]
+        return {
+            "slow_query_ms": self.slow_query_ms,
+            "slow_queries": self.slow_queries,
+            "histogram_buckets_ms": LATENCY_BUCKETS_MS,
+            "shapes": [
+                {
+                    "query": shape,
+                    "count": stats.count,
+                    "total_ms": round(stats.total_ms, 2),
+                    "avg_ms": round(stats.total_ms / stats.count, 3),
+                    "max_ms": round(stats.max_ms, 2),
+                    "p50_ms": stats.percentile(0.5),
+                    "p95_ms": stats.percentile(0.95),
+                    "histogram": stats.buckets,
+                }
+                for shape, stats in ranked
+            ],
+        }
@@ -1,61 +1,183 @@
 import os
+import re
 import glob
+import hashlib
 from sqlmodel import text
 from sqlalchemy.ext.asyncio import AsyncConnection
 
-async def run_migrations(conn: AsyncConnection):
-    """
-    Automatically discovers and runs SQL migrations from the migrations/ directory.
-    Uses a 'schema_migrations' table to track which migrations have already been applied.
-    """
-    print("--- Checking for Database Migrations ---")
-    
-    # 1. Create migration tracking table if it doesn't exist
-    await conn.execute(text("""
+# Resolved from the package, so the CLI and the app find it regardless of the working directory
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "migrations")
+
+# Key of the Postgres advisory lock that serializes schema changes across workers and replicas
+MIGRATION_LOCK_ID = 724_310_551
+
+# NNN_name.sql is the Postgres migration; NNN_name.sqlite.sql, if present, replaces it on SQLite
+DIALECT_VARIANT = re.compile(r"\.(postgresql|sqlite)\.sql$")
+
+TRACKING_TABLE_DDL = {
+    "postgresql": """
         CREATE TABLE IF NOT EXISTS schema_migrations (
             id SERIAL PRIMARY KEY,
             filename VARCHAR(255) UNIQUE NOT NULL,
             applied_at TIMESTAMP WITHOUT TIME ZONE DEFAULT (now() at time zone 'utc')
         )
-    """))
-    
+    """,
+    "sqlite": """
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            filename VARCHAR(255) UNIQUE NOT NULL,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            checksum VARCHAR(64)
+        )
+    """,
+}
+
+
+class MigrationError(RuntimeError):
+    pass
+
+
+def migration_path(filename: str, dialect: str) -> str:
+    """The dialect's variant of a migration if there is one, otherwise the shared file."""
+    variant = os.path.join(MIGRATIONS_DIR, f"{filename[:-len('.sql')]}.{dialect}.sql")
+    return variant if os.path.exists(variant) else os.path.join(MIGRATIONS_DIR, filename)
+
+
+def migration_files(dialect: str = "postgresql") -> dict[str, str]:
+    """filename -> sha256 of the SQL that runs on this dialect, in apply order."""
+    files = {}
+    for sql_path in sorted(glob.glob(os.path.join(MIGRATIONS_DIR, "*.sql"))):
+        filename = os.path.basename(sql_path)
+        if DIALECT_VARIANT.search(filename):
+            continue
+        with open(migration_path(filename, dialect), "rb") as f:
+            files[filename] = hashlib.sha256(f.read()).hexdigest()
+    return files
+
+
+async def acquire_migration_lock(conn: AsyncConnection):
+    """
+    Blocks until this transaction holds the migration lock (released at commit/rollback).
+    Other processes starting at the same time wait here, then find nothing left to apply.
+    """
+    if conn.dialect.name == "postgresql":
+        await conn.execute(text("SELECT pg_advisory_xact_lock(:lock_id)"), {"lock_id": MIGRATION_LOCK_ID})
+
+
+async def applied_migrations(conn: AsyncConnection) -> dict[str, str | None]:
+    result = await conn.execute(text("SELECT filename, checksum FROM schema_migrations"))
+    return {row[0]: row[1] for row in result.fetchall()}
+
+
+def verify_checksums(files: dict[str, str], applied: dict[str, str | None]) -> list[str]:
+    """Raises if an applied migration file was edited afterwards; returns legacy rows without a checksum."""
+    unrecorded = []
+    for filename, checksum in applied.items():
+        if filename not in files:
+            continue
+        if checksum is None:
+            unrecorded.append(filename)
+        elif checksum != files[filename]:
+            raise MigrationError(
+                f"Migration {filename} was modified after it was applied "
+                f"(recorded {checksum[:12]}, file {files[filename][:12]}). Add a new migration instead."
+            )
+    return unrecorded
+
+
+async def run_migrations(conn: AsyncConnection, baseline: bool = False):
+    """
+    Automatically discovers and runs SQL migrations from the migrations/ directory.
+    Uses a 'schema_migrations' table to track which migrations have already been applied,
+    with the sha256 of each file so edits to applied migrations are detected.
+    Call with the migration lock held (see acquire_migration_lock).
+
+    With baseline=True (the schema was just created from the models) every migration is recorded
+    as applied without running it, so schema changes must also be declared on the models.
+    """
+    print("--- Checking for Database Migrations ---")
+    dialect = conn.dialect.name
+
+    # 1. Create migration tracking table if it doesn't exist
+    await conn.execute(text(TRACKING_TABLE_DDL[dialect]))
+    if dialect == "postgresql":
+        await conn.execute(text("ALTER TABLE schema_migrations ADD COLUMN IF NOT EXISTS checksum VARCHAR(64)"))
+
     # 2. Find all .sql files in the migrations directory
-    migration_dir = os.path.join(os.getcwd(), "migrations")
-    if not os.path.exists(migration_dir):
-        print(f"Migration directory not found at {migration_dir}. Skipping.")
+    if not os.path.exists(MIGRATIONS_DIR):
+        print(f"Migration directory not found at {MIGRATIONS_DIR}. Skipping.")
         return
 
-    sql_files = sorted(glob.glob(os.path.join(migration_dir, "*.sql")))
-    
-    # 3. Get applied migrations
-    result = await conn.execute(text("SELECT filename FROM schema_migrations"))
-    applied_files = {row[0] for row in result.fetchall()}
-    
+    files = migration_files(dialect)
+
+    # 3. Get applied migrations and verify they are unchanged
+    applied = await applied_migrations(conn)
+    for filename in verify_checksums(files, applied):
+        # Applied before checksums were recorded: trust the current file
+        await conn.execute(
+            text("UPDATE schema_migrations SET checksum = :checksum WHERE filename = :filename"),
+            {"checksum": files[filename], "filename": filename}
+        )
+
     # 4. Apply pending migrations
-    for sql_path in sql_files:
-        filename = os.path.basename(sql_path)
-        if filename not in applied_files:
-            print(f"Applying migration: {filename}")
+    for filename, checksum in files.items():
+        if filename not in applied:
+            print(f"{'Recording' if baseline else 'Applying'} migration: {filename}")
             try:
-                with open(sql_path, "r") as f:
+                with open(migration_path(filename, dialect), "r") as f:
                     content = f.read()
-                    if content.strip():
-                        # Split by semicolon if there are multiple statements, 
+                    if content.strip() and not baseline:
+                        # Split by semicolon if there are multiple statements,
                         # but simple DO blocks or single statements work fine.
                         await conn.execute(text(content))
-                
+
                 # Record success
                 await conn.execute(
-                    text("INSERT INTO schema_migrations (filename) VALUES (:filename)"),
-                    {"filename": filename}
+                    text("INSERT INTO schema_migrations (filename, checksum) VALUES (:filename, :checksum)"),
+                    {"filename": filename, "checksum": checksum}
                 )
                 print(f"Successfully applied {filename}")
             except Exception as e:
                 print(f"Error applying migration {filename}: {e}")
                 # We break to avoid applying subsequent migrations out of order
                 break
-        else:
-            # print(f"Migration {filename} already applied.")
-            pass
-            
+
     print("--- Database Migration Check Complete ---")
+
+
+async def check_migrations(conn: AsyncConnection) -> list[str]:
+    """
+    Read-only startup check for workers that don't run DDL: one query, no locks.
+    Returns the pending migrations (and logs them); raises on modified applied migrations.
+    """
+    from app.core.logger import logger
+
+    files = migration_files(conn.dialect.name)
+    try:
+        applied = await applied_migrations(conn)
+    except Exception as e:
+        logger.warning(f"⚠️ Could not read schema_migrations ({e}); run `python -m app.core.migrations`")
+        return list(files)
+    verify_checksums(files, applied)
+    pending = [filename for filename in files if filename not in applied]
+    if pending:
+        logger.warning(f"⚠️ {len(pending)} pending migration(s): {', '.join(pending)}; run `python -m app.core.migrations`")
+    return pending
+
+
+def main():
+    """Migrations-only entry point: `python -m app.core.migrations` (run once per deploy)."""
+    import asyncio
+    from app.core.database import engine, migrate
+
+    async def run():
+        try:
+            await migrate()
+        finally:
+            await engine.dispose()
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    main()
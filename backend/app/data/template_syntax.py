@@ -448,6 +448,42 @@ TEMPLATE_SELECTION_GUIDE = {
 }
 
 
+# Words and phrases (English and Chinese) that point to a TEMPLATE_SELECTION_GUIDE use case,
+# for the local template selector (app/services/template_selector.py)
+USE_CASE_KEYWORDS = {
+    "process_flow": ["process", "workflow", "procedure", "pipeline", "how it works", "lifecycle", "流程", "过程", "工作流", "生命周期"],
+    "comparison": ["compare", "comparison", "versus", "vs", "pros", "cons", "pros and cons", "difference", "trade off", "strengths", "weaknesses", "对比", "比较", "优缺点", "优劣", "区别", "差异"],
+    "data_chart": ["data", "statistics", "stats", "percent", "percentage", "share", "revenue", "sales", "market share", "growth rate", "distribution", "survey", "数据", "统计", "占比", "百分比", "收入", "销售", "份额", "分布", "调查"],
+    "feature_list": ["features", "benefits", "list", "items", "tips", "advantages", "key points", "checklist", "principles", "best practices", "特点", "功能", "特性", "优势", "列表", "要点", "清单", "原则", "技巧"],
+    "org_chart": ["organization", "org chart", "organizational", "team structure", "hierarchy", "reporting line", "department", "组织", "架构", "部门", "层级", "团队结构"],
+    "mind_map": ["mind map", "mindmap", "brainstorm", "brainstorming", "ideas", "concepts", "knowledge map", "思维导图", "脑图", "头脑风暴", "知识"],
+    "workflow": ["flowchart", "flow chart", "dependencies", "dependency", "relationship", "relationships", "network", "approval flow", "流程图", "关系", "依赖", "审批"],
+    "timeline": ["timeline", "history", "chronology", "chronological", "milestones", "evolution", "over the years", "时间线", "时间轴", "历史", "里程碑", "发展历程", "演变", "大事记"],
+    "funnel": ["funnel", "conversion", "filter", "sales funnel", "漏斗", "转化", "筛选"],
+    "steps": ["steps", "step by step", "stages", "phases", "guide", "tutorial", "instructions", "步骤", "阶段", "教程", "指南", "操作"],
+}
+
+# Other names for the distinctive words of template names (e.g. chart types in Chinese)
+TEMPLATE_TERM_ALIASES = {
+    "chart": ["图表", "统计图", "graph", "data chart", "statistics"],
+    "pie": ["饼图", "pie chart"],
+    "donut": ["环形图", "doughnut"],
+    "bar": ["条形图", "bar chart"],
+    "column": ["柱状图", "柱形图", "column chart"],
+    "line": ["折线图", "趋势", "trend", "trends", "line chart"],
+    "wordcloud": ["word cloud", "词云", "tag cloud", "keywords"],
+    "swot": ["swot分析", "态势分析"],
+    "quadrant": ["quadrants", "four quadrants", "matrix", "四象限", "象限", "矩阵"],
+    "pyramid": ["金字塔", "levels", "hierarchy of needs"],
+    "roadmap": ["路线图", "plan", "planning", "规划"],
+    "circular": ["cycle", "cyclic", "loop", "循环", "闭环", "周期"],
+    "tree": ["树", "树形", "tree diagram"],
+    "stairs": ["阶梯", "ladder", "maturity"],
+    "ascending": ["上升", "growth path", "进阶"],
+    "done": ["todo", "to do", "待办", "完成"],
+}
+
+
 def get_template_category(template_name: str) -> str:
     """Get the category of a template by its name."""
     for category, templates in TEMPLATES.items():
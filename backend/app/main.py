@@ -1,5 +1,6 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+import asyncio
 import sys
 import os
 import uvicorn
@@ -25,9 +26,21 @@ app.include_router(api_router, prefix="/api")
 
 from app.core.database import init_db
 
+background_tasks = set()
+
 @app.on_event("startup")
 async def on_startup():
     await init_db()
+    if settings.ARCHIVE_AFTER_DAYS > 0:
+        from app.services.archive_service import run_archiver
+        background_tasks.add(asyncio.create_task(run_archiver()))
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    from app.services.pdf_service import shutdown_pool
+    shutdown_pool()
+    for task in background_tasks:
+        task.cancel()
 
 @app.get("/")
 async def root():
@@ -1,27 +1,44 @@
 from typing import Optional, List, Any, Dict
 from datetime import datetime, timezone
-from sqlmodel import Field, SQLModel, Relationship, Column, JSON
+from sqlalchemy import DDL, event
+from sqlmodel import Field, SQLModel, Relationship, Column, JSON, Index, LargeBinary
 from pydantic import field_serializer
 
 def utc_now():
     # Return naive UTC datetime for database compatibility
     return datetime.now(timezone.utc).replace(tzinfo=None)
 
+# ChatMessage.status: assistant messages are checkpointed as "streaming" drafts while generating
+MESSAGE_STREAMING = "streaming"
+MESSAGE_INTERRUPTED = "interrupted"
+MESSAGE_COMPLETE = "complete"
+
+def to_utc_iso(dt: datetime) -> str:
+    if dt.tzinfo is None:
+        return dt.replace(tzinfo=timezone.utc).isoformat().replace("+00:00", "Z")
+    return dt.isoformat().replace("+00:00", "Z")
+
 class ChatSession(SQLModel, table=True):
+    # Backs keyset pagination of the session list (ORDER BY updated_at DESC, id DESC)
+    __table_args__ = (Index("idx_chatsession_updated_at_id", "updated_at", "id"),)
+
     id: Optional[int] = Field(default=None, primary_key=True)
     title: str = Field(default="New Chat")
     created_at: datetime = Field(default_factory=utc_now)
     updated_at: datetime = Field(default_factory=utc_now)
+    archive_key: Optional[str] = Field(default=None, max_length=64) # blob digest of the archive while the messages are in cold storage
+    restored_at: Optional[datetime] = Field(default=None) # last rehydration; counts as activity for the archiver
     
     messages: List["ChatMessage"] = Relationship(back_populates="session")
 
-    @field_serializer("created_at", "updated_at")
-    def serialize_dt(self, dt: datetime, _info):
-        if dt.tzinfo is None:
-            return dt.replace(tzinfo=timezone.utc).isoformat().replace("+00:00", "Z")
-        return dt.isoformat().replace("+00:00", "Z")
+    @field_serializer("created_at", "updated_at", "restored_at")
+    def serialize_dt(self, dt: datetime | None, _info):
+        return to_utc_iso(dt) if dt else None
 
 class ChatMessage(SQLModel, table=True):
+    # Backs keyset pagination of a session's messages (ORDER BY created_at, id)
+    __table_args__ = (Index("idx_chatmessage_session_created_at_id", "session_id", "created_at", "id"),)
+
     id: Optional[int] = Field(default=None, primary_key=True)
     session_id: Optional[int] = Field(default=None, foreign_key="chatsession.id", index=True)
     parent_id: Optional[int] = Field(default=None, foreign_key="chatmessage.id")
@@ -33,12 +50,86 @@ class ChatMessage(SQLModel, table=True):
     steps: Optional[List[Any]] = Field(default=None, sa_column=Column(JSON))
     agent: Optional[str] = Field(default=None)
     turn_index: int = Field(default=0)
+    status: str = Field(default=MESSAGE_COMPLETE)
+    draft_output: Optional[str] = Field(default=None) # raw model output of an unfinished message, for resuming
     created_at: datetime = Field(default_factory=utc_now)
     
     session: Optional[ChatSession] = Relationship(back_populates="messages")
 
     @field_serializer("created_at")
     def serialize_dt(self, dt: datetime, _info):
-        if dt.tzinfo is None:
-            return dt.replace(tzinfo=timezone.utc).isoformat().replace("+00:00", "Z")
-        return dt.isoformat().replace("+00:00", "Z")
+        return to_utc_iso(dt)
+
+class ImageCaption(SQLModel, table=True):
+    """Cached vision-model caption for an image, keyed by the sha256 of its (normalized) bytes."""
+    digest: str = Field(primary_key=True, max_length=64)
+    caption: str
+    created_at: datetime = Field(default_factory=utc_now)
+
+class ArtifactRevision(SQLModel, table=True):
+    """
+    One version of a generated diagram (a tool_end step's code), zlib-compressed. A revision is
+    either a full snapshot (base_id is None) or a delta against its predecessor in the session.
+    """
+    # Finds the latest revision of a session's artifact chain
+    __table_args__ = (Index("idx_artifactrevision_session_kind_id", "session_id", "kind", "id"),)
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    session_id: int = Field(foreign_key="chatsession.id")
+    kind: str # step name, e.g. "create_drawio"
+    base_id: Optional[int] = Field(default=None, foreign_key="artifactrevision.id")
+    depth: int = Field(default=0) # deltas since the last snapshot
+    size: int # uncompressed length in bytes
+    data: bytes = Field(sa_column=Column(LargeBinary, nullable=False))
+    created_at: datetime = Field(default_factory=utc_now)
+
+class SessionSnapshot(SQLModel, table=True):
+    """
+    The GET /sessions/{id} response of a session as gzip'd JSON, patched by every message write
+    so reopening a session is one primary-key read. Valid while source_updated_at equals the
+    session's updated_at (every write touches both in the same transaction).
+    """
+    session_id: int = Field(foreign_key="chatsession.id", primary_key=True)
+    source_updated_at: datetime
+    etag: str = Field(max_length=64)
+    size: int # uncompressed length in bytes
+    data: bytes = Field(sa_column=Column(LargeBinary, nullable=False))
+
+class SearchDocument(SQLModel, table=True):
+    """
+    Searchable text of a session title, a user prompt, a design concept or a message's diagram
+    labels, kept in sync on write. The full-text index itself is dialect-specific (see below).
+    """
+    id: Optional[int] = Field(default=None, primary_key=True)
+    session_id: int = Field(foreign_key="chatsession.id", index=True)
+    message_id: Optional[int] = Field(default=None, foreign_key="chatmessage.id", index=True)
+    kind: str # "title", "prompt", "design_concept" or "artifact"
+    content: str
+    created_at: datetime = Field(default_factory=utc_now)
+
+# Postgres: a generated tsvector column with a GIN index. 'simple' does no stemming or stop words,
+# so prompts in any language are matched the same way; queries must use the same configuration.
+for statement in (
+    "ALTER TABLE searchdocument ADD COLUMN IF NOT EXISTS tsv tsvector "
+    "GENERATED ALWAYS AS (to_tsvector('simple'::regconfig, content)) STORED",
+    "CREATE INDEX IF NOT EXISTS idx_searchdocument_tsv ON searchdocument USING GIN (tsv)",
+):
+    event.listen(SearchDocument.__table__, "after_create", DDL(statement).execute_if(dialect="postgresql"))
+
+# SQLite: an external-content FTS5 table over searchdocument, maintained by triggers
+for statement in (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS searchdocument_fts USING fts5("
+    "content, content='searchdocument', content_rowid='id', tokenize='unicode61 remove_diacritics 2')",
+    "CREATE TRIGGER IF NOT EXISTS searchdocument_ai AFTER INSERT ON searchdocument BEGIN "
+    "INSERT INTO searchdocument_fts(rowid, content) VALUES (new.id, new.content); END",
+    "CREATE TRIGGER IF NOT EXISTS searchdocument_ad AFTER DELETE ON searchdocument BEGIN "
+    "INSERT INTO searchdocument_fts(searchdocument_fts, rowid, content) VALUES ('delete', old.id, old.content); END",
+    "CREATE TRIGGER IF NOT EXISTS searchdocument_au AFTER UPDATE ON searchdocument BEGIN "
+    "INSERT INTO searchdocument_fts(searchdocument_fts, rowid, content) VALUES ('delete', old.id, old.content); "
+    "INSERT INTO searchdocument_fts(rowid, content) VALUES (new.id, new.content); END",
+):
+    event.listen(SearchDocument.__table__, "after_create", DDL(statement).execute_if(dialect="sqlite"))
+event.listen(
+    SearchDocument.__table__, "before_drop",
+    DDL("DROP TABLE IF EXISTS searchdocument_fts").execute_if(dialect="sqlite")
+)
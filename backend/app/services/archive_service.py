@@ -0,0 +1,272 @@
+import asyncio
+import base64
+import gzip
+import json
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List
+from sqlalchemy import DateTime, LargeBinary, Table, delete, func, or_, text, update
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+from app.core.config import settings
+from app.core.logger import logger
+from app.models.chat import ArtifactRevision, ChatMessage, ChatSession, SearchDocument, utc_now
+from app.services.artifact_service import ArtifactService
+from app.services.blob_store import get_blob_store
+from app.services.search_service import SearchService
+from app.services.snapshot_service import SessionSnapshotService
+
+ARCHIVE_FORMAT_VERSION = 1
+ARCHIVE_CONTENT_TYPE = "application/gzip"
+
+# Key of the Postgres advisory lock that lets one worker (of all processes and replicas) archive at a time
+ARCHIVER_LOCK_ID = 724_310_552
+
+# Restored in this order (revisions and messages only reference older rows of their own table)
+ARCHIVED_TABLES: List[Table] = [ArtifactRevision.__table__, ChatMessage.__table__]
+
+
+def encode_row(table: Table, row: Dict[str, Any]) -> Dict[str, Any]:
+    encoded = {}
+    for column in table.columns:
+        value = row[column.name]
+        if isinstance(value, datetime):
+            value = value.isoformat()
+        elif isinstance(value, bytes):
+            value = base64.b64encode(value).decode()
+        encoded[column.name] = value
+    return encoded
+
+
+def decode_row(table: Table, row: Dict[str, Any]) -> Dict[str, Any]:
+    decoded = {}
+    for column in table.columns:
+        value = row.get(column.name)
+        if value is not None and isinstance(column.type, DateTime):
+            value = datetime.fromisoformat(value)
+        elif value is not None and isinstance(column.type, LargeBinary):
+            value = base64.b64decode(value)
+        decoded[column.name] = value
+    return decoded
+
+
+def is_idle(chat_session: ChatSession, idle_before: datetime) -> bool:
+    return chat_session.updated_at < idle_before and (
+        chat_session.restored_at is None or chat_session.restored_at < idle_before
+    )
+
+
+class ArchiveService:
+    """
+    Moves the messages and artifact revisions of idle sessions into one gzip'd JSON file per
+    session in the blob store, and puts them back when the session is opened again.
+
+    The ChatSession row and its search documents stay in the database, so archived sessions are
+    still listed and found; `archive_key` marks a session whose rows are in cold storage. Rows are
+    deleted in batches of DB_DELETE_BATCH_SIZE, each in its own short transaction that first
+    re-checks (under the session row lock) that the session was not restored in the meantime.
+    """
+
+    def __init__(self, session: AsyncSession):
+        self.session = session
+
+    async def _lock_session(self, session_id: int) -> ChatSession | None:
+        statement = (
+            select(ChatSession).where(ChatSession.id == session_id)
+            .with_for_update().execution_options(populate_existing=True)
+        )
+        return (await self.session.exec(statement)).first()
+
+    async def _dump(self, session_id: int) -> bytes:
+        archive = {"version": ARCHIVE_FORMAT_VERSION, "session_id": session_id}
+        for table in ARCHIVED_TABLES:
+            result = await self.session.exec(table.select().where(table.c.session_id == session_id).order_by(table.c.id))
+            archive[table.name] = [encode_row(table, row._mapping) for row in result.all()]
+        return gzip.compress(json.dumps(archive, separators=(",", ":")).encode())
+
+    async def archive(self, session_id: int, idle_before: datetime) -> bool:
+        """Archives the session if it is still idle; returns False when it was skipped."""
+        chat_session = await self.session.get(ChatSession, session_id, populate_existing=True)
+        if not chat_session or chat_session.archive_key or not is_idle(chat_session, idle_before):
+            await self.session.rollback()
+            return False
+        data = await self._dump(session_id)
+        await self.session.rollback()
+        archive_key = await get_blob_store().put(data, ARCHIVE_CONTENT_TYPE)
+
+        # Mark first: from here on readers restore the session instead of reading partial rows
+        chat_session = await self._lock_session(session_id)
+        if not chat_session or chat_session.archive_key or not is_idle(chat_session, idle_before):
+            await self.session.rollback()
+            return False
+        chat_session.archive_key = archive_key
+        self.session.add(chat_session)
+        await self.session.exec(
+            update(SearchDocument).where(SearchDocument.session_id == session_id).values(message_id=None)
+        )
+        await SessionSnapshotService(self.session).delete(session_id)
+        await self.session.commit()
+
+        deleted = await self.delete_rows(session_id, archive_key=archive_key)
+        logger.info(f"🧊 Archived session {session_id} ({deleted} rows, {len(data)} bytes) as {archive_key[:12]}")
+        return True
+
+    async def delete_rows(self, session_id: int, tables: Iterable[Table] | None = None, archive_key: str | None = None) -> int:
+        """
+        Deletes the session's rows from `tables` (default: messages, then revisions) newest first,
+        since rows only reference older rows, one bounded batch per transaction. With archive_key,
+        stops as soon as the session has been restored.
+        """
+        deleted = 0
+        for table in tables if tables is not None else reversed(ARCHIVED_TABLES):
+            while True:
+                if archive_key:
+                    chat_session = await self._lock_session(session_id)
+                    if not chat_session or chat_session.archive_key != archive_key:
+                        await self.session.rollback()
+                        return deleted
+                batch = (
+                    select(table.c.id).where(table.c.session_id == session_id)
+                    .order_by(table.c.id.desc()).limit(settings.DB_DELETE_BATCH_SIZE)
+                )
+                result = await self.session.exec(delete(table).where(table.c.id.in_(batch.scalar_subquery())))
+                await self.session.commit()
+                deleted += result.rowcount
+                if result.rowcount < settings.DB_DELETE_BATCH_SIZE:
+                    break
+        return deleted
+
+    async def restore(self, session_id: int) -> bool:
+        """Puts an archived session's rows back; returns False if it was not archived."""
+        chat_session = await self._lock_session(session_id)
+        if not chat_session or not chat_session.archive_key:
+            await self.session.rollback()
+            return False
+        data = await get_blob_store().read(chat_session.archive_key)
+        if data is None:
+            await self.session.rollback()
+            raise RuntimeError(f"Archive {chat_session.archive_key} of session {session_id} is missing")
+        archive = json.loads(gzip.decompress(data))
+
+        # Rows the archiver had not deleted yet are still there
+        insert = postgresql_insert if self.session.bind.dialect.name == "postgresql" else sqlite_insert
+        for table in ARCHIVED_TABLES:
+            rows = [decode_row(table, row) for row in archive.get(table.name, [])]
+            if rows:
+                await self.session.exec(insert(table).on_conflict_do_nothing(), params=rows)
+
+        # Search documents of the messages were detached while archived; rebuild them
+        await self.session.exec(delete(SearchDocument).where(
+            SearchDocument.session_id == session_id, SearchDocument.message_id.is_(None), SearchDocument.kind != "title"
+        ))
+        messages = list((await self.session.exec(select(ChatMessage).where(ChatMessage.session_id == session_id))).all())
+        await ArtifactService(self.session).unpack_messages(messages)
+        search = SearchService(self.session)
+        for message in messages:
+            await search.index_message(message, message.steps)
+
+        chat_session.archive_key = None
+        chat_session.restored_at = utc_now()
+        self.session.add(chat_session)
+        await self.session.commit()
+        self.session.expunge_all()
+        logger.info(f"🔥 Restored session {session_id} ({len(messages)} messages) from the archive")
+        return True
+
+    async def restore_if_archived(self, session_id: int) -> bool:
+        """Cheap check for the request path; restores the session when its rows are archived."""
+        archive_key = (await self.session.exec(
+            select(ChatSession.archive_key).where(ChatSession.id == session_id)
+        )).first()
+        if not archive_key:
+            return False
+        try:
+            return await self.restore(session_id)
+        except DBAPIError:
+            # SQLite has no row locks: a concurrent request may have restored it first
+            await self.session.rollback()
+            if (await self.session.exec(select(ChatSession.archive_key).where(ChatSession.id == session_id))).first():
+                raise
+            return True
+
+    async def delete_archive(self, session_id: int, archive_key: str) -> bool:
+        """Deletes the archive blob of a deleted session, unless another session still references it."""
+        shared = (await self.session.exec(
+            select(func.count()).select_from(ChatSession)
+            .where(ChatSession.archive_key == archive_key, ChatSession.id != session_id)
+        )).one()
+        await self.session.rollback()
+        if shared:
+            return False
+        try:
+            return await get_blob_store().delete(archive_key)
+        except Exception as e:
+            # The session is gone either way; an orphaned archive only costs storage
+            logger.warning(f"🧊 Could not delete archive {archive_key[:12]} of session {session_id}: {e}")
+            return False
+
+    async def archive_idle_sessions(self, limit: int) -> int:
+        """Archives up to `limit` sessions idle for ARCHIVE_AFTER_DAYS, oldest first."""
+        idle_before = utc_now() - timedelta(days=settings.ARCHIVE_AFTER_DAYS)
+        statement = (
+            select(ChatSession.id)
+            .where(
+                ChatSession.archive_key.is_(None),
+                ChatSession.updated_at < idle_before,
+                or_(ChatSession.restored_at.is_(None), ChatSession.restored_at < idle_before),
+            )
+            .order_by(ChatSession.updated_at)
+            .limit(limit)
+        )
+        session_ids = list((await self.session.exec(statement)).all())
+        await self.session.rollback()
+        archived = 0
+        for session_id in session_ids:
+            try:
+                archived += await self.archive(session_id, idle_before)
+            except Exception as e:
+                await self.session.rollback()
+                logger.error(f"🧊 Archiving session {session_id} failed: {e}")
+        return archived
+
+
+@asynccontextmanager
+async def archiver_lock():
+    """
+    Yields whether this worker may archive now. Every worker runs the archiver loop; on Postgres
+    the first to take a session-level advisory lock does the run and the others skip it.
+    """
+    from app.core.database import engine
+
+    if engine.dialect.name != "postgresql":
+        yield True
+        return
+    async with engine.connect() as conn:
+        acquired = (await conn.execute(text("SELECT pg_try_advisory_lock(:lock_id)"), {"lock_id": ARCHIVER_LOCK_ID})).scalar()
+        await conn.commit()
+        try:
+            yield acquired
+        finally:
+            if acquired:
+                await conn.execute(text("SELECT pg_advisory_unlock(:lock_id)"), {"lock_id": ARCHIVER_LOCK_ID})
+                await conn.commit()
+
+
+async def run_archiver():
+    """Background loop: archives idle sessions every ARCHIVE_INTERVAL_SECONDS."""
+    from app.core.database import session_scope
+
+    while True:
+        try:
+            async with archiver_lock() as acquired:
+                if acquired:
+                    async with session_scope() as db:
+                        archived = await ArchiveService(db).archive_idle_sessions(settings.ARCHIVE_SESSIONS_PER_RUN)
+                    if archived:
+                        logger.info(f"🧊 Archived {archived} idle session(s)")
+        except Exception as e:
+            logger.error(f"🧊 Archiver run failed: {e}")
+        await asyncio.sleep(settings.ARCHIVE_INTERVAL_SECONDS)
@@ -0,0 +1,168 @@
+import json
+import re
+import zlib
+from difflib import SequenceMatcher
+from typing import Any, Dict, Iterable, List
+from sqlalchemy import insert
+from sqlalchemy.orm.attributes import set_committed_value
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+from app.core.config import settings
+from app.core.logger import logger
+from app.models.chat import ArtifactRevision, ChatMessage, utc_now
+
+# Steps whose content is diagram code; smaller payloads stay inline in ChatMessage.steps
+ARTIFACT_STEP_TYPE = "tool_end"
+MIN_ARTIFACT_SIZE = 256
+
+# Deltas work on lines, also split after every ">" so single-line XML still diffs element by element
+TOKEN_PATTERN = re.compile(r"[^\n>]*[\n>]|[^\n>]+")
+COMPRESSION_LEVEL = 6
+
+
+def tokenize(text: str) -> List[str]:
+    return TOKEN_PATTERN.findall(text)
+
+
+def make_delta(base: str, target: str) -> List[Any]:
+    """Ops that rebuild target from base: [start, end] copies base tokens, a string is inserted text."""
+    base_tokens, target_tokens = tokenize(base), tokenize(target)
+    ops: List[Any] = []
+    for tag, i1, i2, j1, j2 in SequenceMatcher(None, base_tokens, target_tokens, autojunk=False).get_opcodes():
+        if tag == "equal":
+            ops.append([i1, i2])
+        elif j2 > j1:
+            ops.append("".join(target_tokens[j1:j2]))
+    return ops
+
+
+def apply_delta(base: str, ops: List[Any]) -> str:
+    base_tokens = tokenize(base)
+    return "".join("".join(base_tokens[op[0]:op[1]]) if isinstance(op, list) else op for op in ops)
+
+
+def encode_revision(text: str, base_text: str | None = None) -> tuple[bytes, bool]:
+    """
+    Compresses a revision. Returns (data, is_delta): a delta against base_text when one is given
+    and it comes out smaller than the compressed snapshot, otherwise the snapshot.
+    """
+    snapshot = zlib.compress(text.encode(), COMPRESSION_LEVEL)
+    if base_text is None:
+        return snapshot, False
+    delta = zlib.compress(json.dumps(make_delta(base_text, text), separators=(",", ":")).encode(), COMPRESSION_LEVEL)
+    if len(delta) < len(snapshot):
+        return delta, True
+    return snapshot, False
+
+
+def decode_revision(data: bytes, base_text: str | None = None) -> str:
+    raw = zlib.decompress(data).decode()
+    return raw if base_text is None else apply_delta(base_text, json.loads(raw))
+
+
+class ArtifactService:
+    """
+    Keeps the code of tool_end steps in ArtifactRevision chains instead of inline in
+    ChatMessage.steps. Each revision is a compressed delta against the previous revision of the
+    same artifact kind in the session, with a full snapshot every ARTIFACT_SNAPSHOT_INTERVAL
+    revisions so reconstruction never applies more than interval - 1 deltas.
+    """
+
+    def __init__(self, session: AsyncSession):
+        self.session = session
+
+    async def _fetch_chains(self, ids: Iterable[int]) -> Dict[int, ArtifactRevision]:
+        """Loads the revisions and everything they depend on, one query per chain step."""
+        revisions: Dict[int, ArtifactRevision] = {}
+        pending = set(ids)
+        while pending:
+            result = await self.session.exec(select(ArtifactRevision).where(ArtifactRevision.id.in_(pending)))
+            rows = result.all()
+            revisions.update({row.id: row for row in rows})
+            pending = {row.base_id for row in rows if row.base_id and row.base_id not in revisions}
+        return revisions
+
+    async def load(self, ids: Iterable[int]) -> Dict[int, str]:
+        """Returns revision id -> text (revisions that can't be reconstructed are left out)."""
+        ids = set(ids)
+        revisions = await self._fetch_chains(ids)
+        texts: Dict[int, str] = {}
+        for rev_id in ids:
+            # Walk back to a snapshot (or an already rebuilt revision), then apply deltas forward
+            chain = []
+            current = rev_id
+            while current is not None and current not in texts and current in revisions:
+                chain.append(revisions[current])
+                current = revisions[current].base_id
+            if current is not None and current not in texts:
+                logger.warning(f"Artifact revision {rev_id} has a broken chain at {current}")
+                continue
+            for revision in reversed(chain):
+                base_text = texts[revision.base_id] if revision.base_id else None
+                texts[revision.id] = decode_revision(revision.data, base_text)
+        return texts
+
+    async def store(self, session_id: int, kind: str, text: str) -> int:
+        """Adds a revision to the session's chain for `kind` (in the caller's transaction) and returns its id."""
+        latest = (await self.session.exec(
+            select(ArtifactRevision.id, ArtifactRevision.depth)
+            .where(ArtifactRevision.session_id == session_id, ArtifactRevision.kind == kind)
+            .order_by(ArtifactRevision.id.desc())
+            .limit(1)
+        )).first()
+
+        base_id, base_text, depth = None, None, 0
+        if latest and latest.depth + 1 < settings.ARTIFACT_SNAPSHOT_INTERVAL:
+            base_text = (await self.load([latest.id])).get(latest.id)
+            if base_text is not None:
+                base_id, depth = latest.id, latest.depth + 1
+
+        data, is_delta = encode_revision(text, base_text)
+        if not is_delta:
+            base_id, depth = None, 0
+
+        statement = insert(ArtifactRevision).values(
+            session_id=session_id,
+            kind=kind,
+            base_id=base_id,
+            depth=depth,
+            size=len(text.encode()),
+            data=data,
+            created_at=utc_now()
+        ).returning(ArtifactRevision.id)
+        return (await self.session.exec(statement)).scalar_one()
+
+    async def pack_steps(self, session_id: int, steps: List[Any] | None) -> List[Any] | None:
+        """Moves the code of artifact steps into revisions; the step keeps an `artifact_id` reference."""
+        if not steps or not settings.ARTIFACT_SNAPSHOT_INTERVAL:
+            return steps
+        packed = []
+        for step in steps:
+            if isinstance(step, dict) and step.get("type") == ARTIFACT_STEP_TYPE and isinstance(step.get("content"), str):
+                if step.get("artifact_id"):
+                    step = {**step, "content": ""}
+                elif len(step["content"]) >= MIN_ARTIFACT_SIZE:
+                    artifact_id = await self.store(session_id, step.get("name") or "artifact", step["content"])
+                    step = {**step, "content": "", "artifact_id": artifact_id}
+            packed.append(step)
+        return packed
+
+    async def unpack_messages(self, messages: Iterable[ChatMessage]):
+        """Puts the artifact code back into the messages' steps, without marking the rows as modified."""
+        messages = [message for message in messages if message.steps]
+        ids = {
+            step["artifact_id"] for message in messages for step in message.steps
+            if isinstance(step, dict) and step.get("artifact_id")
+        }
+        if not ids:
+            return
+        texts = await self.load(ids)
+        for message in messages:
+            if not any(isinstance(step, dict) and step.get("artifact_id") for step in message.steps):
+                continue
+            steps = [
+                {**step, "content": texts.get(step["artifact_id"], "")}
+                if isinstance(step, dict) and step.get("artifact_id") else step
+                for step in message.steps
+            ]
+            set_committed_value(message, "steps", steps)
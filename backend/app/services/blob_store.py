@@ -0,0 +1,247 @@
+import asyncio
+import base64
+import binascii
+import hashlib
+import importlib
+import json
+import os
+import re
+import tempfile
+from dataclasses import dataclass
+from typing import Any, Dict, List
+from app.core.config import settings
+from app.core.logger import logger
+
+# Rows reference blobs through this URL; the frontend can use it directly as <img src>
+BLOB_URL_PREFIX = "/api/blobs/"
+DIGEST_PATTERN = re.compile(r"^[0-9a-f]{64}$")
+DATA_URI_PATTERN = re.compile(r"^data:([^;,]*)(;[^,]*)?,", re.DOTALL)
+
+DEFAULT_CONTENT_TYPE = "application/octet-stream"
+# Content types come from client-supplied data URIs; only these are served inline (rendering
+# anything else, e.g. text/html or image/svg+xml, on the API origin would be stored XSS)
+INLINE_CONTENT_TYPES = {"image/png", "image/jpeg", "image/gif", "image/webp", "image/avif", "image/bmp"}
+
+
+@dataclass
+class BlobInfo:
+    digest: str
+    size: int
+    content_type: str
+
+    @property
+    def inline(self) -> bool:
+        return self.content_type.split(";")[0].strip().lower() in INLINE_CONTENT_TYPES
+
+
+class BlobStore:
+    """
+    Content-addressed storage for binary payloads (images, uploaded files).
+    Blobs are keyed by the sha256 of their bytes, so storing the same payload twice is free.
+    Backends implement the primitives below; they are called from worker threads.
+    """
+
+    def _put(self, digest: str, data: bytes, content_type: str) -> bool:
+        """Stores the blob if absent. Returns True when new bytes were written."""
+        raise NotImplementedError
+
+    def _stat(self, digest: str) -> BlobInfo | None:
+        raise NotImplementedError
+
+    def _read(self, digest: str, start: int = 0, end: int | None = None) -> bytes | None:
+        """Reads bytes [start, end) of the blob, or None if it does not exist."""
+        raise NotImplementedError
+
+    def _delete(self, digest: str) -> bool:
+        """Removes the blob. Returns True when it existed."""
+        raise NotImplementedError
+
+    async def put(self, data: bytes, content_type: str = DEFAULT_CONTENT_TYPE) -> str:
+        digest = hashlib.sha256(data).hexdigest()
+        written = await asyncio.to_thread(self._put, digest, data, content_type or DEFAULT_CONTENT_TYPE)
+        if written:
+            logger.info(f"🗄️ Stored blob {digest[:12]} ({len(data)} bytes, {content_type})")
+        return digest
+
+    async def stat(self, digest: str) -> BlobInfo | None:
+        if not DIGEST_PATTERN.match(digest):
+            return None
+        return await asyncio.to_thread(self._stat, digest)
+
+    async def read(self, digest: str, start: int = 0, end: int | None = None) -> bytes | None:
+        if not DIGEST_PATTERN.match(digest):
+            return None
+        return await asyncio.to_thread(self._read, digest, start, end)
+
+    async def delete(self, digest: str) -> bool:
+        """Deletes the blob. Callers make sure nothing references it any more (blobs are shared by content)."""
+        if not DIGEST_PATTERN.match(digest):
+            return False
+        deleted = await asyncio.to_thread(self._delete, digest)
+        if deleted:
+            logger.info(f"🗄️ Deleted blob {digest[:12]}")
+        return deleted
+
+
+class LocalBlobStore(BlobStore):
+    """Stores blobs as files under root/ab/cd/<digest>, with a small JSON sidecar for metadata."""
+
+    def __init__(self, root: str):
+        self.root = root
+
+    def _path(self, digest: str) -> str:
+        return os.path.join(self.root, digest[:2], digest[2:4], digest)
+
+    def _put(self, digest: str, data: bytes, content_type: str) -> bool:
+        path = self._path(digest)
+        if os.path.exists(path):
+            return False
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        # Write to a temp file and rename, so readers never observe a partial blob
+        for target, payload in (
+            (f"{path}.json", json.dumps({"content_type": content_type}).encode()),
+            (path, data),
+        ):
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    f.write(payload)
+                os.replace(tmp_path, target)
+            except BaseException:
+                if os.path.exists(tmp_path):
+                    os.unlink(tmp_path)
+                raise
+        return True
+
+    def _stat(self, digest: str) -> BlobInfo | None:
+        path = self._path(digest)
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            return None
+        content_type = DEFAULT_CONTENT_TYPE
+        try:
+            with open(f"{path}.json", "rb") as f:
+                content_type = json.load(f).get("content_type") or DEFAULT_CONTENT_TYPE
+        except (OSError, ValueError):
+            pass
+        return BlobInfo(digest=digest, size=size, content_type=content_type)
+
+    def _read(self, digest: str, start: int = 0, end: int | None = None) -> bytes | None:
+        try:
+            with open(self._path(digest), "rb") as f:
+                f.seek(start)
+                return f.read() if end is None else f.read(max(end - start, 0))
+        except OSError:
+            return None
+
+    def _delete(self, digest: str) -> bool:
+        path = self._path(digest)
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            return False
+        try:
+            os.unlink(f"{path}.json")
+        except FileNotFoundError:
+            pass
+        return True
+
+
+_store: BlobStore | None = None
+
+
+def get_blob_store() -> BlobStore:
+    """
+    Returns the process-wide blob store. BLOB_STORE_BACKEND is "local" or the dotted path of a
+    BlobStore subclass ("package.module:ClassName"), which is constructed without arguments.
+    """
+    global _store
+    if _store is None:
+        backend = settings.BLOB_STORE_BACKEND
+        if backend == "local":
+            _store = LocalBlobStore(settings.BLOB_STORE_PATH)
+        else:
+            module_name, _, class_name = backend.partition(":")
+            _store = getattr(importlib.import_module(module_name), class_name)()
+        logger.info(f"🗄️ Blob store backend: {type(_store).__name__}")
+    return _store
+
+
+def blob_url(digest: str) -> str:
+    return f"{BLOB_URL_PREFIX}{digest}"
+
+
+def blob_digest(ref: str) -> str | None:
+    """Returns the digest if ref is a blob URL, otherwise None."""
+    if isinstance(ref, str) and ref.startswith(BLOB_URL_PREFIX):
+        digest = ref[len(BLOB_URL_PREFIX):]
+        if DIGEST_PATTERN.match(digest):
+            return digest
+    return None
+
+
+def decode_data_uri(data_uri: str) -> tuple[bytes, str] | None:
+    """Decodes a base64 data URI into (bytes, content type); None if it isn't one."""
+    match = DATA_URI_PATTERN.match(data_uri or "")
+    if not match or ";base64" not in (match.group(2) or ""):
+        return None
+    try:
+        data = base64.b64decode(data_uri[match.end():])
+    except (binascii.Error, ValueError):
+        return None
+    return data, match.group(1) or DEFAULT_CONTENT_TYPE
+
+
+async def store_file(file_info: Dict[str, Any]) -> Dict[str, Any]:
+    """Replaces the inline base64 payload of an uploaded file with a blob reference."""
+    data_field = file_info.get("data", "")
+    if not data_field:
+        return file_info
+
+    decoded = decode_data_uri(data_field)
+    if decoded:
+        data, content_type = decoded
+    else:
+        # Bare base64 without a data: prefix
+        try:
+            data, content_type = base64.b64decode(data_field), DEFAULT_CONTENT_TYPE
+        except (binascii.Error, ValueError):
+            return file_info
+
+    digest = await get_blob_store().put(data, content_type)
+    stored = {k: v for k, v in file_info.items() if k != "data"}
+    stored.update({"blob": digest, "url": blob_url(digest), "size": len(data), "content_type": content_type})
+    return stored
+
+
+async def load_image(ref: str) -> str:
+    """Resolves a blob URL back into a data URI for the LLM; inline data URIs pass through."""
+    digest = blob_digest(ref)
+    if not digest:
+        return ref
+    store = get_blob_store()
+    info = await store.stat(digest)
+    data = await store.read(digest) if info else None
+    if data is None:
+        logger.warning(f"Blob {digest[:12]} not found, dropping image reference")
+        return ""
+    return f"data:{info.content_type};base64,{base64.b64encode(data).decode()}"
+
+
+async def load_images(refs: List[str]) -> List[str]:
+    return [url for url in [await load_image(ref) for ref in refs] if url]
+
+
+async def load_file(file_info: Dict[str, Any]) -> Dict[str, Any]:
+    """Returns the file with its base64 `data` filled in from the blob store when it only holds a reference."""
+    if file_info.get("data") or not file_info.get("blob"):
+        return file_info
+    store = get_blob_store()
+    info = await store.stat(file_info["blob"])
+    data = await store.read(file_info["blob"]) if info else None
+    if data is None:
+        logger.warning(f"Blob for file {file_info.get('name')} not found")
+        return file_info
+    return {**file_info, "data": f"data:{info.content_type};base64,{base64.b64encode(data).decode()}"}
@@ -1,16 +1,52 @@
+import base64
+import json
+from datetime import datetime
+from sqlalchemy import func, insert, literal, tuple_, update
 from sqlmodel import select
 from sqlmodel.ext.asyncio.session import AsyncSession
-from app.models.chat import ChatSession, ChatMessage
+from app.models.chat import ArtifactRevision, ChatSession, ChatMessage, SearchDocument, MESSAGE_COMPLETE, MESSAGE_STREAMING, to_utc_iso, utc_now
+from app.services.archive_service import ArchiveService
+from app.services.artifact_service import ArtifactService
+from app.services.search_service import SearchService
+from app.services.snapshot_service import SessionSnapshotService, message_json
+
+# Columns returned by the lightweight history projection (no steps/images/files/file_context)
+MESSAGE_SUMMARY_COLUMNS = (
+    ChatMessage.id, ChatMessage.session_id, ChatMessage.parent_id, ChatMessage.role,
+    ChatMessage.content, ChatMessage.agent, ChatMessage.turn_index, ChatMessage.status, ChatMessage.created_at,
+)
+
+
+def encode_cursor(timestamp: datetime, row_id: int) -> str:
+    """Opaque keyset cursor: the (timestamp, id) of the last row of a page."""
+    raw = json.dumps([timestamp.isoformat(), row_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple[datetime, int]:
+    """Raises ValueError for malformed cursors."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        timestamp, row_id = json.loads(raw)
+        return datetime.fromisoformat(timestamp), int(row_id)
+    except Exception as e:
+        raise ValueError(f"Invalid cursor: {cursor!r}") from e
+
 
 class ChatService:
     def __init__(self, session: AsyncSession):
         self.session = session
 
     async def create_session(self, title: str = "New Chat") -> ChatSession:
-        chat_session = ChatSession(title=title)
-        self.session.add(chat_session)
+        now = utc_now()
+        statement = (
+            insert(ChatSession)
+            .values(title=title, created_at=now, updated_at=now)
+            .returning(ChatSession)
+        )
+        chat_session = (await self.session.exec(statement)).scalar_one()
+        await SearchService(self.session).index_title(chat_session.id, title)
         await self.session.commit()
-        await self.session.refresh(chat_session)
         return chat_session
 
     async def get_session(self, session_id: int) -> ChatSession | None:
@@ -28,65 +64,188 @@ class ChatService:
         file_context: str | None = None,
         steps: list[any] | None = None,
         agent: str | None = None,
-        parent_id: int | None = None
+        parent_id: int | None = None,
+        status: str = MESSAGE_COMPLETE,
+        draft_output: str | None = None,
+        updates: dict[int, dict] | None = None
     ) -> ChatMessage:
-        turn_index = 0
+        """
+        Inserts a message with INSERT ... RETURNING. turn_index is computed from the parent inside
+        the statement, and the session's updated_at is touched in the same statement (data-modifying
+        CTE on Postgres) or the same transaction. `updates` ({message_id: {field: value}}) are
+        applied in that transaction too, so deferred edits don't cost a commit of their own.
+        Diagram code in the steps is moved into artifact revisions once the message is final; the
+        search index and the session's history snapshot are updated in the same transaction (a
+        streaming draft is left out of the snapshot until its final write, see SessionSnapshotService).
+        """
+        now = utc_now()
+        indexed_steps = steps
+        if steps and status != MESSAGE_STREAMING:
+            steps = await ArtifactService(self.session).pack_steps(session_id, steps)
+        turn_index = literal(0)
         if parent_id and parent_id > 0:
-            parent_statement = select(ChatMessage).where(ChatMessage.id == parent_id)
-            parent_result = await self.session.exec(parent_statement)
-            parent = parent_result.first()
-            if parent:
-                turn_index = parent.turn_index + 1
-
-        message = ChatMessage(
-            session_id=session_id, 
-            role=role, 
-            content=content,
-            images=images,
-            files=files,
-            file_context=file_context,
-            steps=steps,
-            agent=agent,
-            parent_id=parent_id,
-            turn_index=turn_index
+            parent_turn = select(ChatMessage.turn_index + 1).where(ChatMessage.id == parent_id).scalar_subquery()
+            turn_index = func.coalesce(parent_turn, 0)
+
+        statement = (
+            insert(ChatMessage)
+            .values(
+                session_id=session_id,
+                role=role,
+                content=content,
+                images=images,
+                files=files,
+                file_context=file_context,
+                steps=steps,
+                agent=agent,
+                parent_id=parent_id,
+                turn_index=turn_index,
+                status=status,
+                draft_output=draft_output,
+                created_at=now
+            )
+            .returning(ChatMessage)
         )
-        self.session.add(message)
-        
-        # Update session updated_at
-        from datetime import datetime, timezone
-        statement = select(ChatSession).where(ChatSession.id == session_id)
-        result = await self.session.exec(statement)
-        chat_session = result.first()
-        if chat_session:
-            chat_session.updated_at = datetime.now(timezone.utc).replace(tzinfo=None)
-            self.session.add(chat_session)
-            
+        touch_session = update(ChatSession).where(ChatSession.id == session_id).values(updated_at=now)
+        if self.session.bind.dialect.name == "postgresql":
+            statement = statement.add_cte(touch_session.cte("touched_session"))
+        else:
+            await self.session.exec(touch_session)
+
+        for message_id, values in (updates or {}).items():
+            await self.session.exec(update(ChatMessage).where(ChatMessage.id == message_id).values(**values))
+
+        message = (await self.session.exec(statement)).scalar_one()
+        await SearchService(self.session).index_message(message, indexed_steps)
+        if status != MESSAGE_STREAMING:
+            await SessionSnapshotService(self.session).patch(session_id, now, [message_json(message, indexed_steps)], updates)
+        elif updates:
+            await SessionSnapshotService(self.session).patch(session_id, now, fields=updates)
         await self.session.commit()
-        await self.session.refresh(message)
         return message
 
-    async def update_message(self, message_id: int, **kwargs) -> ChatMessage | None:
-        statement = select(ChatMessage).where(ChatMessage.id == message_id)
-        result = await self.session.exec(statement)
-        message = result.first()
+    async def checkpoint_message(
+        self,
+        message_id: int | None,
+        session_id: int,
+        content: str,
+        steps: list[any] | None = None,
+        agent: str | None = None,
+        parent_id: int | None = None,
+        status: str = MESSAGE_STREAMING,
+        draft_output: str | None = None,
+        updates: dict[int, dict] | None = None
+    ) -> ChatMessage:
+        """
+        Upserts an assistant message while it is generated: the first checkpoint inserts a draft
+        row, later checkpoints and the final save (status complete) update that row in place.
+        """
+        if message_id is None:
+            return await self.add_message(
+                session_id, "assistant", content, steps=steps, agent=agent, parent_id=parent_id,
+                status=status, draft_output=draft_output, updates=updates
+            )
+        now = utc_now()
+        await self.session.exec(update(ChatSession).where(ChatSession.id == session_id).values(updated_at=now))
+        for other_id, values in (updates or {}).items():
+            await self.session.exec(update(ChatMessage).where(ChatMessage.id == other_id).values(**values))
+        indexed_steps = steps
+        if steps and status != MESSAGE_STREAMING:
+            steps = await ArtifactService(self.session).pack_steps(session_id, steps)
+        statement = (
+            update(ChatMessage)
+            .where(ChatMessage.id == message_id)
+            .values(content=content, steps=steps, agent=agent, status=status, draft_output=draft_output)
+            .returning(ChatMessage)
+        )
+        message = (await self.session.exec(statement)).scalar_one_or_none()
         if message:
-            for key, value in kwargs.items():
-                if hasattr(message, key):
-                    setattr(message, key, value)
-            self.session.add(message)
-            await self.session.commit()
-            await self.session.refresh(message)
+            await SearchService(self.session).index_message(message, indexed_steps)
+            if status != MESSAGE_STREAMING:
+                await SessionSnapshotService(self.session).patch(session_id, now, [message_json(message, indexed_steps)], updates)
+            elif updates:
+                await SessionSnapshotService(self.session).patch(session_id, now, fields=updates)
+        await self.session.commit()
         return message
 
+    async def update_message(self, message_id: int, **kwargs) -> ChatMessage | None:
+        values = {key: value for key, value in kwargs.items() if key in ChatMessage.model_fields}
+        await self.update_messages({message_id: values})
+        return await self.get_message(message_id)
+
+    async def update_messages(self, updates: dict[int, dict]):
+        """Applies several {message_id: {field: value}} updates in a single transaction."""
+        rows = (await self.session.exec(
+            select(ChatMessage.id, ChatMessage.session_id).where(ChatMessage.id.in_(list(updates)))
+        )).all()
+        for message_id, values in updates.items():
+            await self.session.exec(update(ChatMessage).where(ChatMessage.id == message_id).values(**values))
+
+        # Keep the sessions' history snapshots current (writes always touch the session row)
+        now = utc_now()
+        for session_id in {row.session_id for row in rows}:
+            await self.session.exec(update(ChatSession).where(ChatSession.id == session_id).values(updated_at=now))
+            session_updates = {row.id: updates[row.id] for row in rows if row.session_id == session_id}
+            await SessionSnapshotService(self.session).patch(session_id, now, fields=session_updates)
+        await self.session.commit()
+
     async def get_history(self, session_id: int):
         statement = select(ChatMessage).where(ChatMessage.session_id == session_id).order_by(ChatMessage.created_at)
         result = await self.session.exec(statement)
-        return result.all()
+        messages = result.all()
+        await ArtifactService(self.session).unpack_messages(messages)
+        return messages
+
+    async def get_sessions_page(self, limit: int, cursor: str | None = None) -> tuple[list[ChatSession], str | None]:
+        """Most recently updated sessions first, keyset-paginated over (updated_at, id)."""
+        statement = select(ChatSession).order_by(ChatSession.updated_at.desc(), ChatSession.id.desc())
+        if cursor:
+            updated_at, session_id = decode_cursor(cursor)
+            statement = statement.where(tuple_(ChatSession.updated_at, ChatSession.id) < tuple_(updated_at, session_id))
+        result = await self.session.exec(statement.limit(limit + 1))
+        sessions = list(result.all())
+
+        next_cursor = None
+        if len(sessions) > limit:
+            sessions = sessions[:limit]
+            next_cursor = encode_cursor(sessions[-1].updated_at, sessions[-1].id)
+        return sessions, next_cursor
+
+    async def get_messages_page(self, session_id: int, limit: int, cursor: str | None = None) -> tuple[list[dict], str | None]:
+        """
+        Oldest messages first, keyset-paginated over (created_at, id). Only the summary columns
+        are selected; steps, images, files and file_context are loaded per message via get_message.
+        """
+        statement = (
+            select(*MESSAGE_SUMMARY_COLUMNS)
+            .where(ChatMessage.session_id == session_id)
+            .order_by(ChatMessage.created_at, ChatMessage.id)
+        )
+        if cursor:
+            created_at, message_id = decode_cursor(cursor)
+            statement = statement.where(tuple_(ChatMessage.created_at, ChatMessage.id) > tuple_(created_at, message_id))
+        result = await self.session.exec(statement.limit(limit + 1))
+        rows = list(result.all())
 
-    async def get_all_sessions(self):
-        statement = select(ChatSession).order_by(ChatSession.updated_at.desc())
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = encode_cursor(rows[-1].created_at, rows[-1].id)
+
+        messages = []
+        for row in rows:
+            message = dict(row._mapping)
+            message["created_at"] = to_utc_iso(message["created_at"])
+            messages.append(message)
+        return messages, next_cursor
+
+    async def get_message(self, message_id: int) -> ChatMessage | None:
+        statement = select(ChatMessage).where(ChatMessage.id == message_id)
         result = await self.session.exec(statement)
-        return result.all()
+        message = result.first()
+        if message:
+            await ArtifactService(self.session).unpack_messages([message])
+        return message
 
     async def delete_session(self, session_id: int):
         # SQLModel/SQLAlchemy will handle cascade if configured, but let's be safe or just delete session
@@ -95,12 +254,24 @@ class ChatService:
         
         from sqlmodel import delete
         
-        # Delete messages
-        msg_statement = delete(ChatMessage).where(ChatMessage.session_id == session_id)
-        await self.session.exec(msg_statement)
+        archive_key = (await self.session.exec(
+            select(ChatSession.archive_key).where(ChatSession.id == session_id)
+        )).first()
+        await SessionSnapshotService(self.session).delete(session_id)
+        await self.session.commit()
+
+        # Delete search documents, messages and artifact revisions (they reference the session)
+        # in bounded batches, so a large session doesn't hold its locks for one long transaction
+        await ArchiveService(self.session).delete_rows(
+            session_id, [SearchDocument.__table__, ChatMessage.__table__, ArtifactRevision.__table__]
+        )
         
         # Delete session
         sess_statement = delete(ChatSession).where(ChatSession.id == session_id)
         await self.session.exec(sess_statement)
         
         await self.session.commit()
+
+        # An archived session's rows live in its archive blob
+        if archive_key:
+            await ArchiveService(self.session).delete_archive(session_id, archive_key)
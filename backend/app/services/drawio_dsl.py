@@ -0,0 +1,345 @@
+"""
+Compact diagram DSL for the Draw.io agent, expanded server-side into mxGraph XML.
+
+The model writes only structure and semantics, one statement per line:
+
+    direction LR
+    group vpc: AWS VPC [cloud] {
+      api: API Gateway [gateway]
+      svc: Order Service [service]
+    }
+    db: Orders DB [database]
+    users: Customers [user]
+    users -> api: HTTPS
+    api -> svc -> db
+    svc --> db: async        (dashed; <-> for both directions)
+
+Style strings, geometry and container sizes come from STYLE_PRESETS and layered_layout(), so
+none of that boilerplate is generated token by token. Parsing is lenient: unknown lines are
+skipped, nodes first named in an edge are created on the fly and groups left open at the end are
+closed, which also makes every prefix of a streaming document expandable.
+"""
+import re
+from dataclasses import dataclass, field
+from html import escape
+from typing import Dict, List, Set, Tuple
+from app.services.layout import layered_layout
+
+ID = r"[\w.-]+"
+GROUP_PATTERN = re.compile(rf"^group\s+({ID})\s*(?::\s*(.*?))?\s*(?:\[([\w-]+)\])?\s*\{{$", re.IGNORECASE)
+NODE_PATTERN = re.compile(rf"^({ID})\s*(?::\s*(.*?))?\s*(?:\[([\w-]+)\])?$")
+EDGE_PATTERN = re.compile(rf"^({ID}(?:\s*(?:<->|-->|->)\s*{ID})+)\s*(?::\s*(.*))?$")
+ARROW_PATTERN = re.compile(r"\s*(<->|-->|->)\s*")
+DIRECTION_PATTERN = re.compile(r"^direction\s*:?\s*(TB|LR)$", re.IGNORECASE)
+LEADING_FENCE_PATTERN = re.compile(r"^\s*(?:```[\w-]*\s*)?")
+
+# (style, width, height) per component kind; the palette follows DRAWIO_SYSTEM_PROMPT
+BOX = "rounded=1;whiteSpace=wrap;html=1;shadow=1;"
+STYLE_PRESETS: Dict[str, Tuple[str, int, int]] = {
+    "service": (BOX + "fillColor=#d5e8d4;strokeColor=#82b366;", 140, 60),
+    "user": ("shape=umlActor;verticalLabelPosition=bottom;verticalAlign=top;html=1;outlineConnect=0;fillColor=#dae8fc;strokeColor=#6c8ebf;", 40, 60),
+    "frontend": (BOX + "fillColor=#dae8fc;strokeColor=#6c8ebf;", 140, 60),
+    "mobile": (BOX + "arcSize=20;fillColor=#dae8fc;strokeColor=#6c8ebf;", 80, 110),
+    "gateway": ("shape=hexagon;perimeter=hexagonPerimeter2;size=0.15;whiteSpace=wrap;html=1;shadow=1;fillColor=#d5e8d4;strokeColor=#82b366;", 150, 70),
+    "function": (BOX + "arcSize=40;fillColor=#d5e8d4;strokeColor=#82b366;fontStyle=2;", 130, 60),
+    "loadbalancer": ("ellipse;whiteSpace=wrap;html=1;shadow=1;fillColor=#e1d5e7;strokeColor=#9673a6;", 140, 70),
+    "database": ("shape=cylinder3;whiteSpace=wrap;html=1;boundedLbl=1;backgroundOutline=1;size=15;shadow=1;fillColor=#ffe6cc;strokeColor=#d79b00;", 110, 90),
+    "cache": ("shape=cylinder3;whiteSpace=wrap;html=1;boundedLbl=1;backgroundOutline=1;size=15;shadow=1;fillColor=#fff2cc;strokeColor=#d6b656;", 110, 90),
+    "storage": ("shape=document;whiteSpace=wrap;html=1;boundedLbl=1;shadow=1;fillColor=#fff2cc;strokeColor=#d6b656;", 130, 80),
+    "queue": ("shape=process;whiteSpace=wrap;html=1;backgroundOutline=1;shadow=1;fillColor=#ffe6cc;strokeColor=#d79b00;", 150, 60),
+    "cloud": ("ellipse;shape=cloud;whiteSpace=wrap;html=1;shadow=1;fillColor=#e1d5e7;strokeColor=#9673a6;", 150, 90),
+    "security": (BOX + "fillColor=#f8cecc;strokeColor=#b85450;", 140, 60),
+    "monitoring": (BOX + "fillColor=#f5f5f5;strokeColor=#666666;fontColor=#333333;", 140, 60),
+    "external": (BOX + "dashed=1;fillColor=#f5f5f5;strokeColor=#607D8B;fontColor=#333333;", 140, 60),
+    "decision": ("rhombus;whiteSpace=wrap;html=1;shadow=1;fillColor=#fff2cc;strokeColor=#d6b656;", 130, 80),
+    "terminal": (BOX + "arcSize=50;fillColor=#f5f5f5;strokeColor=#666666;", 120, 50),
+    "note": ("shape=note;whiteSpace=wrap;html=1;size=14;fillColor=#fff2cc;strokeColor=#d6b656;", 150, 70),
+}
+KIND_ALIASES = {
+    "api": "service", "backend": "service", "compute": "service", "server": "service", "app": "service",
+    "microservice": "service", "container": "service", "worker": "service",
+    "client": "user", "actor": "user", "person": "user", "users": "user",
+    "web": "frontend", "ui": "frontend", "browser": "frontend", "spa": "frontend", "phone": "mobile",
+    "lambda": "function", "serverless": "function", "fn": "function",
+    "lb": "loadbalancer", "alb": "loadbalancer", "elb": "loadbalancer", "proxy": "loadbalancer", "ingress": "loadbalancer",
+    "db": "database", "sql": "database", "nosql": "database", "warehouse": "database",
+    "redis": "cache", "memcached": "cache", "bucket": "storage", "s3": "storage", "blob": "storage", "file": "storage",
+    "topic": "queue", "stream": "queue", "kafka": "queue", "bus": "queue", "broker": "queue",
+    "cdn": "cloud", "dns": "cloud", "internet": "cloud", "network": "cloud",
+    "auth": "security", "iam": "security", "firewall": "security", "waf": "security",
+    "logging": "monitoring", "metrics": "monitoring", "observability": "monitoring",
+    "thirdparty": "external", "saas": "external", "start": "terminal", "end": "terminal",
+}
+
+GROUP_STYLE = "swimlane;whiteSpace=wrap;html=1;startSize=30;rounded=1;arcSize=4;collapsible=0;fontStyle=1;"
+GROUP_COLORS = {
+    "default": "fillColor=#f8f9fa;strokeColor=#999999;",
+    "cloud": "dashed=1;fillColor=#f5effa;strokeColor=#9673a6;",
+    "frontend": "fillColor=#f0f6fd;strokeColor=#6c8ebf;",
+    "backend": "fillColor=#f3f9f1;strokeColor=#82b366;",
+    "data": "fillColor=#fff8ef;strokeColor=#d79b00;",
+    "security": "dashed=1;fillColor=#fdf3f2;strokeColor=#b85450;",
+}
+GROUP_ALIASES = {
+    "vpc": "cloud", "region": "cloud", "subnet": "cloud", "network": "cloud", "zone": "cloud", "cluster": "cloud",
+    "ui": "frontend", "client": "frontend", "service": "backend", "services": "backend", "app": "backend",
+    "storage": "data", "database": "data", "auth": "security",
+}
+EDGE_STYLE = "edgeStyle=orthogonalEdgeStyle;rounded=1;orthogonalLoop=1;jettySize=auto;html=1;strokeWidth=2;strokeColor=#666666;endArrow=classic;"
+
+GROUP_TITLE = 30
+GROUP_PADDING = 20
+PAGE_MARGIN = 40
+MAX_LABEL_WIDTH = 240
+# Roughly the width of one character at the default font size
+CHAR_WIDTH = 7
+
+
+@dataclass
+class DslNode:
+    id: str
+    label: str
+    kind: str = "service"
+    group: str | None = None
+    declared: bool = False
+
+
+@dataclass
+class DslGroup:
+    id: str
+    label: str
+    kind: str = "default"
+    parent: str | None = None
+    children: List[str] = field(default_factory=list)
+
+
+@dataclass
+class DslEdge:
+    source: str
+    target: str
+    label: str = ""
+    dashed: bool = False
+    both: bool = False
+
+
+@dataclass
+class DrawioDiagram:
+    direction: str = "TB"
+    nodes: Dict[str, DslNode] = field(default_factory=dict)
+    groups: Dict[str, DslGroup] = field(default_factory=dict)
+    edges: List[DslEdge] = field(default_factory=list)
+    # Top-level node and group ids, in declaration order
+    children: List[str] = field(default_factory=list)
+
+
+def is_drawio_dsl(code: str) -> bool | None:
+    """
+    Compact DSL rather than mxGraph XML (which the model may still emit, e.g. when editing an
+    older diagram); None while `code` is too short to tell.
+    """
+    rest = code[LEADING_FENCE_PATTERN.match(code).end():]
+    if not rest or rest.startswith("`"):
+        return None
+    return not rest.startswith("<")
+
+
+def node_kind(kind: str | None) -> str:
+    kind = (kind or "").lower()
+    return kind if kind in STYLE_PRESETS else KIND_ALIASES.get(kind, "service")
+
+
+def group_kind(kind: str | None) -> str:
+    kind = (kind or "").lower()
+    return kind if kind in GROUP_COLORS else GROUP_ALIASES.get(kind, "default")
+
+
+def parse_drawio_dsl(text: str) -> DrawioDiagram:
+    diagram = DrawioDiagram()
+    open_groups: List[str] = []
+
+    def add_child(child_id: str, group_id: str | None):
+        (diagram.groups[group_id].children if group_id else diagram.children).append(child_id)
+
+    def reference(node_id: str) -> str:
+        if node_id not in diagram.nodes and node_id not in diagram.groups:
+            # Named in an edge before (or without) its declaration: created where it is used
+            group_id = open_groups[-1] if open_groups else None
+            diagram.nodes[node_id] = DslNode(id=node_id, label=node_id, group=group_id)
+            add_child(node_id, group_id)
+        return node_id
+
+    for raw in text.splitlines():
+        line = raw.strip()
+        if not line or line.startswith(("#", "//", "```")):
+            continue
+        if line == "}":
+            if open_groups:
+                open_groups.pop()
+            continue
+        if match := DIRECTION_PATTERN.match(line):
+            diagram.direction = match.group(1).upper()
+        elif match := GROUP_PATTERN.match(line):
+            group_id, label, kind = match.groups()
+            if group_id in diagram.groups or group_id in diagram.nodes:
+                continue
+            parent = open_groups[-1] if open_groups else None
+            diagram.groups[group_id] = DslGroup(id=group_id, label=label or group_id, kind=group_kind(kind), parent=parent)
+            add_child(group_id, parent)
+            open_groups.append(group_id)
+        elif match := EDGE_PATTERN.match(line):
+            chain, label = match.groups()
+            parts = ARROW_PATTERN.split(chain)
+            for i in range(0, len(parts) - 2, 2):
+                arrow = parts[i + 1]
+                diagram.edges.append(DslEdge(
+                    source=reference(parts[i]), target=reference(parts[i + 2]), label=(label or "").strip(),
+                    dashed=arrow == "-->", both=arrow == "<->",
+                ))
+        elif match := NODE_PATTERN.match(line):
+            node_id, label, kind = match.groups()
+            if node_id in diagram.groups:
+                continue
+            node = diagram.nodes.get(node_id)
+            if node is None:
+                node = diagram.nodes[node_id] = DslNode(id=node_id, label=node_id, group=open_groups[-1] if open_groups else None)
+                add_child(node_id, node.group)
+            elif not node.declared and open_groups and node.group != open_groups[-1]:
+                # A forward reference created it elsewhere; the declaration decides its group
+                siblings = diagram.groups[node.group].children if node.group else diagram.children
+                siblings.remove(node_id)
+                node.group = open_groups[-1]
+                add_child(node_id, node.group)
+            node.label = label or node.label
+            node.kind = node_kind(kind) if kind or not node.declared else node.kind
+            node.declared = True
+    return diagram
+
+
+def node_size(node: DslNode) -> Tuple[int, int]:
+    _, width, height = STYLE_PRESETS[node.kind]
+    if node.kind != "user":
+        longest = max((len(line) for line in node.label.split("\\n")), default=0)
+        width = max(width, min(MAX_LABEL_WIDTH, longest * CHAR_WIDTH + 24))
+    return width, height
+
+
+def cell_value(label: str) -> str:
+    # Labels are html=1: "\n" in the DSL becomes a line break
+    return escape("<br>".join(escape(part, quote=False) for part in label.split("\\n")), quote=True)
+
+
+def unique_id(candidate: str, used: Set[str]) -> str:
+    """candidate, or candidate-2, -3, ... if taken; the result is added to `used`."""
+    cell_id, suffix = candidate, 1
+    while cell_id in used:
+        suffix += 1
+        cell_id = f"{candidate}-{suffix}"
+    used.add(cell_id)
+    return cell_id
+
+
+class DrawioExpander:
+    """Lays out a parsed diagram (each group as one block of its parent) and renders the XML."""
+
+    def __init__(self, diagram: DrawioDiagram):
+        self.diagram = diagram
+        self.geometry: Dict[str, Tuple[float, float, float, float]] = {}
+        # Node and group names are the cell ids, except "0" and "1" (the root cells); generated
+        # ids (those and the edges') skip anything already taken
+        items = [*diagram.groups, *diagram.nodes]
+        self.used_ids = {"0", "1", *items}
+        self.cell_ids: Dict[str, str] = {
+            item: (unique_id(f"n-{item}", self.used_ids) if item in ("0", "1") else item) for item in items
+        }
+
+    def _path(self, item: str) -> List[str | None]:
+        path = [item]
+        parent = self.diagram.nodes[item].group if item in self.diagram.nodes else self.diagram.groups[item].parent
+        while parent:
+            path.append(parent)
+            parent = self.diagram.groups[parent].parent
+        path.append(None)
+        return path[::-1]
+
+    def _edges_by_container(self) -> Dict[str | None, List[Tuple[str, str]]]:
+        """Every edge as an edge between the two children of the innermost group holding both ends."""
+        lifted: Dict[str | None, List[Tuple[str, str]]] = {}
+        for edge in self.diagram.edges:
+            source, target = self._path(edge.source), self._path(edge.target)
+            common = 0
+            while common < min(len(source), len(target)) and source[common] == target[common]:
+                common += 1
+            if common < len(source) and common < len(target):
+                lifted.setdefault(source[common - 1], []).append((source[common], target[common]))
+        return lifted
+
+    def _block(self, container: str | None, edges: Dict[str | None, List[Tuple[str, str]]]) -> Tuple[float, float]:
+        """Lays out the children of `container` (positions relative to it) and returns its inner size."""
+        children = self.diagram.groups[container].children if container else self.diagram.children
+        sizes = {}
+        for child in children:
+            if child in self.diagram.groups:
+                width, height = self._block(child, edges)
+                sizes[child] = (max(width + 2 * GROUP_PADDING, 160), height + GROUP_TITLE + 2 * GROUP_PADDING)
+            else:
+                sizes[child] = node_size(self.diagram.nodes[child])
+        layout = layered_layout(sizes, edges.get(container, []), direction=self.diagram.direction)
+        for child, (x, y) in layout.positions.items():
+            self.geometry[child] = (x, y, *sizes[child])
+        return layout.width, layout.height
+
+    def _offset(self, container: str | None) -> Tuple[float, float]:
+        return (GROUP_PADDING, GROUP_TITLE + GROUP_PADDING) if container else (PAGE_MARGIN, PAGE_MARGIN)
+
+    def to_xml(self) -> str:
+        width, height = self._block(None, self._edges_by_container())
+        cells = ['        <mxCell id="0" />', '        <mxCell id="1" parent="0" />']
+
+        def emit(container: str | None):
+            children = self.diagram.groups[container].children if container else self.diagram.children
+            dx, dy = self._offset(container)
+            parent = self.cell_ids[container] if container else "1"
+            for child in children:
+                x, y, w, h = self.geometry[child]
+                if child in self.diagram.groups:
+                    group = self.diagram.groups[child]
+                    style, value = GROUP_STYLE + GROUP_COLORS[group.kind], cell_value(group.label)
+                else:
+                    node = self.diagram.nodes[child]
+                    style, value = STYLE_PRESETS[node.kind][0], cell_value(node.label)
+                cells.append(
+                    f'        <mxCell id="{escape(self.cell_ids[child])}" value="{value}" style="{style}" vertex="1" parent="{escape(parent)}">\n'
+                    f'          <mxGeometry x="{x + dx:g}" y="{y + dy:g}" width="{w:g}" height="{h:g}" as="geometry" />\n'
+                    f'        </mxCell>'
+                )
+                if child in self.diagram.groups:
+                    emit(child)
+
+        emit(None)
+        used_ids = set(self.used_ids)
+        for i, edge in enumerate(self.diagram.edges, start=1):
+            style = EDGE_STYLE + ("dashed=1;" if edge.dashed else "") + ("startArrow=classic;" if edge.both else "")
+            value = f' value="{cell_value(edge.label)}"' if edge.label else ""
+            cells.append(
+                f'        <mxCell id="{escape(unique_id(f"e{i}", used_ids))}"{value} style="{style}" edge="1" parent="1" '
+                f'source="{escape(self.cell_ids[edge.source])}" target="{escape(self.cell_ids[edge.target])}">\n'
+                f'          <mxGeometry relative="1" as="geometry" />\n'
+                f'        </mxCell>'
+            )
+
+        page_width, page_height = width + 2 * PAGE_MARGIN, height + 2 * PAGE_MARGIN
+        return (
+            '<mxfile host="app.diagrams.net">\n'
+            '  <diagram name="Page-1">\n'
+            f'    <mxGraphModel dx="{page_width:g}" dy="{page_height:g}" grid="1" gridSize="10" guides="1" tooltips="1" '
+            f'connect="1" arrows="1" fold="1" page="1" pageScale="1" pageWidth="{max(page_width, 827):g}" '
+            f'pageHeight="{max(page_height, 1169):g}">\n'
+            '      <root>\n' + "\n".join(cells) + '\n      </root>\n'
+            '    </mxGraphModel>\n'
+            '  </diagram>\n'
+            '</mxfile>'
+        )
+
+
+def expand_drawio_dsl(text: str) -> str:
+    return DrawioExpander(parse_drawio_dsl(text)).to_xml()
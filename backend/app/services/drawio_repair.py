@@ -0,0 +1,259 @@
+import re
+import xml.etree.ElementTree as ET
+from dataclasses import dataclass, field
+from typing import Dict, List
+
+TAG_NAME_PATTERN = re.compile(r"</?\s*([\w:.-]+)")
+TAG_SCAN_PATTERN = re.compile(r"[>\"']")
+ATTRIBUTE_PATTERN = re.compile(r"(?<=\s)([\w:.-]+)\s*=\s*(\"[^\"]*\"|'[^']*')")
+
+# Markup whose end is a fixed delimiter rather than '>' outside quotes
+DELIMITED_TOKENS = (("<!--", "-->"), ("<![CDATA[", "]]>"), ("<?", "?>"))
+DRAWIO_ROOTS = ("mxfile", "mxGraphModel")
+# Cells with custom properties: the wrapper carries the id, its inner mxCell has none
+CELL_WRAPPERS = ("object", "UserObject")
+
+REPAIR_MESSAGES = {
+    "array_removed": "Removed {count} <Array> waypoint list(s)",
+    "duplicate_id": "Renamed {count} duplicate cell id(s)",
+    "missing_id": "Added an id to {count} cell(s)",
+    "dangling_reference": "Dropped {count} edge source/target reference(s) to missing cells",
+    "stray_end_tag": "Dropped {count} end tag(s) without a matching start tag",
+    "unclosed_tag": "Closed {count} unclosed tag(s)",
+    "truncated_tag": "Dropped a truncated tag at the end of the output",
+}
+
+
+@dataclass
+class RepairResult:
+    xml: str
+    # [{"kind", "count", "message", "examples"}], in REPAIR_MESSAGES order
+    diagnostics: List[Dict] = field(default_factory=list)
+
+
+class DrawioRepairer:
+    """
+    Validates and repairs Draw.io (mxGraph) XML as it streams in, in a single pass: each chunk is
+    tokenized once and only an incomplete trailing tag is carried over to the next feed().
+
+    Repairs: <Array> elements are dropped, duplicate or missing cell ids (on mxCell, or on the
+    <object>/<UserObject> wrapping one) are made unique, end tags are matched against the open
+    elements (closing the ones left open, dropping strays), and on finish() a truncated last tag
+    is dropped, open elements are closed, and edge source/target references to cells that never
+    appeared are removed. Output that has no <mxfile> or <mxGraphModel> root is returned unchanged.
+    """
+
+    def __init__(self):
+        self.received = 0
+        self._source: List[str] = []
+        self._pending = ""
+        # Where the scan of the pending (incomplete) token stopped, and the quote it is inside
+        self._resume: tuple[int, str | None] | None = None
+        self._parts: List[str] = []
+        self._stack: List[str] = []
+        self._skip_depth = 0
+        self._ids: set[str] = set()
+        # (index in _parts, attribute, cell id) of edge references, checked once every cell is known
+        self._references: List[tuple[int, str, str]] = []
+        self._counts: Dict[str, int] = {}
+        self._examples: Dict[str, List[str]] = {}
+        self._is_drawio = False
+
+    def feed(self, chunk: str):
+        if not chunk:
+            return
+        self.received += len(chunk)
+        self._source.append(chunk)
+        data = self._pending + chunk if self._pending else chunk
+        position, length = 0, len(data)
+        while position < length:
+            if data[position] != "<":
+                next_tag = data.find("<", position)
+                end = length if next_tag == -1 else next_tag
+                self._text(data[position:end])
+                position = end
+                continue
+            end = self._token_end(data, position)
+            if end == -1:
+                break
+            self._resume = None
+            self._token(data[position:end])
+            position = end
+        self._pending = data[position:]
+
+    def finish(self) -> RepairResult:
+        if not self._is_drawio:
+            return RepairResult(xml="".join(self._source))
+        if self._pending.strip():
+            self._note("truncated_tag", self._pending[:40])
+        self._pending = ""
+        while self._stack:
+            name = self._stack.pop()
+            self._parts.append(f"</{name}>")
+            self._note("unclosed_tag", name)
+
+        for index, name, value in self._references:
+            if value not in self._ids:
+                self._parts[index] = self._remove_attribute(self._parts[index], name)
+                self._note("dangling_reference", f"{name}={value}")
+
+        diagnostics = [
+            {"kind": kind, "count": self._counts[kind], "message": message.format(count=self._counts[kind]),
+             "examples": self._examples[kind]}
+            for kind, message in REPAIR_MESSAGES.items() if kind in self._counts
+        ]
+        return RepairResult(xml="".join(self._parts), diagnostics=diagnostics)
+
+    def snapshot(self) -> str | None:
+        """
+        The document received so far, repaired as finish() would but without consuming the
+        repairer: None until it has a cell beyond the two root cells or while it doesn't parse.
+        """
+        if not self._is_drawio or len(self._ids) < 3:
+            return None
+        parts = list(self._parts)
+        for index, name, value in self._references:
+            if value not in self._ids:
+                parts[index] = self._remove_attribute(parts[index], name)
+        parts.extend(f"</{name}>" for name in reversed(self._stack))
+        xml = "".join(parts)
+        try:
+            ET.fromstring(xml)
+        except ET.ParseError:
+            return None
+        return xml
+
+    def _note(self, kind: str, example: str):
+        self._counts[kind] = self._counts.get(kind, 0) + 1
+        examples = self._examples.setdefault(kind, [])
+        if len(examples) < 5:
+            examples.append(example)
+
+    def _token_end(self, data: str, start: int) -> int:
+        """Index just past the token starting at `start`, or -1 if it is not complete yet."""
+        if start + 1 == len(data):
+            return -1
+        if data[start + 1] in "!?":
+            rest = data[start:start + 9]
+            for opener, closer in DELIMITED_TOKENS:
+                if rest.startswith(opener):
+                    scan_from = self._resume[0] if self._resume else len(opener)
+                    end = data.find(closer, start + scan_from)
+                    if end == -1:
+                        self._resume = (max(len(opener), len(data) - start - len(closer) + 1), None)
+                        return -1
+                    return end + len(closer)
+                if len(rest) < len(opener) and opener.startswith(rest):
+                    return -1  # can't tell which kind of token this is yet
+        elif self._resume is None:
+            # Common case: the first '>' ends the tag unless it is inside a quoted value
+            end = data.find(">", start)
+            if end != -1:
+                double, single = data.count('"', start, end), data.count("'", start, end)
+                if (not single and double % 2 == 0) or (not double and single % 2 == 0):
+                    return end + 1
+
+        position, quote = self._resume if self._resume else (1, None)
+        position += start
+        while True:
+            if quote:
+                end = data.find(quote, position)
+                if end == -1:
+                    self._resume = (len(data) - start, quote)
+                    return -1
+                position, quote = end + 1, None
+                continue
+            match = TAG_SCAN_PATTERN.search(data, position)
+            if not match:
+                self._resume = (len(data) - start, None)
+                return -1
+            if match.group() == ">":
+                return match.end()
+            position, quote = match.end(), match.group()
+
+    def _text(self, text: str):
+        if not self._skip_depth:
+            self._parts.append(text)
+
+    def _token(self, token: str):
+        if token.startswith("<!") or token.startswith("<?"):
+            self._text(token)
+            return
+        match = TAG_NAME_PATTERN.match(token)
+        name = match.group(1) if match else ""
+        if token.startswith("</"):
+            self._end_tag(name, token)
+            return
+
+        self_closing = token.endswith("/>")
+        if self._skip_depth:
+            self._skip_depth += int(not self_closing)
+            return
+        if name == "Array":
+            self._note("array_removed", token[:60])
+            self._skip_depth = int(not self_closing)
+            # Also drop the indentation in front of it
+            while self._parts and not self._parts[-1].strip():
+                self._parts.pop()
+            return
+        if name in DRAWIO_ROOTS:
+            self._is_drawio = True
+        elif name in CELL_WRAPPERS:
+            token = self._cell(token)
+        elif name == "mxCell":
+            token = self._cell(token, wrapped=bool(self._stack) and self._stack[-1] in CELL_WRAPPERS)
+        self._parts.append(token)
+        if not self_closing:
+            self._stack.append(name)
+
+    def _end_tag(self, name: str, token: str):
+        if self._skip_depth:
+            self._skip_depth -= 1
+            return
+        if name not in self._stack:
+            self._note("stray_end_tag", token)
+            return
+        while self._stack[-1] != name:
+            unclosed = self._stack.pop()
+            self._parts.append(f"</{unclosed}>")
+            self._note("unclosed_tag", unclosed)
+        self._stack.pop()
+        self._parts.append(token)
+
+    def _cell(self, token: str, wrapped: bool = False) -> str:
+        attributes = {key: value[1:-1] for key, value in ATTRIBUTE_PATTERN.findall(token)}
+        # The id of a wrapped mxCell is its wrapper's; giving it one would override the wrapper's
+        if not wrapped:
+            token = self._unique_id(token, attributes.get("id"))
+        for name in ("source", "target"):
+            if name in attributes:
+                self._references.append((len(self._parts), name, attributes[name]))
+        return token
+
+    def _unique_id(self, token: str, cell_id: str | None) -> str:
+        if cell_id is None or cell_id in self._ids:
+            base = cell_id if cell_id is not None else "cell"
+            new_id, suffix = base, 2
+            while new_id in self._ids:
+                new_id, suffix = f"{base}-{suffix}", suffix + 1
+            if cell_id is None:
+                self._note("missing_id", new_id)
+            else:
+                self._note("duplicate_id", f"{cell_id} -> {new_id}")
+                token = self._remove_attribute(token, "id")
+            name_end = TAG_NAME_PATTERN.match(token).end()
+            token = f'{token[:name_end]} id="{new_id}"{token[name_end:]}'
+            cell_id = new_id
+        self._ids.add(cell_id)
+        return token
+
+    @staticmethod
+    def _remove_attribute(token: str, name: str) -> str:
+        return re.sub(rf"\s+{re.escape(name)}\s*=\s*(\"[^\"]*\"|'[^']*')", "", token, count=1)
+
+
+def repair_drawio_xml(xml: str) -> RepairResult:
+    """One-shot repair of a complete (or truncated) document."""
+    repairer = DrawioRepairer()
+    repairer.feed(xml)
+    return repairer.finish()
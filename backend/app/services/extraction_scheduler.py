@@ -0,0 +1,185 @@
+import asyncio
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import Callable, Deque, Dict, List
+from app.core.config import settings
+from app.core.logger import logger
+
+
+class _Waiter:
+    __slots__ = ("user", "future", "on_position", "position")
+
+    def __init__(self, user: str, future: asyncio.Future, on_position: Callable[[int], None] | None):
+        self.user = user
+        self.future = future
+        self.on_position = on_position
+        self.position = 0
+
+
+class ExtractionSlot:
+    """Handle for one granted worker slot; records the signals used by adaptive mode."""
+
+    def __init__(self):
+        self.start = time.monotonic()
+        self.first_token_latency: float | None = None
+        self.error = False
+
+    def mark_first_token(self):
+        if self.first_token_latency is None:
+            self.first_token_latency = time.monotonic() - self.start
+
+    def mark_error(self):
+        self.error = True
+
+
+class ExtractionScheduler:
+    """
+    Process-wide limiter for document-extraction LLM calls.
+
+    All requests share a global worker budget. Waiting calls are queued per user and
+    granted round-robin across users, so one large upload cannot starve everybody else.
+    In adaptive mode the budget is tuned AIMD-style from the provider's time-to-first-token
+    and error rate, between EXTRACTION_MIN_WORKERS and EXTRACTION_MAX_WORKERS.
+    """
+
+    # Adaptive tuning: back off when latency exceeds this multiple of the best observed latency
+    LATENCY_FACTOR = 2.0
+    EWMA_ALPHA = 0.3
+    ERROR_BACKOFF = 0.7
+    BASELINE_DRIFT = 1.05
+
+    def __init__(self, max_workers: int, adaptive: bool = False, min_workers: int = 1):
+        self.max_workers = max(1, max_workers)
+        self.min_workers = max(1, min(min_workers, self.max_workers))
+        self.adaptive = adaptive
+        self.limit = self.max_workers
+        self.active = 0
+        self.queues: "OrderedDict[str, Deque[_Waiter]]" = OrderedDict()
+
+        self.latency_ewma: float | None = None
+        self.latency_baseline: float | None = None
+        self.successes_since_change = 0
+
+    @property
+    def waiting(self) -> int:
+        return sum(len(q) for q in self.queues.values())
+
+    def snapshot(self) -> Dict[str, float | int | None]:
+        return {
+            "limit": self.limit,
+            "active": self.active,
+            "waiting": self.waiting,
+            "latency_ewma": self.latency_ewma,
+        }
+
+    @asynccontextmanager
+    async def slot(self, user: str, on_position: Callable[[int], None] | None = None):
+        """Waits for a worker slot. on_position(n) is called whenever the 1-based queue position changes."""
+        await self._acquire(user, on_position)
+        slot = ExtractionSlot()
+        try:
+            yield slot
+        finally:
+            self._release(slot)
+
+    async def _acquire(self, user: str, on_position: Callable[[int], None] | None):
+        if self.active < self.limit and not self.queues:
+            self.active += 1
+            return
+
+        waiter = _Waiter(user, asyncio.get_running_loop().create_future(), on_position)
+        self.queues.setdefault(user, deque()).append(waiter)
+        self._notify_positions()
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            if waiter.future.done() and not waiter.future.cancelled():
+                # Slot was granted just before we got cancelled: hand it back
+                self.active -= 1
+                self._grant_next()
+            else:
+                self._remove(waiter)
+            raise
+
+    def _remove(self, waiter: _Waiter):
+        queue = self.queues.get(waiter.user)
+        if queue and waiter in queue:
+            queue.remove(waiter)
+            if not queue:
+                del self.queues[waiter.user]
+            self._notify_positions()
+
+    def _release(self, slot: ExtractionSlot):
+        self.active -= 1
+        if self.adaptive:
+            self._tune(slot)
+        self._grant_next()
+
+    def _grant_next(self):
+        granted = False
+        while self.active < self.limit and self.queues:
+            user, queue = next(iter(self.queues.items()))
+            waiter = queue.popleft()
+            # Round-robin: this user goes to the back of the rotation
+            if queue:
+                self.queues.move_to_end(user)
+            else:
+                del self.queues[user]
+            if waiter.future.done():
+                continue
+            self.active += 1
+            waiter.future.set_result(None)
+            granted = True
+        if granted:
+            self._notify_positions()
+
+    def _round_robin_order(self) -> List[_Waiter]:
+        order = []
+        queues = list(self.queues.values())
+        depth = max((len(q) for q in queues), default=0)
+        for i in range(depth):
+            order.extend(q[i] for q in queues if i < len(q))
+        return order
+
+    def _notify_positions(self):
+        for position, waiter in enumerate(self._round_robin_order(), start=1):
+            if waiter.position != position:
+                waiter.position = position
+                if waiter.on_position:
+                    waiter.on_position(position)
+
+    def _tune(self, slot: ExtractionSlot):
+        previous = self.limit
+        if slot.error:
+            self.limit = max(self.min_workers, int(self.limit * self.ERROR_BACKOFF))
+            self.successes_since_change = 0
+        elif slot.first_token_latency is not None:
+            latency = slot.first_token_latency
+            self.latency_ewma = latency if self.latency_ewma is None else (
+                self.EWMA_ALPHA * latency + (1 - self.EWMA_ALPHA) * self.latency_ewma
+            )
+            # The baseline drifts up slowly so a permanently slower provider is eventually accepted
+            if self.latency_baseline is None:
+                self.latency_baseline = self.latency_ewma
+            self.latency_baseline = min(self.latency_ewma, self.latency_baseline * self.BASELINE_DRIFT)
+
+            if self.latency_ewma > self.latency_baseline * self.LATENCY_FACTOR:
+                self.limit = max(self.min_workers, self.limit - 1)
+                self.successes_since_change = 0
+            else:
+                # Additive increase: one extra worker per `limit` healthy calls
+                self.successes_since_change += 1
+                if self.successes_since_change >= self.limit:
+                    self.limit = min(self.max_workers, self.limit + 1)
+                    self.successes_since_change = 0
+
+        if self.limit != previous:
+            logger.info(f"⚙️ Extraction concurrency {previous} -> {self.limit} ({self.snapshot()})")
+
+
+extraction_scheduler = ExtractionScheduler(
+    max_workers=settings.EXTRACTION_MAX_WORKERS,
+    adaptive=settings.EXTRACTION_ADAPTIVE,
+    min_workers=settings.EXTRACTION_MIN_WORKERS,
+)
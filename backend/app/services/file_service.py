@@ -1,20 +1,34 @@
 import base64
 import io
 import asyncio
+from contextlib import aclosing
 from typing import List, Dict, Any, Callable, AsyncGenerator
-import fitz  # PyMuPDF
-import pandas as pd
 from docx import Document
 from pptx import Presentation
 from app.core.llm import get_llm
 from langchain_core.messages import SystemMessage, HumanMessage
 from app.core.logger import logger
+from app.services.spreadsheet_service import SPREADSHEET_EXTENSIONS, profile_spreadsheet
+from app.services.pdf_service import extract_pdf_text
+from app.services.extraction_scheduler import extraction_scheduler
+from app.core.config import settings
 from app.core.llm import get_time_instructions
 
 class FileParsingService:
     @staticmethod
-    async def parse_file(filename: str, base64_data: str) -> str:
-        """Parses various file types and returns their text content."""
+    async def parse_file(
+        filename: str,
+        base64_data: str,
+        keep_full_data: bool = False,
+        pdf_pages: str | None = None,
+        pdf_max_pages: int | None = None
+    ) -> str:
+        """
+        Parses various file types and returns their text content.
+        Spreadsheets are returned as a compact per-sheet profile; keep_full_data raises the
+        row limit under which a sheet's full data is kept (used when charting the data).
+        PDFs are extracted page-parallel; pdf_pages / pdf_max_pages bound the pages processed.
+        """
         # Remove data URI header if present
         if "," in base64_data:
             base64_data = base64_data.split(",")[1]
@@ -26,16 +40,10 @@ class FileParsingService:
         
         try:
             if ext == "pdf":
-                doc = fitz.open(stream=file_bytes, filetype="pdf")
-                text = ""
-                for page in doc:
-                    text += page.get_text() + "\n"
-                doc.close()
-                return text
+                return await extract_pdf_text(file_bytes, pages=pdf_pages, max_pages=pdf_max_pages)
             
-            elif ext in ["xlsx", "xls"]:
-                df = pd.read_excel(file_io)
-                return df.to_string()
+            elif ext in SPREADSHEET_EXTENSIONS:
+                return await asyncio.to_thread(profile_spreadsheet, file_bytes, ext, keep_full_data)
             
             elif ext == "docx":
                 doc = Document(file_io)
@@ -72,9 +80,14 @@ class LLMExtractionService:
         self, 
         text: str, 
         concurrency: int = 3, 
-        status_callback: Callable[[str], Any] = None
+        status_callback: Callable[[str], Any] = None,
+        user_key: str = "anonymous"
     ) -> AsyncGenerator[Dict[str, Any], None]:
-        """Chunks text and processes them in parallel using LLM, streaming partial results via a queue."""
+        """
+        Chunks text and processes them in parallel using LLM, streaming partial results via a queue.
+        LLM calls go through the process-wide extraction scheduler (global worker budget, fair
+        across users); the client-supplied concurrency is capped server-side.
+        """
         if not text:
             return
 
@@ -86,6 +99,7 @@ class LLMExtractionService:
             if asyncio.iscoroutine(res): await res
 
         queue = asyncio.Queue()
+        concurrency = max(1, min(concurrency, settings.EXTRACTION_MAX_CONCURRENCY_PER_REQUEST))
         semaphore = asyncio.Semaphore(concurrency)
         
         # Track completed chunks to know when to stop
@@ -93,7 +107,10 @@ class LLMExtractionService:
         # Better: run producers in background, consumer yields from queue.
         
         async def process_chunk(index: int, chunk: str):
-            async with semaphore:
+            def report_position(position: int):
+                queue.put_nowait({"index": index, "content": "", "status": "queued", "position": position})
+
+            async with semaphore, extraction_scheduler.slot(user_key, on_position=report_position) as slot:
                 try:
                     if status_callback:
                         res = status_callback(f"Starting chunk {index + 1}/{total_chunks}...")
@@ -117,19 +134,22 @@ class LLMExtractionService:
                     
                     # Stream the response for this chunk
                     full_content = ""
-                    async for delta in self.llm.astream(messages):
-                        content = delta.content
-                        if content:
-                            full_content += content
-                            await queue.put({"index": index, "content": content, "status": "running"})
+                    async with aclosing(self.llm.astream(messages)) as stream:
+                        async for delta in stream:
+                            slot.mark_first_token()
+                            content = delta.content
+                            if content:
+                                full_content += content
+                                await queue.put({"index": index, "content": content, "status": "running"})
                     
                     # Signal chunk completion
-                    await queue.put({"index": index, "content": "", "status": "done", "full_content": full_content})
+                    await queue.put({"index": index, "content": "", "status": "done", "full_content": full_content, "total": total_chunks})
                     return full_content
                     
                 except Exception as e:
+                    slot.mark_error()
                     logger.error(f"Error processing chunk {index + 1}: {str(e)}")
-                    await queue.put({"index": index, "content": f"\n[Error: {str(e)}]", "status": "error"})
+                    await queue.put({"index": index, "content": f"\n[Error: {str(e)}]", "status": "error", "total": total_chunks})
                     return ""
 
         # Start producer tasks
@@ -139,16 +159,21 @@ class LLMExtractionService:
         finished_producers = 0
         summaries = [""] * total_chunks
         
-        while finished_producers < total_chunks:
-            item = await queue.get()
-            yield item
-            
-            if item.get("status") in ["done", "error"]:
-                finished_producers += 1
-                if item.get("status") == "done":
-                    summaries[item["index"]] = item.get("full_content", "")
-            
-            queue.task_done()
+        try:
+            while finished_producers < total_chunks:
+                item = await queue.get()
+                yield item
+                
+                if item.get("status") in ["done", "error"]:
+                    finished_producers += 1
+                    if item.get("status") == "done":
+                        summaries[item["index"]] = item.get("full_content", "")
+                
+                queue.task_done()
+        finally:
+            # If the consumer goes away (client disconnect / generator closed), nobody
+            # reads the queue anymore: cancel every producer still streaming from the LLM.
+            await self._cancel_tasks(producer_tasks)
 
         # Synthesis Phase
         # Always run synthesis, even for single chunks, to ensure:
@@ -177,11 +202,24 @@ class LLMExtractionService:
                 HumanMessage(content=f"Partial Summaries:\n\n{combined_summaries}")
             ]
             
-            # Stream synthesis
-            async for delta in self.llm.astream(final_messages):
-                content = delta.content
-                if content:
-                    yield {"index": -1, "content": content, "status": "running"}
+            # Stream synthesis (aclosing ensures the LLM stream is closed if we are)
+            async with extraction_scheduler.slot(user_key) as slot:
+                async with aclosing(self.llm.astream(final_messages)) as stream:
+                    async for delta in stream:
+                        slot.mark_first_token()
+                        content = delta.content
+                        if content:
+                            yield {"index": -1, "content": content, "status": "running"}
             
             yield {"index": -1, "content": "", "status": "done"}
 
+    @staticmethod
+    async def _cancel_tasks(tasks: List[asyncio.Task]):
+        """Cancels unfinished tasks and waits until they have actually stopped."""
+        pending = [task for task in tasks if not task.done()]
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+            logger.info(f"🛑 Cancelled {len(pending)} in-flight extraction task(s)")
+
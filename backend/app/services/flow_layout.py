@@ -0,0 +1,72 @@
+"""
+Automatic positions for React Flow flowcharts (the flow agent's JSON), so the model can leave
+`position` out: the graph is laid out top to bottom with layered_layout(), using node sizes that
+approximate how FlowAgent.tsx renders each node type.
+"""
+import json
+import math
+from typing import Any, Dict, Tuple
+from app.services.layout import layered_layout
+
+NODE_GAP = 60
+LAYER_GAP = 90
+# Decision diamonds are w-44 h-44; process cards are 200-280px wide; start/end are pills with
+# uppercase, letter-spaced labels
+DECISION_SIZE = (176, 176)
+PROCESS_WIDTH = (200, 280)
+CHAR_WIDTH = 8
+TERMINAL_CHAR_WIDTH = 11
+LINE_HEIGHT = 20
+
+
+def flow_node_size(node: Dict[str, Any]) -> Tuple[float, float]:
+    label = str((node.get("data") or {}).get("label", ""))
+    kind = node.get("type")
+    if kind == "decision":
+        return DECISION_SIZE
+    if kind in ("start", "end"):
+        return max(140, 84 + len(label) * TERMINAL_CHAR_WIDTH), 56
+    width = min(PROCESS_WIDTH[1], max(PROCESS_WIDTH[0], 90 + len(label) * CHAR_WIDTH))
+    # Icon and padding take ~90px of the card; the label wraps in the rest
+    lines = max(1, math.ceil(len(label) * CHAR_WIDTH / (width - 90)))
+    return width, 40 + lines * LINE_HEIGHT
+
+
+def needs_layout(data: Any) -> bool:
+    """A flow document with at least one node lacking a numeric position."""
+    if not isinstance(data, dict) or not isinstance(data.get("nodes"), list):
+        return False
+    for node in data["nodes"]:
+        position = node.get("position") if isinstance(node, dict) else None
+        if not isinstance(position, dict) or not all(isinstance(position.get(axis), (int, float)) for axis in "xy"):
+            return True
+    return False
+
+
+def layout_flow(data: Dict[str, Any]) -> Dict[str, Any]:
+    """Sets `position` on every node (all of them, so the drawing stays consistent)."""
+    nodes = [node for node in data["nodes"] if isinstance(node, dict) and "id" in node]
+    sizes = {str(node["id"]): flow_node_size(node) for node in nodes}
+    edges = [
+        (str(edge.get("source")), str(edge.get("target")))
+        for edge in data.get("edges") or [] if isinstance(edge, dict)
+    ]
+    layout = layered_layout(sizes, edges, direction="TB", node_gap=NODE_GAP, layer_gap=LAYER_GAP)
+    for node in nodes:
+        x, y = layout.positions[str(node["id"])]
+        node["position"] = {"x": round(x), "y": round(y)}
+    return data
+
+
+def layout_flow_code(code: str) -> str:
+    """The flow JSON with positions filled in; code that has them all, or isn't flow JSON, is returned as is."""
+    start, end = code.find("{"), code.rfind("}")
+    if start == -1 or end < start:
+        return code
+    try:
+        data = json.loads(code[start:end + 1])
+    except ValueError:
+        return code
+    if not needs_layout(data):
+        return code
+    return json.dumps(layout_flow(data), ensure_ascii=False, indent=2)
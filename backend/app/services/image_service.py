@@ -0,0 +1,200 @@
+import asyncio
+import hashlib
+import io
+from typing import Any, Dict, Iterable, List, Set
+from langchain_core.messages import HumanMessage
+from sqlmodel import select
+from app.core.config import settings
+from app.core.database import session_scope
+from app.core.llm import get_llm
+from app.core.logger import logger
+from app.models.chat import ImageCaption
+from app.services.blob_store import blob_digest, blob_url, decode_data_uri, get_blob_store, load_image
+
+CAPTION_PROMPT = (
+    "Describe this image in at most 80 words so it can stand in for the image later in a "
+    "diagramming conversation. State what kind of image it is, its main elements and how they "
+    "are connected or arranged, and any important visible text. Reply with the description only."
+)
+MISSING_CAPTION = "no description available"
+
+
+def normalize_image(data: bytes, content_type: str) -> tuple[bytes, str]:
+    """
+    Downscales an image to IMAGE_MAX_EDGE and recompresses it (JPEG, or PNG when it has
+    transparency). The original is kept if it is already small and recompression wouldn't help.
+    """
+    from PIL import Image, ImageOps
+
+    try:
+        img = Image.open(io.BytesIO(data))
+        if getattr(img, "is_animated", False):
+            return data, content_type
+        img = ImageOps.exif_transpose(img)
+    except Exception as e:
+        logger.warning(f"Could not decode image ({content_type}), storing as-is: {e}")
+        return data, content_type
+
+    max_edge = settings.IMAGE_MAX_EDGE
+    resized = max(img.size) > max_edge
+    if resized:
+        img.thumbnail((max_edge, max_edge), Image.Resampling.LANCZOS)
+
+    has_alpha = img.mode in ("RGBA", "LA") or (img.mode == "P" and "transparency" in img.info)
+    buf = io.BytesIO()
+    if has_alpha:
+        img.save(buf, "PNG", optimize=True)
+        out_type = "image/png"
+    else:
+        img.convert("RGB").save(buf, "JPEG", quality=settings.IMAGE_JPEG_QUALITY, optimize=True)
+        out_type = "image/jpeg"
+
+    out = buf.getvalue()
+    if not resized and len(out) >= len(data):
+        return data, content_type
+    return out, out_type
+
+
+async def store_image(ref: str) -> str:
+    """Normalizes an inline data-URI image, moves it into the blob store and returns its URL (other refs are kept)."""
+    decoded = decode_data_uri(ref)
+    if not decoded:
+        return ref
+    data, content_type = decoded
+    normalized, content_type = await asyncio.to_thread(normalize_image, data, content_type)
+    if len(normalized) != len(data):
+        logger.info(f"🖼️ Image recompressed: {len(data)} -> {len(normalized)} bytes")
+    return blob_url(await get_blob_store().put(normalized, content_type))
+
+
+def image_key(ref: str) -> str:
+    """Caption cache key: the blob digest, or the hash of an inline (legacy) data URI."""
+    digest = blob_digest(ref)
+    if digest:
+        return digest
+    decoded = decode_data_uri(ref)
+    return hashlib.sha256(decoded[0] if decoded else ref.encode()).hexdigest()
+
+
+def select_pixel_images(image_lists: Iterable[List[str]], budget: int) -> Set[str]:
+    """
+    Picks which history images are still sent as pixels: the newest `budget` ones, walking
+    messages (oldest first in `image_lists`) from the end. Everything else is sent as a caption.
+    """
+    keep: Set[str] = set()
+    if budget <= 0:
+        return keep
+    for images in reversed(list(image_lists)):
+        for ref in reversed(images or []):
+            if len(keep) >= budget:
+                return keep
+            keep.add(ref)
+    return keep
+
+
+class ImageCaptionService:
+    """
+    Generates one caption per image hash with a vision model and caches it in the database,
+    so images that fall out of the retention window cost a few text tokens per turn instead of
+    being re-uploaded. Captions are generated in the background right after upload.
+    """
+
+    # Process-wide: digest -> in-flight caption task (dedupes concurrent requests for one image)
+    _pending: Dict[str, asyncio.Task] = {}
+
+    def __init__(self, model_config: Dict[str, Any] | None = None):
+        self.model_config = model_config or {}
+
+    @staticmethod
+    async def get_cached(keys: List[str]) -> Dict[str, str]:
+        if not keys:
+            return {}
+        async with session_scope() as session:
+            result = await session.exec(select(ImageCaption).where(ImageCaption.digest.in_(keys)))
+            return {row.digest: row.caption for row in result.all()}
+
+    async def _generate(self, key: str, ref: str) -> str:
+        data_uri = await load_image(ref)
+        if not data_uri:
+            return ""
+        llm = get_llm(
+            model_name=self.model_config.get("model_id"),
+            api_key=self.model_config.get("api_key"),
+            base_url=self.model_config.get("base_url"),
+            temperature=0.2
+        )
+        response = await llm.ainvoke([HumanMessage(content=[
+            {"type": "text", "text": CAPTION_PROMPT},
+            {"type": "image_url", "image_url": {"url": data_uri}},
+        ])])
+        caption = " ".join(str(response.content).split())
+        if caption:
+            async with session_scope() as session:
+                await session.merge(ImageCaption(digest=key, caption=caption))
+                await session.commit()
+            logger.info(f"🏷️ Captioned image {key[:12]}: {caption[:60]}...")
+        return caption
+
+    def _task(self, key: str, ref: str) -> asyncio.Task:
+        task = self._pending.get(key)
+        if task is None:
+            task = asyncio.create_task(self._generate(key, ref))
+            self._pending[key] = task
+            task.add_done_callback(lambda _: self._pending.pop(key, None))
+        return task
+
+    async def precaption(self, refs: List[str]):
+        """Starts background caption generation for images that have no cached caption yet."""
+        if not settings.IMAGE_PRECAPTION or not refs:
+            return
+        keys = {image_key(ref): ref for ref in refs}
+        cached = await self.get_cached(list(keys))
+        for key, ref in keys.items():
+            if key not in cached:
+                self._task(key, ref).add_done_callback(self._log_failure)
+
+    @staticmethod
+    def _log_failure(task: asyncio.Task):
+        if not task.cancelled() and task.exception():
+            logger.warning(f"Image pre-captioning failed: {task.exception()}")
+
+    async def captions(self, refs: List[str]) -> Dict[str, str]:
+        """
+        Returns ref -> caption for `refs` (oldest first). Missing captions are generated, or joined
+        if already in flight, for at most IMAGE_CAPTIONS_PER_REQUEST of the newest images, and
+        waited on for at most IMAGE_CAPTION_WAIT_SECONDS: this runs before the LLM call. Captions
+        that aren't ready in time keep generating in the background for later turns.
+        """
+        keys = {ref: image_key(ref) for ref in refs}
+        cached = await self.get_cached(list(set(keys.values())))
+        missing = {key: ref for ref, key in keys.items() if key not in cached}
+        limit = settings.IMAGE_CAPTIONS_PER_REQUEST
+        newest = list(missing.items())[-limit:] if limit > 0 else []
+        started = {key: self._task(key, ref) for key, ref in newest}
+        if started:
+            # Unlike gather(), wait() neither cancels the tasks on timeout nor when the request goes away
+            done, _ = await asyncio.wait(started.values(), timeout=max(settings.IMAGE_CAPTION_WAIT_SECONDS, 0))
+            for key, task in started.items():
+                if task not in done:
+                    task.add_done_callback(self._log_failure)
+                elif task.exception():
+                    logger.warning(f"Image captioning failed for {key[:12]}: {task.exception()}")
+                elif task.result():
+                    cached[key] = task.result()
+        return {ref: cached.get(key, MISSING_CAPTION) for ref, key in keys.items()}
+
+    async def history_parts(self, refs: List[str], pixel_refs: Set[str], captions: Dict[str, str]) -> List[Dict[str, Any]]:
+        """Builds the message parts for one history message: pixels for retained images, caption text for the rest."""
+        parts = []
+        described = []
+        for ref in refs:
+            if ref in pixel_refs:
+                url = await load_image(ref)
+                if url:
+                    parts.append({"type": "image_url", "image_url": {"url": url}})
+            else:
+                described.append(captions.get(ref, MISSING_CAPTION))
+        if described:
+            text = "\n".join(f"[Earlier image: {caption}]" for caption in described)
+            parts.insert(0, {"type": "text", "text": text})
+        return parts
@@ -0,0 +1,241 @@
+import json
+import re
+from typing import List
+from app.services.drawio_dsl import DrawioExpander, is_drawio_dsl, parse_drawio_dsl
+from app.services.drawio_repair import DrawioRepairer
+from app.services.flow_layout import layout_flow_code
+
+JSON_SCAN_PATTERN = re.compile(r"[{}\[\]\",]")
+JSON_STRING_SCAN_PATTERN = re.compile(r"[\"\\]")
+
+# Mermaid statements that open a block closed by `end`
+MERMAID_BLOCKS = {"subgraph", "loop", "alt", "opt", "par", "critical", "break", "rect", "box"}
+
+
+class PartialArtifact:
+    """
+    Code of one artifact as it streams in. snapshot() returns the longest prefix that renders,
+    repaired just enough to parse, or None while there is nothing renderable yet. Each chunk is
+    scanned once in feed(); snapshot() is O(size) and meant to be called at a throttled rate.
+    """
+
+    def __init__(self):
+        self.received = 0
+        self._chunks: List[str] = []
+
+    def feed(self, chunk: str):
+        if chunk:
+            self._scan(chunk, self.received)
+            self._chunks.append(chunk)
+            self.received += len(chunk)
+
+    def text(self) -> str:
+        if len(self._chunks) > 1:
+            self._chunks = ["".join(self._chunks)]
+        return self._chunks[0] if self._chunks else ""
+
+    def snapshot(self) -> str | None:
+        raise NotImplementedError
+
+    def _scan(self, chunk: str, offset: int):
+        """Updates the parse state with `chunk`, which starts at `offset` of the code."""
+
+
+class LinePartial(PartialArtifact):
+    """Line-oriented formats (Markdown mindmaps, infographic DSL): cut after the last complete line."""
+
+    def __init__(self):
+        super().__init__()
+        self._complete = 0
+
+    def _scan(self, chunk: str, offset: int):
+        newline = chunk.rfind("\n")
+        if newline != -1:
+            self._complete = offset + newline + 1
+
+    def snapshot(self) -> str | None:
+        return self.text()[:self._complete].rstrip() or None
+
+
+class MermaidPartial(LinePartial):
+    """Complete statements only, with the blocks (`subgraph ... end`, `class X {`) still open closed."""
+
+    def __init__(self):
+        super().__init__()
+        self._line: List[str] = []
+        self._blocks: List[str] = []
+        self._statements = 0
+
+    def _scan(self, chunk: str, offset: int):
+        super()._scan(chunk, offset)
+        lines = chunk.split("\n")
+        for line in lines[:-1]:
+            self._line.append(line)
+            self._statement("".join(self._line).strip())
+            self._line = []
+        self._line.append(lines[-1])
+
+    def _statement(self, line: str):
+        if not line or line.startswith("%%"):
+            return
+        self._statements += 1
+        keyword = line.split(None, 1)[0].lower()
+        if keyword == "end" and self._blocks and self._blocks[-1] == "end":
+            self._blocks.pop()
+        elif line == "}" and self._blocks and self._blocks[-1] == "}":
+            self._blocks.pop()
+        elif keyword in MERMAID_BLOCKS:
+            self._blocks.append("end")
+        elif line.endswith("{"):
+            self._blocks.append("}")
+
+    def snapshot(self) -> str | None:
+        # The diagram type line alone renders nothing
+        if self._statements < 2:
+            return None
+        return "\n".join([self.text()[:self._complete].rstrip(), *reversed(self._blocks)])
+
+
+class JsonPartial(PartialArtifact):
+    """
+    JSON documents (ECharts options, React Flow graphs): cut after the last complete value and
+    close the open objects and arrays. Cut points are the positions right after `{`/`[` and right
+    before `,`, where everything in front is complete. Objects that are array items (a node, a
+    series) only appear once complete, so no half-specified item reaches the renderer.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._start = None
+        self._stack: List[str] = []
+        # Per open container: is it an object inside an array; and how many such are open
+        self._items: List[bool] = []
+        self._open_items = 0
+        self._in_string = False
+        self._escaped = False
+        self._cut: tuple[int, str] | None = None
+        self._done = False
+
+    def _scan(self, chunk: str, offset: int):
+        position, length = 0, len(chunk)
+        if self._escaped:
+            position, self._escaped = 1, False
+        while position < length and not self._done:
+            if self._in_string:
+                match = JSON_STRING_SCAN_PATTERN.search(chunk, position)
+                if not match:
+                    return
+                if match.group() == "\\":
+                    position = match.end() + 1
+                    self._escaped = position > length
+                    continue
+                self._in_string = False
+                position = match.end()
+                continue
+
+            match = JSON_SCAN_PATTERN.search(chunk, position)
+            if not match:
+                return
+            char, at = match.group(), offset + match.start()
+            position = match.end()
+            if self._start is None:
+                # Anything in front of the document (e.g. a markdown fence) is skipped
+                if char in "{[":
+                    self._start = at
+                else:
+                    continue
+            if char == '"':
+                self._in_string = True
+            elif char in "{[":
+                is_item = char == "{" and bool(self._stack) and self._stack[-1] == "]"
+                self._stack.append("}" if char == "{" else "]")
+                self._items.append(is_item)
+                self._open_items += is_item
+                self._mark_cut(at + 1)
+            elif char in "}]":
+                if not self._stack or self._stack[-1] != char:
+                    self._done = True  # malformed: keep the last good cut
+                    return
+                self._stack.pop()
+                self._open_items -= self._items.pop()
+                if not self._stack:
+                    self._cut = (at + 1, "")
+                    self._done = True
+            else:
+                self._mark_cut(at)
+
+    def _mark_cut(self, position: int):
+        if not self._open_items:
+            self._cut = (position, "".join(reversed(self._stack)))
+
+    def snapshot(self) -> str | None:
+        if self._cut is None:
+            return None
+        end, closers = self._cut
+        candidate = self.text()[self._start:end] + closers
+        try:
+            json.loads(candidate)
+        except ValueError:
+            return None
+        return candidate
+
+
+class FlowPartial(JsonPartial):
+    """React Flow JSON; nodes streamed without a position are laid out."""
+
+    def snapshot(self) -> str | None:
+        snapshot = super().snapshot()
+        return layout_flow_code(snapshot) if snapshot else None
+
+
+class DrawioPartial(LinePartial):
+    """
+    Draw.io output, which is either mxGraph XML (repaired on the fly by `repairer`) or the compact
+    DSL, whose complete lines are expanded to XML.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.repairer: DrawioRepairer | None = None
+        self._is_dsl: bool | None = None
+
+    def feed(self, chunk: str):
+        if self.repairer:
+            self.repairer.feed(chunk)
+            self.received += len(chunk)
+        else:
+            super().feed(chunk)
+
+    def _scan(self, chunk: str, offset: int):
+        if self._is_dsl is None:
+            self._is_dsl = is_drawio_dsl(self.text() + chunk)
+            if self._is_dsl is False:
+                # From here on the code only lives in the repairer
+                self.repairer = DrawioRepairer()
+                self.repairer.feed(self.text() + chunk)
+                return
+        super()._scan(chunk, offset)
+
+    def snapshot(self) -> str | None:
+        if self.repairer:
+            return self.repairer.snapshot()
+        diagram = parse_drawio_dsl(self.text()[:self._complete])
+        # A lone node is not worth a re-render
+        if len(diagram.nodes) < 2:
+            return None
+        return DrawioExpander(diagram).to_xml()
+
+
+def partial_artifact(agent: str | None):
+    """The partial parser for an agent's code, or None for agents without an artifact."""
+    if agent == "drawio":
+        return DrawioPartial()
+    if agent == "flowchart":
+        return FlowPartial()
+    if agent == "charts":
+        return JsonPartial()
+    if agent == "mermaid":
+        return MermaidPartial()
+    if agent in ("mindmap", "infographic"):
+        return LinePartial()
+    return None
@@ -0,0 +1,161 @@
+import asyncio
+import multiprocessing
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import List
+import fitz  # PyMuPDF
+from app.core.config import settings
+from app.core.logger import logger
+
+# Blocks whose top/bottom edge falls within this fraction of the page height are header/footer candidates
+MARGIN_RATIO = 0.08
+PAGE_NUMBER_PATTERN = re.compile(r"^(page\s*)?\d+(\s*(/|of)\s*\d+)?$", re.IGNORECASE)
+
+_pool: ProcessPoolExecutor | None = None
+
+
+@dataclass
+class TextBlock:
+    page: int  # 1-based page number
+    text: str
+    in_margin: bool
+
+
+def pool_size() -> int:
+    return settings.PDF_WORKERS or os.cpu_count() or 1
+
+
+def get_pool() -> ProcessPoolExecutor:
+    """Process-wide pool for CPU-bound PDF text extraction (created lazily)."""
+    global _pool
+    if _pool is None:
+        # spawn, not fork: forking a process that runs an event loop and threads is unsafe
+        _pool = ProcessPoolExecutor(
+            max_workers=pool_size(),
+            mp_context=multiprocessing.get_context("spawn")
+        )
+    return _pool
+
+
+def shutdown_pool():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(cancel_futures=True)
+        _pool = None
+
+
+def parse_page_range(spec: str, page_count: int) -> List[int]:
+    """Parses a 1-based page spec like "1-5,8,10-" into sorted 0-based page indexes."""
+    pages = set()
+    for part in spec.replace(" ", "").split(","):
+        if not part:
+            continue
+        try:
+            if "-" in part:
+                start, _, end = part.partition("-")
+                first = int(start) if start else 1
+                last = int(end) if end else page_count
+            else:
+                first = last = int(part)
+        except ValueError:
+            logger.warning(f"Ignoring invalid page range part: {part!r}")
+            continue
+        pages.update(range(max(first, 1) - 1, min(last, page_count)))
+    return sorted(pages)
+
+
+def count_pages(file_bytes: bytes) -> int:
+    with fitz.open(stream=file_bytes, filetype="pdf") as doc:
+        return doc.page_count
+
+
+def extract_page_blocks(file_bytes: bytes, page_indexes: List[int]) -> List[TextBlock]:
+    """Extracts text blocks in reading order for the given pages. Runs inside a pool worker."""
+    blocks = []
+    with fitz.open(stream=file_bytes, filetype="pdf") as doc:
+        for page_index in page_indexes:
+            page = doc[page_index]
+            height = page.rect.height or 1
+            # (x0, y0, x1, y1, text, block_no, block_type); block_type 1 is an image
+            for x0, y0, x1, y1, text, _, block_type in page.get_text("blocks", sort=True):
+                text = text.strip()
+                if block_type != 0 or not text:
+                    continue
+                in_margin = y1 <= height * MARGIN_RATIO or y0 >= height * (1 - MARGIN_RATIO)
+                blocks.append(TextBlock(page=page_index + 1, text=text, in_margin=in_margin))
+    return blocks
+
+
+def remove_headers_footers(blocks: List[TextBlock], page_count: int) -> List[TextBlock]:
+    """Drops page numbers and margin blocks that repeat (ignoring digits) on most pages."""
+    def key(text: str) -> str:
+        return re.sub(r"\d+", "#", " ".join(text.lower().split()))
+
+    pages_per_key = {}
+    for block in blocks:
+        if block.in_margin:
+            pages_per_key.setdefault(key(block.text), set()).add(block.page)
+
+    threshold = max(2, page_count // 2)
+    repeated = {k for k, pages in pages_per_key.items() if len(pages) >= threshold}
+
+    return [
+        block for block in blocks
+        if not (block.in_margin and (key(block.text) in repeated or PAGE_NUMBER_PATTERN.match(block.text)))
+    ]
+
+
+async def extract_pdf_text(file_bytes: bytes, pages: str | None = None, max_pages: int | None = None) -> str:
+    """
+    Extracts PDF text as page-tagged blocks. Pages are split into ranges processed in parallel
+    across the pool; image-only pages are skipped and repeated headers/footers are removed.
+    `pages` (e.g. "1-20,35") and `max_pages` bound the work done on huge documents.
+    """
+    if max_pages is not None and max_pages < 1:
+        raise ValueError(f"max_pages must be at least 1, got {max_pages}")
+    # Opening parses the xref table, which takes a while on big documents
+    total_pages = await asyncio.to_thread(count_pages, file_bytes)
+
+    page_indexes = parse_page_range(pages, total_pages) if pages else list(range(total_pages))
+    limit = min(max_pages or settings.PDF_MAX_PAGES, settings.PDF_MAX_PAGES)
+    truncated = len(page_indexes) > limit
+    page_indexes = page_indexes[:limit]
+
+    step = settings.PDF_PAGES_PER_TASK
+    ranges = [page_indexes[i:i + step] for i in range(0, len(page_indexes), step)]
+
+    if len(ranges) <= 1 or pool_size() <= 1:
+        # Not worth shipping the document to another process
+        results = [await asyncio.to_thread(extract_page_blocks, file_bytes, page_indexes)]
+    else:
+        loop = asyncio.get_running_loop()
+        pool = get_pool()
+        results = await asyncio.gather(*[
+            loop.run_in_executor(pool, extract_page_blocks, file_bytes, page_range)
+            for page_range in ranges
+        ])
+
+    blocks = remove_headers_footers([block for result in results for block in result], len(page_indexes))
+
+    # Group by page, keeping page markers so chunking/retrieval can cite pages
+    parts = []
+    current_page = None
+    pages_with_text = set()
+    for block in blocks:
+        if block.page != current_page:
+            current_page = block.page
+            pages_with_text.add(block.page)
+            parts.append(f"--- Page {block.page} ---")
+        parts.append(block.text)
+
+    skipped = len(page_indexes) - len(pages_with_text)
+    logger.info(
+        f"📄 PDF extracted: {len(pages_with_text)}/{total_pages} pages with text, "
+        f"{len(ranges)} range(s), {skipped} image-only/empty page(s) skipped"
+    )
+
+    if truncated:
+        parts.append(f"[Truncated: processed {len(page_indexes)} of {total_pages} pages]")
+    return "\n\n".join(parts)
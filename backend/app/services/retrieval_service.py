@@ -0,0 +1,232 @@
+import asyncio
+import base64
+import hashlib
+import heapq
+import math
+import re
+from collections import Counter, OrderedDict
+from dataclasses import dataclass, field
+from typing import List, Dict, Any, Tuple
+from app.core.config import settings
+from app.core.logger import logger
+from app.services.blob_store import load_file
+from app.services.file_service import FileParsingService
+
+# Latin words / numbers, or single CJK characters (indexed as unigrams + bigrams)
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:['_.-][a-z0-9]+)*|[\u3040-\u30ff\u3400-\u9fff\uac00-\ud7af]")
+CJK_PATTERN = re.compile(r"[\u3040-\u30ff\u3400-\u9fff\uac00-\ud7af]")
+HEADING_PATTERN = re.compile(r"^(#{1,6}\s+.+|---\s.+\s---)$")
+
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "for", "from", "in", "into", "is", "it",
+    "of", "on", "or", "that", "the", "this", "to", "was", "were", "with", "what", "how", "please",
+}
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercases and tokenizes text; CJK runs additionally produce character bigrams."""
+    raw = TOKEN_PATTERN.findall(text.lower())
+    tokens = [t for t in raw if t not in STOPWORDS]
+    # Add bigrams for adjacent CJK characters so that multi-character words still match
+    for prev, cur in zip(raw, raw[1:]):
+        if CJK_PATTERN.match(prev) and CJK_PATTERN.match(cur):
+            tokens.append(prev + cur)
+    return tokens
+
+
+@dataclass
+class DocumentChunk:
+    index: int
+    heading: str
+    text: str
+
+
+def chunk_document(text: str, chunk_size: int) -> List[DocumentChunk]:
+    """
+    Splits text into structure-aware chunks: headings start a new chunk, paragraphs are
+    packed together up to chunk_size, and oversized paragraphs are split on line boundaries.
+    """
+    chunks: List[DocumentChunk] = []
+    heading = ""
+    current: List[str] = []
+    current_len = 0
+
+    def flush():
+        nonlocal current, current_len
+        body = "\n\n".join(current).strip()
+        if body:
+            chunks.append(DocumentChunk(index=len(chunks), heading=heading, text=body))
+        current = []
+        current_len = 0
+
+    for block in re.split(r"\n\s*\n", text):
+        block = block.strip()
+        if not block:
+            continue
+
+        first_line = block.split("\n", 1)[0].strip()
+        if HEADING_PATTERN.match(first_line):
+            flush()
+            heading = first_line.strip("#- ").strip()
+
+        # Split oversized blocks line by line (hard cut as a last resort)
+        pieces = [block]
+        if len(block) > chunk_size:
+            pieces = []
+            buf = ""
+            for line in block.split("\n"):
+                while len(line) > chunk_size:
+                    pieces.append(line[:chunk_size])
+                    line = line[chunk_size:]
+                if buf and len(buf) + len(line) + 1 > chunk_size:
+                    pieces.append(buf)
+                    buf = ""
+                buf = f"{buf}\n{line}" if buf else line
+            if buf:
+                pieces.append(buf)
+
+        for piece in pieces:
+            if current and current_len + len(piece) > chunk_size:
+                flush()
+            current.append(piece)
+            current_len += len(piece) + 2
+
+    flush()
+    return chunks
+
+
+@dataclass
+class DocumentIndex:
+    """BM25 (Okapi) index over the chunks of a single parsed document."""
+    filename: str
+    chunks: List[DocumentChunk]
+    k1: float = 1.5
+    b: float = 0.75
+    # Inverted index: term -> [(chunk position, term frequency), ...]
+    postings: Dict[str, List[Tuple[int, int]]] = field(default_factory=dict)
+    length_norms: List[float] = field(default_factory=list)
+    idf: Dict[str, float] = field(default_factory=dict)
+
+    @classmethod
+    def build(cls, filename: str, text: str, chunk_size: int) -> "DocumentIndex":
+        chunks = chunk_document(text, chunk_size)
+        index = cls(filename=filename, chunks=chunks)
+
+        doc_lens = []
+        for pos, chunk in enumerate(chunks):
+            tf = Counter(tokenize(f"{chunk.heading}\n{chunk.text}"))
+            doc_lens.append(sum(tf.values()))
+            for term, freq in tf.items():
+                index.postings.setdefault(term, []).append((pos, freq))
+
+        n = len(chunks)
+        avg_len = (sum(doc_lens) / n) if n else 0.0
+        # Precompute the per-chunk length normalisation term of the BM25 denominator
+        index.length_norms = [index.k1 * (1 - index.b + index.b * dl / (avg_len or 1)) for dl in doc_lens]
+        index.idf = {
+            term: math.log(1 + (n - len(plist) + 0.5) / (len(plist) + 0.5))
+            for term, plist in index.postings.items()
+        }
+        return index
+
+    def search(self, query: str, top_k: int) -> List[Tuple[float, DocumentChunk]]:
+        """Returns up to top_k (score, chunk) pairs, best first. Chunks with zero score are dropped."""
+        scores: Dict[int, float] = {}
+        for term in set(tokenize(query)):
+            plist = self.postings.get(term)
+            if not plist:
+                continue
+            idf = self.idf[term]
+            for pos, freq in plist:
+                scores[pos] = scores.get(pos, 0.0) + idf * freq * (self.k1 + 1) / (freq + self.length_norms[pos])
+
+        best = heapq.nlargest(top_k, scores.items(), key=lambda item: item[1])
+        return [(score, self.chunks[pos]) for pos, score in best]
+
+
+class RetrievalService:
+    """
+    Builds BM25 indexes for uploaded documents at parse time and caches them by file hash,
+    so that follow-up turns on the same document only cost an index query.
+    """
+
+    # Process-wide LRU cache: file hash -> DocumentIndex
+    _cache: "OrderedDict[str, DocumentIndex]" = OrderedDict()
+
+    def __init__(self, chunk_size: int | None = None):
+        self.chunk_size = chunk_size or settings.RETRIEVAL_CHUNK_SIZE
+        self.parsing_service = FileParsingService()
+
+    @staticmethod
+    def file_hash(base64_data: str) -> str:
+        if "," in base64_data:
+            base64_data = base64_data.split(",")[1]
+        return hashlib.sha256(base64.b64decode(base64_data)).hexdigest()
+
+    async def get_index(self, filename: str, base64_data: str = "", digest: str | None = None) -> DocumentIndex:
+        """
+        Returns the cached index for this file, parsing and indexing it on a cache miss.
+        Stored files only carry their blob digest (the same sha256), so their bytes are
+        loaded from the blob store only when the index is not cached.
+        """
+        key = f"{digest or self.file_hash(base64_data)}:{self.chunk_size}"
+        cached = self._cache.get(key)
+        if cached:
+            self._cache.move_to_end(key)
+            return cached
+
+        if not base64_data and digest:
+            base64_data = (await load_file({"name": filename, "blob": digest})).get("data", "")
+            if not base64_data:
+                raise FileNotFoundError(f"Blob {digest} for {filename} is missing")
+
+        text = await self.parsing_service.parse_file(filename, base64_data)
+        index = await asyncio.to_thread(DocumentIndex.build, filename, text, self.chunk_size)
+        logger.info(f"📚 Indexed {filename}: {len(index.chunks)} chunks")
+
+        self._cache[key] = index
+        while len(self._cache) > settings.RETRIEVAL_CACHE_SIZE:
+            self._cache.popitem(last=False)
+        return index
+
+    async def retrieve_context(self, files: List[Dict[str, Any]], query: str, top_k: int) -> str:
+        """Selects the top_k most relevant chunks across all files and formats them as prompt context."""
+        indexes = []
+        seen = set()
+        for file_info in files:
+            data = file_info.get("data", "")
+            digest = file_info.get("blob")
+            if not data and not digest:
+                continue
+            try:
+                index = await self.get_index(file_info.get("name", "document"), data, digest)
+            except FileNotFoundError as e:
+                logger.warning(f"Skipping document: {e}")
+                continue
+            if id(index) not in seen:
+                seen.add(id(index))
+                indexes.append(index)
+
+        if not indexes:
+            return ""
+
+        hits = []
+        for pos, index in enumerate(indexes):
+            hits.extend((score, pos, chunk) for score, chunk in index.search(query, top_k))
+        hits.sort(key=lambda hit: hit[0], reverse=True)
+        hits = hits[:top_k]
+
+        # Nothing matched (e.g. "summarize this"): fall back to the leading chunks of each document
+        if not hits:
+            per_doc = max(1, top_k // len(indexes))
+            hits = [(0.0, pos, chunk) for pos, index in enumerate(indexes) for chunk in index.chunks[:per_doc]]
+
+        # Keep document order so the excerpts read naturally
+        hits.sort(key=lambda hit: (hit[1], hit[2].index))
+
+        sections = []
+        for _, pos, chunk in hits:
+            filename = indexes[pos].filename
+            location = f"{filename} § {chunk.heading}" if chunk.heading else filename
+            sections.append(f"[{location}]\n{chunk.text}")
+        return "\n\n---\n\n".join(sections)
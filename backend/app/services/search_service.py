@@ -0,0 +1,163 @@
+import html
+import re
+from typing import Any, List
+from sqlalchemy import column, delete, func, insert, literal, literal_column, table
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+from app.models.chat import ChatMessage, ChatSession, MESSAGE_STREAMING, SearchDocument, to_utc_iso, utc_now
+from app.services.artifact_service import ARTIFACT_STEP_TYPE, ArtifactService
+
+# Must match the configuration of the generated tsvector column (app/models/chat.py)
+TEXT_SEARCH_CONFIG = literal_column("'simple'::regconfig")
+HEADLINE_OPTIONS = "StartSel=<mark>, StopSel=</mark>, MaxWords=24, MinWords=8, MaxFragments=1"
+
+# Long artifacts are indexed up to this many characters (labels come first in document order)
+MAX_DOCUMENT_CHARS = 100_000
+BACKFILL_BATCH_SIZE = 500
+
+# Label-ish text of XML diagrams: value/label attributes and text nodes; everything else is markup
+XML_TEXT_PATTERN = re.compile(r'\b(?:value|label)="([^"]*)"|>([^<>]+)<')
+HTML_TAG_PATTERN = re.compile(r"<[^>]+>")
+QUERY_TERM_PATTERN = re.compile(r"\w+")
+
+# SQLite FTS5 index (external content: rowid is searchdocument.id)
+SEARCH_FTS = table("searchdocument_fts", column("rowid"))
+
+
+def artifact_text(code: str) -> str:
+    """The words of a diagram: labels for Draw.io XML, the source itself for text formats."""
+    if code.lstrip().startswith("<"):
+        parts = [match.group(1) or match.group(2) or "" for match in XML_TEXT_PATTERN.finditer(code)]
+        # Labels with html=1 carry escaped markup of their own
+        code = HTML_TAG_PATTERN.sub(" ", html.unescape(" ".join(part for part in parts if part.strip())))
+    return code[:MAX_DOCUMENT_CHARS]
+
+
+def message_documents(role: str, content: str, steps: List[Any] | None) -> List[tuple[str, str]]:
+    """(kind, text) pairs to index for a message."""
+    if role == "user":
+        return [("prompt", content[:MAX_DOCUMENT_CHARS])] if content and content.strip() else []
+
+    documents = []
+    concepts, artifacts = [], []
+    for step in steps or []:
+        if not isinstance(step, dict) or not isinstance(step.get("content"), str):
+            continue
+        if step.get("type") == "design_concept":
+            concepts.append(step["content"])
+        elif step.get("type") == ARTIFACT_STEP_TYPE:
+            artifacts.append(artifact_text(step["content"]))
+    for kind, texts in (("design_concept", concepts), ("artifact", artifacts)):
+        text = "\n".join(text for text in texts if text.strip())
+        if text:
+            documents.append((kind, text[:MAX_DOCUMENT_CHARS]))
+    return documents
+
+
+def document_rows(message: ChatMessage, steps: List[Any] | None) -> List[dict]:
+    return [
+        {"session_id": message.session_id, "message_id": message.id, "kind": kind, "content": text,
+         "created_at": message.created_at}
+        for kind, text in message_documents(message.role, message.content, steps)
+    ]
+
+
+def fts5_query(query: str) -> str:
+    """Every word of the query as a quoted FTS5 string, so user input can't use FTS5 syntax."""
+    return " ".join(f'"{term}"' for term in QUERY_TERM_PATTERN.findall(query))
+
+
+class SearchService:
+    """
+    Full-text search over session titles, user prompts, design concepts and diagram labels.
+    SearchDocument rows are written in the same transaction as the message they come from;
+    the tsvector column (Postgres) or FTS5 table (SQLite) is updated by the database.
+    """
+
+    def __init__(self, session: AsyncSession):
+        self.session = session
+
+    async def index_title(self, session_id: int, title: str):
+        await self.session.exec(insert(SearchDocument).values(
+            session_id=session_id, kind="title", content=title, created_at=utc_now()
+        ))
+
+    async def index_message(self, message: ChatMessage, steps: List[Any] | None = None):
+        """(Re)indexes a message; drafts still streaming are left out until they are saved."""
+        if message.status == MESSAGE_STREAMING:
+            return
+        await self.session.exec(delete(SearchDocument).where(SearchDocument.message_id == message.id))
+        rows = document_rows(message, steps)
+        if rows:
+            await self.session.exec(insert(SearchDocument), params=rows)
+
+    async def search(self, query: str, limit: int, offset: int = 0) -> tuple[list[dict], int | None]:
+        """Best matches first; returns (hits, offset of the next page or None)."""
+        if not QUERY_TERM_PATTERN.search(query):
+            return [], None
+
+        columns = (
+            SearchDocument.id, SearchDocument.session_id, SearchDocument.message_id, SearchDocument.kind,
+            SearchDocument.created_at, ChatSession.title.label("session_title"),
+        )
+        if self.session.bind.dialect.name == "postgresql":
+            tsquery = func.plainto_tsquery(TEXT_SEARCH_CONFIG, query)
+            tsv = literal_column("searchdocument.tsv")
+            rank = func.ts_rank_cd(tsv, tsquery)
+            statement = (
+                select(*columns, rank.label("rank"),
+                       func.ts_headline(TEXT_SEARCH_CONFIG, SearchDocument.content, tsquery, HEADLINE_OPTIONS).label("snippet"))
+                .where(tsv.op("@@")(tsquery))
+                .order_by(rank.desc(), SearchDocument.id.desc())
+            )
+        else:
+            fts = literal_column(SEARCH_FTS.name)
+            # bm25() is lower for better matches
+            rank = func.bm25(fts)
+            statement = (
+                select(*columns, (-rank).label("rank"),
+                       func.snippet(fts, 0, "<mark>", "</mark>", "…", 24).label("snippet"))
+                .select_from(SearchDocument)
+                .join(SEARCH_FTS, SEARCH_FTS.c.rowid == SearchDocument.id)
+                .where(fts.op("MATCH")(fts5_query(query)))
+                .order_by(rank, SearchDocument.id.desc())
+            )
+        statement = statement.join(ChatSession, ChatSession.id == SearchDocument.session_id)
+        rows = list((await self.session.exec(statement.limit(limit + 1).offset(offset))).all())
+
+        next_offset = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_offset = offset + limit
+
+        hits = []
+        for row in rows:
+            hit = dict(row._mapping)
+            hit["created_at"] = to_utc_iso(hit["created_at"])
+            hit["rank"] = float(hit["rank"])
+            hits.append(hit)
+        return hits, next_offset
+
+    async def backfill(self):
+        """Indexes all existing sessions and messages (run once, when the search table is created)."""
+        await self.session.exec(insert(SearchDocument).from_select(
+            ["session_id", "kind", "content", "created_at"],
+            select(ChatSession.id, literal("title"), ChatSession.title, ChatSession.created_at)
+        ))
+
+        last_id = 0
+        while True:
+            messages = list((await self.session.exec(
+                select(ChatMessage)
+                .where(ChatMessage.id > last_id, ChatMessage.status != MESSAGE_STREAMING)
+                .order_by(ChatMessage.id)
+                .limit(BACKFILL_BATCH_SIZE)
+            )).all())
+            if not messages:
+                break
+            await ArtifactService(self.session).unpack_messages(messages)
+            rows = [row for message in messages for row in document_rows(message, message.steps)]
+            if rows:
+                await self.session.exec(insert(SearchDocument), params=rows)
+            last_id = messages[-1].id
+            self.session.expunge_all()
@@ -0,0 +1,150 @@
+import gzip
+import hashlib
+import json
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Dict, Iterable, List
+from sqlalchemy import delete, update
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import DBAPIError
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+from app.core.logger import logger
+from app.models.chat import ChatMessage, ChatSession, SessionSnapshot, to_utc_iso
+
+# History JSON still shrinks ~10x
+SNAPSHOT_COMPRESSION_LEVEL = 5
+# The raw output kept for resuming an unfinished reply is server-side only
+EXCLUDED_MESSAGE_FIELDS = {"draft_output"}
+
+
+@dataclass
+class HistorySnapshot:
+    etag: str
+    data: bytes # gzip'd JSON body
+
+
+def message_json(message: ChatMessage, steps: List[Any] | None = None) -> Dict[str, Any]:
+    """
+    A message as the history endpoint returns it. `steps` are the steps it was written with, to
+    put the code back into stored steps that only reference an artifact revision.
+    """
+    data = message.model_dump(mode="json", exclude=EXCLUDED_MESSAGE_FIELDS)
+    if steps and message.steps:
+        data["steps"] = [
+            {**stored, "content": step["content"]} if isinstance(stored, dict) and stored.get("artifact_id") else stored
+            for stored, step in zip(message.steps, steps)
+        ]
+    return data
+
+
+def encode_history(payload: Dict[str, Any]) -> tuple[bytes, str, int]:
+    """Returns (gzip'd JSON, etag, uncompressed size); the same payload always gives the same bytes."""
+    raw = json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode()
+    return gzip.compress(raw, SNAPSHOT_COMPRESSION_LEVEL, mtime=0), hashlib.sha256(raw).hexdigest()[:32], len(raw)
+
+
+class SessionSnapshotService:
+    """
+    Maintains SessionSnapshot rows. Writers call patch() after touching the session row, so
+    writes to one session are serialized by that row lock and a snapshot, once stored, never
+    misses a message. Snapshots are built lazily on the first read after they were dropped.
+
+    Draft checkpoints of a streaming reply don't patch: the snapshot just goes stale (get() no
+    longer serves it) until the reply's final write upserts the finished message.
+    """
+
+    def __init__(self, session: AsyncSession):
+        self.session = session
+
+    async def get(self, session_id: int) -> HistorySnapshot | None:
+        """The stored snapshot if it is current: one indexed read, no ORM objects."""
+        row = (await self.session.exec(
+            select(SessionSnapshot.etag, SessionSnapshot.data)
+            .join(ChatSession, ChatSession.id == SessionSnapshot.session_id)
+            .where(
+                SessionSnapshot.session_id == session_id,
+                SessionSnapshot.source_updated_at == ChatSession.updated_at,
+                ChatSession.archive_key.is_(None),
+            )
+        )).first()
+        return HistorySnapshot(etag=row.etag, data=row.data) if row else None
+
+    async def build(self, session_id: int) -> HistorySnapshot:
+        """Serializes the session from the tables and stores the result."""
+        from app.services.chat import ChatService
+
+        # FOR SHARE holds off writers until the snapshot is stored, so it can't miss their message
+        chat_session = (await self.session.exec(
+            select(ChatSession).where(ChatSession.id == session_id)
+            .with_for_update(read=True).execution_options(populate_existing=True)
+        )).first()
+        messages = await ChatService(self.session).get_history(session_id) if chat_session else []
+        payload = {
+            "messages": [message_json(message) for message in messages],
+            "session": chat_session.model_dump(mode="json") if chat_session else None,
+        }
+        data, etag, size = encode_history(payload)
+        if not chat_session:
+            await self.session.rollback()
+            return HistorySnapshot(etag=etag, data=data)
+
+        values = dict(session_id=session_id, source_updated_at=chat_session.updated_at, etag=etag, size=size, data=data)
+        insert = postgresql_insert if self.session.bind.dialect.name == "postgresql" else sqlite_insert
+        statement = insert(SessionSnapshot).values(**values)
+        statement = statement.on_conflict_do_update(
+            index_elements=[SessionSnapshot.session_id],
+            set_={key: value for key, value in values.items() if key != "session_id"},
+            # A concurrent build from older rows must not replace a newer snapshot
+            where=SessionSnapshot.source_updated_at <= statement.excluded.source_updated_at,
+        )
+        try:
+            await self.session.exec(statement)
+            await self.session.commit()
+        except DBAPIError as e:
+            # SQLite: a write landed since this read began; serve the result, don't store it
+            await self.session.rollback()
+            logger.warning(f"Snapshot of session {session_id} not stored: {e}")
+        return HistorySnapshot(etag=etag, data=data)
+
+    async def patch(
+        self,
+        session_id: int,
+        updated_at: datetime,
+        messages: Iterable[Dict[str, Any]] = (),
+        fields: Dict[int, Dict[str, Any]] | None = None,
+    ):
+        """
+        Applies a write to the stored snapshot, if there is one, in the caller's transaction:
+        `messages` are upserted by id, `fields` ({message_id: {field: value}}) are set on existing
+        messages, and the session's updated_at becomes `updated_at`.
+        """
+        snapshot = (await self.session.exec(
+            select(SessionSnapshot.data).where(SessionSnapshot.session_id == session_id)
+        )).first()
+        if snapshot is None:
+            return
+        payload = json.loads(gzip.decompress(snapshot))
+        by_id = {message["id"]: message for message in payload["messages"]}
+        for message in messages:
+            if message["id"] in by_id:
+                by_id[message["id"]].update(message)
+            else:
+                payload["messages"].append(message)
+                by_id[message["id"]] = message
+        for message_id, values in (fields or {}).items():
+            if message_id in by_id:
+                by_id[message_id].update(values)
+        if payload["session"]:
+            payload["session"]["updated_at"] = to_utc_iso(updated_at)
+
+        data, etag, size = encode_history(payload)
+        await self.session.exec(
+            update(SessionSnapshot)
+            .where(SessionSnapshot.session_id == session_id)
+            .values(source_updated_at=updated_at, etag=etag, size=size, data=data)
+        )
+
+    async def delete(self, session_id: int):
+        await self.session.exec(delete(SessionSnapshot).where(SessionSnapshot.session_id == session_id))
@@ -0,0 +1,262 @@
+import csv
+import io
+import math
+from collections import Counter, deque
+from dataclasses import dataclass, field
+from datetime import date, datetime, time
+from typing import Any, Iterable, Iterator, List, Tuple
+import pandas as pd
+from app.core.config import settings
+
+# Text columns track at most this many distinct values (beyond it we report "N+ distinct")
+MAX_TRACKED_DISTINCT = 1000
+DATETIME_TYPES = [datetime, date, time, pd.Timestamp]
+SPREADSHEET_EXTENSIONS = ("xlsx", "xls")
+
+
+def is_spreadsheet(filename: str) -> bool:
+    return filename.rsplit(".", 1)[-1].lower() in SPREADSHEET_EXTENSIONS
+
+
+@dataclass
+class ColumnProfile:
+    name: str
+    non_null: int = 0
+    n_numeric: int = 0
+    n_datetime: int = 0
+    n_bool: int = 0
+    n_text: int = 0
+    num_sum: float = 0.0
+    num_sumsq: float = 0.0
+    num_min: float = math.inf
+    num_max: float = -math.inf
+    dt_min: Any = None
+    dt_max: Any = None
+    values: Counter = field(default_factory=Counter)
+    distinct_overflow: bool = False
+
+    @property
+    def kind(self) -> str:
+        if not self.non_null:
+            return "empty"
+        counts = {
+            "numeric": self.n_numeric,
+            "datetime": self.n_datetime,
+            "boolean": self.n_bool,
+            "text": self.n_text,
+        }
+        return max(counts, key=counts.get)
+
+    def update(self, series: pd.Series):
+        """Merges the statistics of one batch of raw cell values into this profile (vectorized)."""
+        series = series.dropna()
+        as_text = series.astype(str)
+        keep = as_text.str.strip() != ""
+        series, as_text = series[keep], as_text[keep]
+        if series.empty:
+            return
+        self.non_null += len(series)
+
+        cell_types = series.map(type)
+        is_bool = cell_types == bool
+        is_dt = cell_types.isin(DATETIME_TYPES)
+        numeric = pd.to_numeric(series[~is_bool & ~is_dt], errors="coerce").dropna()
+        self.n_bool += int(is_bool.sum())
+        self.n_datetime += int(is_dt.sum())
+        self.n_numeric += len(numeric)
+        self.n_text += len(series) - int(is_bool.sum()) - int(is_dt.sum()) - len(numeric)
+
+        if len(numeric):
+            values = numeric.astype(float)
+            self.num_sum += float(values.sum())
+            self.num_sumsq += float((values * values).sum())
+            self.num_min = min(self.num_min, float(values.min()))
+            self.num_max = max(self.num_max, float(values.max()))
+
+        if is_dt.any():
+            dts = series[is_dt]
+            batch_min, batch_max = min(dts, key=str), max(dts, key=str)
+            self.dt_min = batch_min if self.dt_min is None else min(self.dt_min, batch_min, key=str)
+            self.dt_max = batch_max if self.dt_max is None else max(self.dt_max, batch_max, key=str)
+
+        if not self.distinct_overflow:
+            self.values.update(as_text.value_counts().to_dict())
+            if len(self.values) > MAX_TRACKED_DISTINCT:
+                self.distinct_overflow = True
+
+    def summary(self) -> str:
+        kind = self.kind
+        if kind == "numeric" and self.n_numeric:
+            mean = self.num_sum / self.n_numeric
+            variance = max(self.num_sumsq / self.n_numeric - mean * mean, 0.0)
+            return (
+                f"min {format_number(self.num_min)}, max {format_number(self.num_max)}, "
+                f"mean {format_number(mean)}, std {format_number(math.sqrt(variance))}, "
+                f"sum {format_number(self.num_sum)}"
+            )
+        if kind == "datetime":
+            return f"from {format_cell(self.dt_min)} to {format_cell(self.dt_max)}"
+        if kind in ("text", "boolean"):
+            distinct = f"{MAX_TRACKED_DISTINCT}+" if self.distinct_overflow else str(len(self.values))
+            top = ", ".join(f"{value[:40]} ({count})" for value, count in self.values.most_common(3))
+            return f"{distinct} distinct; top: {top}"
+        return ""
+
+
+@dataclass
+class SheetProfile:
+    name: str
+    header: List[str]
+    columns: List[ColumnProfile]
+    row_count: int
+    head: List[Tuple]
+    tail: List[Tuple]
+    rows: List[Tuple] | None
+
+
+def format_number(value: float) -> str:
+    if value == int(value) and abs(value) < 1e15:
+        return str(int(value))
+    return f"{value:.4g}"
+
+
+def format_cell(value: Any) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, datetime):
+        return value.isoformat(sep=" ", timespec="seconds").replace(" 00:00:00", "")
+    if isinstance(value, float):
+        return format_number(value)
+    return str(value)
+
+
+def build_header(raw: Tuple) -> List[str]:
+    """Turns the first non-empty row into unique, non-blank column names."""
+    header, seen = [], Counter()
+    for i, cell in enumerate(raw):
+        name = format_cell(cell).strip() or f"col_{i + 1}"
+        seen[name] += 1
+        header.append(name if seen[name] == 1 else f"{name}_{seen[name]}")
+    return header
+
+
+def profile_rows(name: str, rows: Iterable[Tuple], keep_full_rows: int) -> SheetProfile | None:
+    """
+    Profiles a stream of row tuples in fixed-size batches, so memory stays bounded by the
+    batch size plus the head/tail samples (and the full rows only while under keep_full_rows).
+    """
+    sample_size = settings.SPREADSHEET_SAMPLE_ROWS
+    batch_size = settings.SPREADSHEET_BATCH_ROWS
+
+    iterator: Iterator[Tuple] = iter(rows)
+    header_row = None
+    for raw in iterator:
+        if any(cell not in (None, "") for cell in raw):
+            header_row = raw
+            break
+    if header_row is None:
+        return None
+
+    header = build_header(header_row)
+    width = len(header)
+    columns = [ColumnProfile(name=col) for col in header]
+    head: List[Tuple] = []
+    tail: deque = deque(maxlen=sample_size)
+    full_rows: List[Tuple] | None = []
+    row_count = 0
+    batch: List[Tuple] = []
+
+    def flush_batch():
+        frame = pd.DataFrame(batch, columns=header, dtype=object)
+        for i, col in enumerate(columns):
+            col.update(frame.iloc[:, i])
+        batch.clear()
+
+    for raw in iterator:
+        row = tuple(raw[:width]) + (None,) * (width - len(raw))
+        if all(cell in (None, "") for cell in row):
+            continue
+        row_count += 1
+        if len(head) < sample_size:
+            head.append(row)
+        else:
+            tail.append(row)
+        if full_rows is not None:
+            full_rows.append(row)
+            if len(full_rows) > keep_full_rows:
+                full_rows = None
+        batch.append(row)
+        if len(batch) >= batch_size:
+            flush_batch()
+
+    if batch:
+        flush_batch()
+
+    return SheetProfile(
+        name=name,
+        header=header,
+        columns=columns,
+        row_count=row_count,
+        head=head,
+        tail=list(tail),
+        rows=full_rows,
+    )
+
+
+def render_profile(sheet: SheetProfile) -> str:
+    """Renders a compact Markdown profile of a sheet for the LLM."""
+    lines = [f"## Sheet: {sheet.name} ({sheet.row_count} rows x {len(sheet.header)} columns)", ""]
+    lines.append("| column | type | non-null | summary |")
+    lines.append("|---|---|---|---|")
+    for col in sheet.columns:
+        lines.append(f"| {col.name} | {col.kind} | {col.non_null} | {col.summary()} |")
+
+    def to_csv(rows: List[Tuple]) -> str:
+        buf = io.StringIO()
+        writer = csv.writer(buf, lineterminator="\n")
+        writer.writerow(sheet.header)
+        writer.writerows([[format_cell(cell) for cell in row] for row in rows])
+        return buf.getvalue().rstrip("\n")
+
+    lines.append("")
+    if sheet.rows is not None:
+        lines.append("Data (CSV, all rows):")
+        lines.append(to_csv(sheet.rows))
+    else:
+        lines.append(f"Sample (CSV, first {len(sheet.head)} and last {len(sheet.tail)} rows):")
+        sample = to_csv(sheet.head)
+        if sheet.tail:
+            sample += "\n...\n" + to_csv(sheet.tail).split("\n", 1)[1]
+        lines.append(sample)
+    return "\n".join(lines)
+
+
+def profile_spreadsheet(file_bytes: bytes, ext: str, keep_full_data: bool = False) -> str:
+    """
+    Profiles every sheet of an xlsx/xls workbook. xlsx is streamed with openpyxl in read-only
+    mode; legacy xls (not supported by openpyxl) is read sheet by sheet through pandas.
+    """
+    keep_full_rows = settings.SPREADSHEET_CHART_MAX_ROWS if keep_full_data else settings.SPREADSHEET_FULL_DATA_ROWS
+    profiles = []
+
+    if ext == "xlsx":
+        from openpyxl import load_workbook
+        workbook = load_workbook(io.BytesIO(file_bytes), read_only=True, data_only=True)
+        try:
+            for ws in workbook.worksheets:
+                profile = profile_rows(ws.title, ws.iter_rows(values_only=True), keep_full_rows)
+                if profile:
+                    profiles.append(profile)
+        finally:
+            workbook.close()
+    else:
+        sheets = pd.read_excel(io.BytesIO(file_bytes), sheet_name=None, header=None)
+        for name, df in sheets.items():
+            df = df.astype(object).where(df.notna(), None)
+            profile = profile_rows(str(name), df.itertuples(index=False, name=None), keep_full_rows)
+            if profile:
+                profiles.append(profile)
+
+    if not profiles:
+        return "[Empty spreadsheet]"
+    return "\n\n".join(render_profile(profile) for profile in profiles)
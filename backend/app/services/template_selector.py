@@ -0,0 +1,128 @@
+"""
+Local infographic template selection: an index over TEMPLATE_SELECTION_GUIDE (plus keyword
+lists and the distinctive words of template names) scored against the word / n-gram set of the
+request, in microseconds and without a model call. Chinese text is matched on character bigrams.
+"""
+import math
+import re
+from collections import defaultdict
+from typing import Dict, FrozenSet, List, Tuple
+from app.data.template_syntax import (
+    ALL_TEMPLATES,
+    TEMPLATE_SELECTION_GUIDE,
+    TEMPLATE_TERM_ALIASES,
+    USE_CASE_KEYWORDS,
+)
+
+WORD_PATTERN = re.compile(r"[a-z0-9]+")
+CJK_PATTERN = re.compile(r"[\u3400-\u9fff]+")
+
+# Below this score the index has no real evidence and the model picks the template
+MIN_SCORE = 1.0
+# Later templates of a use case are slightly less preferred than the first
+RANK_PENALTY = 0.1
+
+
+# Template name words too ambiguous to count on their own ("org chart", "flow chart"): only
+# their aliases do
+AMBIGUOUS_NAME_WORDS = {"chart"}
+
+
+def stem(word: str) -> str:
+    if len(word) > 4 and word.endswith("ies"):
+        return word[:-3] + "y"
+    return word[:-1] if len(word) > 3 and word.endswith("s") and not word.endswith("ss") else word
+
+
+def ngrams(text: str) -> set:
+    """Words, word bigrams, and CJK characters and character bigrams of `text`."""
+    text = text.lower()
+    words = [stem(word) for word in WORD_PATTERN.findall(text)]
+    grams = set(words) | {f"{a} {b}" for a, b in zip(words, words[1:])}
+    for run in CJK_PATTERN.findall(text):
+        grams.update(run)
+        grams.update(run[i:i + 2] for i in range(len(run) - 1))
+    return grams
+
+
+def phrase_grams(phrase: str) -> FrozenSet[str]:
+    """The n-grams a request must contain to mention `phrase` (its bigrams, for longer phrases)."""
+    phrase = phrase.lower()
+    words = [stem(word) for word in WORD_PATTERN.findall(phrase)]
+    grams = {f"{a} {b}" for a, b in zip(words, words[1:])} if len(words) > 1 else set(words)
+    for run in CJK_PATTERN.findall(phrase):
+        grams.update([run[i:i + 2] for i in range(len(run) - 1)] if len(run) > 1 else [run])
+    return frozenset(grams)
+
+
+# A term: the n-gram sets of its spellings (any one matches), and its weight
+Term = Tuple[List[FrozenSet[str]], float]
+
+
+class TemplateIndex:
+    """
+    Weighted terms per use case, and per template for the words of its name, weighted by how few
+    templates share the word (so "swot" decides and "simple" barely counts).
+    """
+
+    def __init__(self):
+        self.use_case_terms: Dict[str, List[Term]] = {}
+        for use_case, phrases in USE_CASE_KEYWORDS.items():
+            self.use_case_terms[use_case] = [
+                ([grams], 1 + 0.5 * (len(grams) - 1)) for grams in map(phrase_grams, phrases) if grams
+            ]
+
+        names = {template: set(template.split("-")) for template in ALL_TEMPLATES}
+        frequency = defaultdict(int)
+        for words in names.values():
+            for word in words:
+                frequency[word] += 1
+        self.template_terms: Dict[str, List[Term]] = {
+            template: [
+                ([phrase_grams(phrase) for phrase in [
+                    *([] if word in AMBIGUOUS_NAME_WORDS else [word]), *TEMPLATE_TERM_ALIASES.get(word, [])
+                ]],
+                 math.log(len(ALL_TEMPLATES) / frequency[word]))
+                for word in words
+            ]
+            for template, words in names.items()
+        }
+
+    @staticmethod
+    def _score(grams: set, terms: List[Term]) -> float:
+        return sum(weight for spellings, weight in terms if any(spelling <= grams for spelling in spellings))
+
+    def rank(self, request: str) -> List[Tuple[str, float]]:
+        """
+        All templates with their scores, best first. Ties prefer the guide's templates, then the
+        plainer variant (fewer name words).
+        """
+        grams = ngrams(request)
+        scores = {template: self._score(grams, terms) for template, terms in self.template_terms.items()}
+        preferred = {}
+        for use_case, guide in TEMPLATE_SELECTION_GUIDE.items():
+            score = self._score(grams, self.use_case_terms.get(use_case, []))
+            if not score:
+                continue
+            for rank, template in enumerate(guide["templates"]):
+                preferred[template] = max(preferred.get(template, 0), score - RANK_PENALTY * rank)
+        order = {template: i for i, template in enumerate(ALL_TEMPLATES)}
+        ranked = [(template, scores[template] + preferred.get(template, 0)) for template in ALL_TEMPLATES]
+        ranked.sort(key=lambda item: (-item[1], item[0] not in preferred, item[0].count("-"), order[item[0]]))
+        return ranked
+
+
+_index: TemplateIndex | None = None
+
+
+def get_template_index() -> TemplateIndex:
+    global _index
+    if _index is None:
+        _index = TemplateIndex()
+    return _index
+
+
+def select_template_locally(request: str, min_score: float = MIN_SCORE) -> str | None:
+    """The best template for `request`, or None when the index isn't confident enough."""
+    template, score = get_template_index().rank(request)[0]
+    return template if score >= min_score else None
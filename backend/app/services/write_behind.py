@@ -0,0 +1,60 @@
+import asyncio
+from collections import deque
+from typing import Awaitable, Callable, Deque, Set, Tuple, TypeVar
+from app.core.database import session_scope
+from app.core.logger import logger
+from app.services.chat import ChatService
+
+T = TypeVar("T")
+
+# The event loop only keeps weak references to tasks: hold the workers until they finish, even
+# after the request (and its queue) has gone away
+_workers: Set[asyncio.Task] = set()
+
+
+def _worker_done(task: asyncio.Task):
+    _workers.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        logger.error(f"💾 Write-behind worker crashed: {task.exception()}")
+
+
+class WriteBehindQueue:
+    """
+    Runs the database writes of one chat turn on a background task, strictly in submission
+    order and each in its own short unit of work. The stream keeps going while a write is in
+    flight and only awaits the returned future when it needs the row (or the write to be durable).
+
+    The worker task is independent of the request, so a client disconnect does not cancel
+    writes that were already queued.
+    """
+
+    def __init__(self, label: str = ""):
+        self.label = label
+        self._pending: Deque[Tuple[Callable[[ChatService], Awaitable], asyncio.Future]] = deque()
+        self._worker: asyncio.Task | None = None
+
+    def submit(self, operation: Callable[[ChatService], Awaitable[T]]) -> "asyncio.Future[T]":
+        """Queues `operation(chat_service)` and returns a future for its result."""
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((operation, future))
+        # One worker at a time keeps the writes ordered; it exits once the queue is empty
+        if self._worker is None or self._worker.done():
+            self._worker = asyncio.create_task(self._run())
+            _workers.add(self._worker)
+            self._worker.add_done_callback(_worker_done)
+        return future
+
+    async def _run(self):
+        while self._pending:
+            operation, future = self._pending.popleft()
+            try:
+                async with session_scope() as db:
+                    result = await operation(ChatService(db))
+            except Exception as e:
+                logger.error(f"💾 Write-behind failed{f' ({self.label})' if self.label else ''}: {e}")
+                if not future.done():
+                    future.set_exception(e)
+            else:
+                if not future.done():
+                    future.set_result(result)
+
@@ -0,0 +1,125 @@
+"""
+Storage benchmark for artifact revisions (app/services/artifact_service.py).
+
+Builds realistic edit chains (a Draw.io diagram edited turn after turn: relabels, moves,
+added/removed cells, restyles; the same for a minified document and a Mermaid flowchart) and
+compares storing every revision inline in steps JSON with zlib-compressed delta chains:
+
+    uv run python bench_artifacts.py 50
+"""
+import json
+import random
+import sys
+import time
+import zlib
+from app.services.artifact_service import decode_revision, encode_revision
+
+SNAPSHOT_INTERVAL = 10
+STYLES = [
+    "rounded=1;whiteSpace=wrap;html=1;fillColor=#dae8fc;strokeColor=#6c8ebf;",
+    "shape=cylinder3;whiteSpace=wrap;html=1;boundedLbl=1;size=15;fillColor=#d5e8d4;strokeColor=#82b366;",
+    "swimlane;whiteSpace=wrap;html=1;fillColor=#f5f5f5;strokeColor=#666666;fontColor=#333333;",
+    "ellipse;whiteSpace=wrap;html=1;fillColor=#fff2cc;strokeColor=#d6b656;",
+]
+EDGE_STYLE = "edgeStyle=orthogonalEdgeStyle;rounded=0;orthogonalLoop=1;jettySize=auto;html=1;endArrow=classic;"
+
+
+def drawio(nodes, edges, minify=False):
+    cells = ['    <mxCell id="0" />', '    <mxCell id="1" parent="0" />']
+    for node_id, (label, style, x, y) in nodes.items():
+        cells.append(
+            f'    <mxCell id="{node_id}" value="{label}" style="{style}" vertex="1" parent="1">\n'
+            f'      <mxGeometry x="{x}" y="{y}" width="160" height="60" as="geometry" />\n'
+            f'    </mxCell>'
+        )
+    for edge_id, (source, target) in edges.items():
+        cells.append(
+            f'    <mxCell id="{edge_id}" style="{EDGE_STYLE}" edge="1" parent="1" source="{source}" target="{target}">\n'
+            f'      <mxGeometry relative="1" as="geometry" />\n'
+            f'    </mxCell>'
+        )
+    xml = (
+        '<mxfile host="app.diagrams.net">\n  <diagram name="Architecture" id="arch">\n'
+        '  <mxGraphModel dx="1422" dy="794" grid="1" gridSize="10" guides="1" tooltips="1" connect="1" '
+        'arrows="1" fold="1" page="1" pageScale="1" pageWidth="1169" pageHeight="827">\n  <root>\n'
+        + "\n".join(cells) +
+        '\n  </root>\n  </mxGraphModel>\n  </diagram>\n</mxfile>'
+    )
+    return "".join(line.strip() for line in xml.splitlines()) if minify else xml
+
+
+def mermaid(nodes, edges, minify=False):
+    lines = ["flowchart TD"]
+    lines += [f'    {node_id}["{label}"]' for node_id, (label, *_) in nodes.items()]
+    lines += [f"    {source} --> {target}" for source, target in edges.values()]
+    return "\n".join(lines)
+
+
+def edit_chain(render, turns, seed=7, minify=False):
+    rng = random.Random(seed)
+    nodes = {f"n{i}": (f"Service {i}", rng.choice(STYLES), 40 + (i % 5) * 220, 40 + (i // 5) * 120) for i in range(30)}
+    edges = {f"e{i}": (f"n{i}", f"n{i + 1}") for i in range(29)}
+    next_id = 30
+    revisions = [render(nodes, edges, minify)]
+    for _ in range(turns - 1):
+        # Each turn asks for 1-3 changes, as in a typical "move this / rename that / add a cache" session
+        for _ in range(rng.randint(1, 3)):
+            op = rng.random()
+            node_id = rng.choice(list(nodes))
+            label, style, x, y = nodes[node_id]
+            if op < 0.3:
+                nodes[node_id] = (f"{label.split(' v')[0]} v{rng.randint(2, 9)}", style, x, y)
+            elif op < 0.55:
+                nodes[node_id] = (label, style, x + rng.choice([-40, 40]), y + rng.choice([-20, 20]))
+            elif op < 0.8:
+                new_id = f"n{next_id}"
+                nodes[new_id] = (f"Component {next_id}", rng.choice(STYLES), x + 220, y + 120)
+                edges[f"e{next_id}"] = (node_id, new_id)
+                next_id += 1
+            elif op < 0.9 and len(nodes) > 10:
+                del nodes[node_id]
+                edges = {k: v for k, v in edges.items() if node_id not in v}
+            else:
+                nodes[node_id] = (label, rng.choice(STYLES), x, y)
+        revisions.append(render(nodes, edges, minify))
+    return revisions
+
+
+def measure(name, revisions):
+    inline = sum(len(json.dumps({"type": "tool_end", "content": text}).encode()) for text in revisions)
+    compressed = sum(len(zlib.compress(text.encode(), 6)) for text in revisions)
+
+    stored, chain, encode_seconds = 0, [], 0.0
+    previous, depth = None, 0
+    for text in revisions:
+        start = time.perf_counter()
+        base = previous if previous is not None and depth + 1 < SNAPSHOT_INTERVAL else None
+        data, is_delta = encode_revision(text, base)
+        encode_seconds += time.perf_counter() - start
+        depth = depth + 1 if is_delta else 0
+        chain.append((data, is_delta))
+        stored += len(data)
+        previous = text
+
+    # Worst case read: rebuild the revision just before the next snapshot
+    start = time.perf_counter()
+    worst = 0.0
+    text = None
+    for i, (data, is_delta) in enumerate(chain):
+        if not is_delta:
+            start = time.perf_counter()
+        text = decode_revision(data, text if is_delta else None)
+        assert text == revisions[i], f"revision {i} did not round-trip"
+        worst = max(worst, time.perf_counter() - start)
+
+    print(f"{name:>16}: {len(revisions)} revisions, avg {sum(map(len, revisions)) / len(revisions) / 1024:6.1f} KiB | "
+          f"inline {inline / 1024:8.1f} KiB | zlib each {compressed / 1024:7.1f} KiB | "
+          f"delta chain {stored / 1024:6.1f} KiB ({inline / stored:5.1f}x smaller) | "
+          f"encode {encode_seconds / len(revisions) * 1000:5.2f} ms/rev | worst rebuild {worst * 1000:5.2f} ms")
+
+
+if __name__ == "__main__":
+    turns = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    measure("drawio", edit_chain(drawio, turns))
+    measure("drawio minified", edit_chain(drawio, turns, minify=True))
+    measure("mermaid", edit_chain(mermaid, turns))
@@ -0,0 +1,140 @@
+"""
+Output-size benchmark for the compact Draw.io DSL (app/services/drawio_dsl.py).
+
+Offline (default): for representative architecture diagrams, compares the tokens the model has to
+generate as DSL with the equivalent mxGraph XML it writes under the XML prompt, the server-side
+expansion time and the estimated generation time at a given decode rate (tokens/s):
+
+    uv run python bench_drawio_dsl.py 40
+
+Live: sends the prompts to a running backend and reports time to tool_end and the size of the
+streamed code. Run it once with DRAWIO_COMPACT_DSL=true and once with =false:
+
+    uv run python bench_drawio_dsl.py live http://localhost:8000
+"""
+import json
+import sys
+import time
+from app.services.drawio_dsl import expand_drawio_dsl
+
+try:
+    import tiktoken
+    ENCODING = tiktoken.get_encoding("o200k_base")
+except Exception:  # tiktoken is optional (or its encoding can't be downloaded)
+    ENCODING = None
+
+SMALL = """direction LR
+client: Web Client [frontend]
+api: API Server [service]
+db: Database [database]
+client -> api -> db
+"""
+
+MEDIUM = """direction LR
+users: Customers [user]
+group edge: Edge [cloud] {
+  dns: Route 53 [dns]
+  cdn: CloudFront CDN [cdn]
+  waf: AWS WAF [security]
+}
+group app: Application VPC [vpc] {
+  alb: Application Load Balancer [lb]
+  api: API Gateway [gateway]
+  auth: Auth Service [auth]
+  orders: Order Service [service]
+  catalog: Catalog Service [service]
+  payments: Payment Service [service]
+  worker: Fulfilment Worker [lambda]
+}
+group data: Data [data] {
+  db: Orders DB (Aurora) [database]
+  cache: Redis Cache [cache]
+  queue: Order Events (SQS) [queue]
+  assets: Static Assets (S3) [bucket]
+}
+stripe: Stripe [saas]
+metrics: CloudWatch [monitoring]
+users -> dns -> cdn -> waf -> alb: HTTPS
+cdn -> assets
+alb -> api
+api -> auth
+api -> orders
+api -> catalog
+orders -> payments -> stripe
+orders -> db
+catalog -> cache
+orders --> queue: publish
+queue --> worker
+worker -> db
+api --> metrics: logs
+"""
+
+PROMPTS = [
+    "@drawio Simple client-server architecture with a database",
+    "@drawio E-commerce platform on AWS with CDN, WAF, microservices, queues, caching and monitoring",
+    "@drawio Multi-region Kubernetes platform with service mesh, CI/CD, observability stack and data tier",
+]
+
+
+def large(services: int = 12) -> str:
+    """A bigger platform: one group per domain, each with services, a store and a queue."""
+    lines = ["direction TB", "users: Users [user]", "gw: API Gateway [gateway]", "users -> gw"]
+    for i in range(services):
+        lines += [
+            f"group d{i}: Domain {i} [backend] {{",
+            f"  s{i}: Service {i}",
+            f"  w{i}: Worker {i} [function]",
+            f"  db{i}: Store {i} [database]",
+            "}",
+            f"gw -> s{i}",
+            f"s{i} -> db{i}",
+            f"s{i} --> w{i}: events",
+        ]
+        if i:
+            lines.append(f"s{i} -> s{i - 1}: sync")
+    return "\n".join(lines) + "\n"
+
+
+def count_tokens(text: str) -> int:
+    # Without tiktoken: ~4 characters per token, typical for code-like text
+    return len(ENCODING.encode(text)) if ENCODING else len(text) // 4
+
+
+def offline(tokens_per_second: float):
+    print(f"tokenizer: {'tiktoken o200k_base' if ENCODING else '~4 chars/token estimate'}, "
+          f"decode rate {tokens_per_second:g} tokens/s")
+    for name, dsl in (("small", SMALL), ("medium", MEDIUM), ("large", large())):
+        start = time.perf_counter()
+        xml = expand_drawio_dsl(dsl)
+        expand_ms = (time.perf_counter() - start) * 1000
+        dsl_tokens, xml_tokens = count_tokens(dsl), count_tokens(xml)
+        print(f"{name:>6}: {xml.count('<mxCell') - 2:3d} cells | XML {xml_tokens:6d} tokens "
+              f"({xml_tokens / tokens_per_second:6.1f} s) | DSL {dsl_tokens:5d} tokens "
+              f"({dsl_tokens / tokens_per_second:5.1f} s + {expand_ms:.1f} ms expansion) | "
+              f"{xml_tokens / dsl_tokens:.1f}x fewer tokens")
+
+
+def live(base_url: str):
+    import requests
+    import sseclient
+
+    for prompt in PROMPTS:
+        start = time.perf_counter()
+        code_chars, done = 0, None
+        response = requests.post(f"{base_url}/api/chat/completions", json={"prompt": prompt}, stream=True)
+        for event in sseclient.SSEClient(response).events():
+            if event.event == "tool_code":
+                code_chars += len(json.loads(event.data)["content"])
+            elif event.event == "tool_end":
+                done = time.perf_counter() - start
+            elif event.event == "error":
+                raise RuntimeError(event.data)
+        print(f"{prompt[:60]:60s} | streamed {code_chars:6d} chars | tool_end after "
+              f"{done if done is not None else float('nan'):.1f} s")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "live":
+        live(sys.argv[2] if len(sys.argv) > 2 else "http://localhost:8000")
+    else:
+        offline(float(sys.argv[1]) if len(sys.argv) > 1 else 40)
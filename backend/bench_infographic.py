@@ -0,0 +1,101 @@
+"""
+Template-selection benchmark for the infographic agent (app/services/template_selector.py).
+
+Offline (default): runs the local selector over a labelled set of requests (English and Chinese)
+and reports how often it picks a template of the expected category, how often it defers to the
+model (combined single call), and its latency:
+
+    uv run python bench_infographic.py
+
+Live: with a configured model (MODEL_ID / OPENAI_API_KEY / OPENAI_BASE_URL), times the LLM
+template-selection call that INFOGRAPHIC_TEMPLATE_SELECTION=local removes from every new
+infographic, and the time to first token of generation with the template-specific prompt vs the
+combined (catalogue) prompt:
+
+    uv run python bench_infographic.py live 5
+"""
+import asyncio
+import statistics
+import sys
+import time
+from langchain_core.messages import HumanMessage, SystemMessage
+from app.data.template_syntax import get_template_category
+from app.services.template_selector import select_template_locally
+
+# (request, expected category)
+REQUESTS = [
+    ("SWOT analysis of an electric vehicle startup", "compare"),
+    ("Pie chart of smartphone market share by brand", "chart"),
+    ("Quarterly revenue 2021-2024 as a column chart", "chart"),
+    ("iPhone vs Android for business users", "compare"),
+    ("Pros and cons of remote work", "compare"),
+    ("History of the internet from ARPANET to today", "sequence"),
+    ("Company milestones timeline", "sequence"),
+    ("Steps to deploy a web app", "sequence"),
+    ("Sales funnel from lead to customer", "sequence"),
+    ("Maslow's hierarchy of needs pyramid", "sequence"),
+    ("Org chart of a 50-person engineering team", "hierarchy"),
+    ("Mind map of machine learning concepts", "hierarchy"),
+    ("Top features of our new product", "list"),
+    ("Best practices for code review", "list"),
+    ("Approval workflow with dependencies between teams", "relation"),
+    ("Word cloud of customer feedback themes", "chart"),
+    ("Eisenhower priority matrix with four quadrants", "compare"),
+    ("公司组织架构图", "hierarchy"),
+    ("用户增长转化漏斗", "sequence"),
+    ("新员工入职流程步骤", "sequence"),
+    ("产品优缺点对比", "compare"),
+    ("2015-2024 公司发展历程", "sequence"),
+    ("各渠道销售额占比饼图", "chart"),
+    ("人工智能知识思维导图", "hierarchy"),
+    ("Explain how photosynthesis works", None),
+    ("The water cycle", "sequence"),
+]
+
+
+def offline():
+    correct, deferred = 0, 0
+    timings = []
+    for request, category in REQUESTS:
+        start = time.perf_counter()
+        template = select_template_locally(request)
+        timings.append((time.perf_counter() - start) * 1e6)
+        if template is None:
+            deferred += 1
+        elif get_template_category(template) == category:
+            correct += 1
+        print(f"{request[:48]:48s} -> {template or '(model picks in the generation call)'}")
+    chosen = len(REQUESTS) - deferred
+    print(f"\nlocal picks: {chosen}/{len(REQUESTS)} requests, {correct}/{chosen} in the expected category; "
+          f"selection median {statistics.median(timings):.0f} µs, max {max(timings):.0f} µs")
+
+
+async def time_to_first_token(llm, system: str, request: str) -> float:
+    start = time.perf_counter()
+    async for _ in llm.astream([SystemMessage(content=system), HumanMessage(content=request)]):
+        return time.perf_counter() - start
+    return time.perf_counter() - start
+
+
+async def live(rounds: int):
+    from app.agents.infographic import build_code_generator_prompt, build_combined_generator_prompt, select_template
+    from app.core.llm import get_llm
+
+    llm = get_llm(temperature=0.3)
+    selection, specific, combined = [], [], []
+    for request, _ in REQUESTS[:rounds]:
+        start = time.perf_counter()
+        template = await select_template(llm, request)
+        selection.append(time.perf_counter() - start)
+        specific.append(await time_to_first_token(llm, build_code_generator_prompt(template), request))
+        combined.append(await time_to_first_token(llm, build_combined_generator_prompt(), request))
+    print(f"LLM template selection (saved by local selection): median {statistics.median(selection) * 1000:.0f} ms")
+    print(f"first token, template prompt: median {statistics.median(specific) * 1000:.0f} ms; "
+          f"combined prompt: median {statistics.median(combined) * 1000:.0f} ms")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "live":
+        asyncio.run(live(int(sys.argv[2]) if len(sys.argv) > 2 else 5))
+    else:
+        offline()
@@ -0,0 +1,60 @@
+"""
+Time-to-first-token benchmark for /api/chat/completions against a running backend.
+
+Sends N follow-up turns in one session and reports the time until the first streamed token
+(`thought` / `design_concept_start` / `tool_start`). Compare the write-behind user-message insert
+with the serial path by restarting the backend with DB_WRITE_BEHIND=true and =false:
+
+    uv run python bench_ttft.py 20 http://localhost:8000
+"""
+import json
+import statistics
+import sys
+import time
+import requests
+import sseclient
+
+FIRST_TOKEN_EVENTS = {"thought", "design_concept_start", "tool_start"}
+
+
+def run_turn(base_url: str, payload: dict):
+    start = time.perf_counter()
+    first_token = None
+    created = []
+    response = requests.post(f"{base_url}/api/chat/completions", json=payload, stream=True)
+    for event in sseclient.SSEClient(response).events():
+        if event.event in FIRST_TOKEN_EVENTS and first_token is None:
+            first_token = time.perf_counter() - start
+        elif event.event in ("session_created", "message_created"):
+            created.append((event.event, json.loads(event.data)))
+        elif event.event == "error":
+            raise RuntimeError(event.data)
+    return first_token, created
+
+
+def main(n: int, base_url: str):
+    _, created = run_turn(base_url, {"prompt": "@mindmap warm-up"})
+    session_id = created[0][1]["session_id"]
+    parent_id = created[-1][1]["id"]
+
+    timings = []
+    for i in range(n):
+        first_token, created = run_turn(base_url, {
+            "prompt": f"@mindmap add a branch about topic {i}",
+            "session_id": session_id,
+            "parent_id": parent_id,
+        })
+        roles = [data["role"] for _, data in created]
+        assert roles == ["user", "assistant"], f"unexpected message_created order: {roles}"
+        parent_id = created[-1][1]["id"]
+        if first_token is not None:
+            timings.append(first_token * 1000)
+
+    timings.sort()
+    print(f"time to first token over {len(timings)} turns: "
+          f"median {statistics.median(timings):.1f} ms, p90 {timings[int(len(timings) * 0.9) - 1]:.1f} ms")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 20,
+         sys.argv[2] if len(sys.argv) > 2 else "http://localhost:8000")
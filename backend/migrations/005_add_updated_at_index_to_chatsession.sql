@@ -0,0 +1 @@
+CREATE INDEX IF NOT EXISTS idx_chatsession_updated_at_id ON chatsession (updated_at, id);
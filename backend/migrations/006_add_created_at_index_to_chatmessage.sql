@@ -0,0 +1 @@
+CREATE INDEX IF NOT EXISTS idx_chatmessage_session_created_at_id ON chatmessage (session_id, created_at, id);
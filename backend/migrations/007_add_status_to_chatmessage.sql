@@ -0,0 +1,9 @@
+DO $$
+BEGIN
+    IF NOT EXISTS (
+        SELECT 1 FROM information_schema.columns
+        WHERE table_name = 'chatmessage' AND column_name = 'status'
+    ) THEN
+        ALTER TABLE chatmessage ADD COLUMN status VARCHAR NOT NULL DEFAULT 'complete';
+    END IF;
+END $$;
@@ -0,0 +1,9 @@
+DO $$
+BEGIN
+    IF NOT EXISTS (
+        SELECT 1 FROM information_schema.columns
+        WHERE table_name = 'chatmessage' AND column_name = 'draft_output'
+    ) THEN
+        ALTER TABLE chatmessage ADD COLUMN draft_output TEXT;
+    END IF;
+END $$;
@@ -0,0 +1,9 @@
+DO $$
+BEGIN
+    IF NOT EXISTS (
+        SELECT 1 FROM information_schema.columns
+        WHERE table_name = 'chatsession' AND column_name = 'archive_key'
+    ) THEN
+        ALTER TABLE chatsession ADD COLUMN archive_key VARCHAR(64);
+    END IF;
+END $$;
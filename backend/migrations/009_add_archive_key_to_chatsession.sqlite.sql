@@ -0,0 +1 @@
+ALTER TABLE chatsession ADD COLUMN archive_key VARCHAR(64);
@@ -0,0 +1,9 @@
+DO $$
+BEGIN
+    IF NOT EXISTS (
+        SELECT 1 FROM information_schema.columns
+        WHERE table_name = 'chatsession' AND column_name = 'restored_at'
+    ) THEN
+        ALTER TABLE chatsession ADD COLUMN restored_at TIMESTAMP WITHOUT TIME ZONE;
+    END IF;
+END $$;
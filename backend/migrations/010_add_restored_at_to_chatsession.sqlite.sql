@@ -0,0 +1 @@
+ALTER TABLE chatsession ADD COLUMN restored_at TIMESTAMP;
@@ -0,0 +1,113 @@
+import asyncio
+
+from sqlalchemy import text
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+import app.services.artifact_service as artifact_service
+from app.core.config import settings
+from app.core.database import create_db_engine, migrate
+from app.models.chat import ArtifactRevision, ChatMessage
+from app.services.artifact_service import ArtifactService, apply_delta, encode_revision, make_delta
+from app.services.chat import ChatService
+
+
+def drawio(labels):
+    """Single-line Draw.io XML, the way models usually emit it."""
+    cells = "".join(
+        f'<mxCell id="n{i}" value="{label}" style="rounded=1;" vertex="1" parent="1">'
+        f'<mxGeometry x="{i * 160}" y="40" width="120" height="60" as="geometry"/></mxCell>'
+        for i, label in enumerate(labels)
+    )
+    return f'<mxfile><diagram><mxGraphModel><root><mxCell id="0"/><mxCell id="1" parent="0"/>{cells}</root></mxGraphModel></diagram></mxfile>'
+
+
+def mermaid(steps):
+    return "flowchart TD\n" + "\n".join(f"    s{i}[{step}] --> s{i + 1}" for i, step in enumerate(steps)) + "\n"
+
+
+def test_delta_round_trips():
+    labels = [f"Step {i}" for i in range(30)]
+    base = drawio(labels)
+    edited = drawio(labels[:10] + ["Review"] + labels[11:] + ["Deploy to prod"])
+    assert "\n" not in base
+    assert apply_delta(base, make_delta(base, edited)) == edited
+    # Split on ">", a small edit of one-line XML stays a small delta
+    data, is_delta = encode_revision(edited, base)
+    assert is_delta and len(data) < len(encode_revision(edited)[0]) / 2
+
+    base = mermaid([f"task {i}" for i in range(40)])
+    edited = base.replace("task 7]", "task 7 (reviewed)]").replace("    s30[task 30] --> s31\n", "") + "    s41 --> s0\n"
+    assert apply_delta(base, make_delta(base, edited)) == edited
+    assert apply_delta(base, make_delta(base, "")) == ""
+    assert apply_delta("", make_delta("", edited)) == edited
+
+
+def test_revision_chains_snapshot_interval_and_broken_chain(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "ARTIFACT_SNAPSHOT_INTERVAL", 3)
+    warnings = []
+    monkeypatch.setattr(artifact_service.logger, "warning", warnings.append)
+    engine = create_db_engine(f"sqlite+aiosqlite:///{tmp_path}/deepdiagram.db")
+
+    async def run():
+        await migrate(engine)
+        try:
+            async with AsyncSession(engine, expire_on_commit=False) as db:
+                session_id = (await ChatService(db).create_session("Artifacts")).id
+                artifacts = ArtifactService(db)
+                versions = [drawio([f"Step {j}" for j in range(20 + i)]) for i in range(7)]
+                ids = [await artifacts.store(session_id, "create_drawio", version) for version in versions]
+                await db.commit()
+
+                revisions = (await db.exec(select(ArtifactRevision).order_by(ArtifactRevision.id))).all()
+                assert [r.depth for r in revisions] == [0, 1, 2, 0, 1, 2, 0]
+                assert [r.base_id for r in revisions] == [None, ids[0], ids[1], None, ids[3], ids[4], None]
+                assert await ArtifactService(db).load(ids) == dict(zip(ids, versions))
+
+            # Lose the snapshot under revisions 4 and 5: they are skipped (and logged), the rest still load
+            async with engine.connect() as conn:
+                await conn.exec_driver_sql("PRAGMA foreign_keys=OFF")
+                await conn.execute(text(f"DELETE FROM artifactrevision WHERE id = {ids[3]}"))
+                await conn.commit()
+            async with AsyncSession(engine) as db:
+                texts = await ArtifactService(db).load(ids)
+            assert texts == {i: v for i, v in zip(ids, versions) if i not in ids[3:6]}
+            assert len(warnings) == 3 and all(f"broken chain at {ids[3]}" in w for w in warnings)
+        finally:
+            await engine.dispose()
+
+    asyncio.run(run())
+
+
+def test_packed_steps_unpack_to_the_original(tmp_path):
+    engine = create_db_engine(f"sqlite+aiosqlite:///{tmp_path}/deepdiagram.db")
+    steps = [
+        {"type": "agent_select", "name": "drawio", "status": "done"},
+        {"type": "tool_end", "name": "create_drawio", "content": drawio(["A", "B", "C"]), "status": "done"},
+        {"type": "tool_end", "name": "create_mermaid", "content": "graph TD\n  A --> B\n", "status": "done"},
+        "legacy step",
+    ]
+
+    async def run():
+        await migrate(engine)
+        try:
+            async with AsyncSession(engine, expire_on_commit=False) as db:
+                session_id = (await ChatService(db).create_session("Pack")).id
+                packed = await ArtifactService(db).pack_steps(session_id, steps)
+                # Only code past MIN_ARTIFACT_SIZE moves out of the step
+                assert packed[1]["content"] == "" and packed[1]["artifact_id"]
+                assert packed[0] == steps[0] and packed[2:] == steps[2:]
+                # Packing again keeps the reference without storing another revision
+                assert await ArtifactService(db).pack_steps(session_id, packed) == packed
+
+                messages = [ChatMessage(session_id=session_id, role="assistant", content="", steps=packed),
+                            ChatMessage(session_id=session_id, role="user", content="hi")]
+                await ArtifactService(db).unpack_messages(messages)
+                assert [{k: v for k, v in step.items() if k != "artifact_id"} if isinstance(step, dict) else step
+                        for step in messages[0].steps] == steps
+                assert messages[1].steps is None
+                assert (await db.exec(text("SELECT count(*) FROM artifactrevision"))).scalar() == 1
+        finally:
+            await engine.dispose()
+
+    asyncio.run(run())
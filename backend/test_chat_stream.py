@@ -0,0 +1,194 @@
+import asyncio
+import base64
+
+from langchain_core.messages import AIMessageChunk
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+import app.api.routes as routes
+import app.core.database as database
+import app.services.blob_store as blob_store
+import app.services.file_service as file_service
+from app.api.routes import CONTINUE_PROMPT, ChatRequest, event_generator
+from app.core.database import create_db_engine, migrate
+from app.models.chat import MESSAGE_COMPLETE, MESSAGE_INTERRUPTED, MESSAGE_STREAMING
+from app.services.blob_store import LocalBlobStore
+from app.services.chat import ChatService
+
+SPREADSHEET = {"name": "sales.xlsx", "data": "data:application/octet-stream;base64," + base64.b64encode(b"xlsx").decode()}
+REPORT = {"name": "report.pdf", "data": "data:application/pdf;base64," + base64.b64encode(b"%PDF").decode()}
+
+
+class RecordingGraph:
+    def __init__(self):
+        self.inputs = None
+
+    async def astream_events(self, inputs, version):
+        self.inputs = inputs
+        return
+        yield
+
+
+class StreamingGraph(RecordingGraph):
+    """Routes to the general agent and streams `chunks`, then fails if `error` is set."""
+
+    def __init__(self, chunks, delay=0.0, error=None):
+        super().__init__()
+        self.chunks, self.delay, self.error = chunks, delay, error
+
+    async def astream_events(self, inputs, version):
+        self.inputs = inputs
+        yield {"event": "on_chain_end", "data": {"output": {"intent": "general"}}, "metadata": {"langgraph_node": "router"}}
+        for chunk in self.chunks:
+            await asyncio.sleep(self.delay)
+            yield {"event": "on_chat_model_stream", "data": {"chunk": AIMessageChunk(content=chunk)},
+                   "metadata": {"langgraph_node": "general_agent"}}
+        if self.error:
+            raise self.error
+
+
+def query(tmp_path, statement):
+    async def run():
+        engine = create_db_engine(f"sqlite+aiosqlite:///{tmp_path}/deepdiagram.db")
+        try:
+            async with engine.connect() as conn:
+                return [tuple(row) for row in (await conn.execute(text(statement))).all()]
+        finally:
+            await engine.dispose()
+
+    return asyncio.run(run())
+
+
+def record_checkpoints(monkeypatch):
+    """Records (message id passed in, message id written, status) for every assistant checkpoint."""
+    calls = []
+    checkpoint_message = ChatService.checkpoint_message
+
+    async def recording(self, message_id, *args, **kwargs):
+        message = await checkpoint_message(self, message_id, *args, **kwargs)
+        calls.append((message_id, message.id, message.status))
+        return message
+
+    monkeypatch.setattr(ChatService, "checkpoint_message", recording)
+    return calls
+
+
+def run_stream(tmp_path, monkeypatch, request, graph=None):
+    """Runs the chat stream on SQLite with a graph that produces no output; returns the event names."""
+    engine = create_db_engine(f"sqlite+aiosqlite:///{tmp_path}/deepdiagram.db")
+    monkeypatch.setattr(database, "async_session_factory",
+                        async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False))
+    monkeypatch.setattr(blob_store, "_store", LocalBlobStore(str(tmp_path / "blobs")))
+    monkeypatch.setattr(routes, "graph", graph or RecordingGraph())
+
+    async def run():
+        await migrate(engine)
+        try:
+            return [event.split("\n")[0].removeprefix("event: ") async for event in event_generator(request)]
+        finally:
+            await engine.dispose()
+
+    return asyncio.run(run())
+
+
+def fake_documents(monkeypatch, parsed):
+    async def parse_file(self, filename, data, keep_full_data=False, **kwargs):
+        parsed.append((filename, keep_full_data))
+        return f"contents of {filename}"
+
+    async def extract_and_summarize(self, text, **kwargs):
+        yield {"index": -1, "content": "", "status": "done"}
+
+    monkeypatch.setattr(file_service.FileParsingService, "parse_file", parse_file)
+    monkeypatch.setattr(file_service.LLMExtractionService, "extract_and_summarize", extract_and_summarize)
+
+
+def test_spreadsheets_keep_full_data_when_routed_to_charts(tmp_path, monkeypatch):
+    for intent, keep_full_data in (("charts", True), ("mindmap", False)):
+        parsed = []
+        fake_documents(monkeypatch, parsed)
+
+        async def pre_route(messages, model_config=None, intent=intent):
+            return intent
+
+        monkeypatch.setattr(routes, "pre_route", pre_route)
+        graph = RecordingGraph()
+        request = ChatRequest(prompt="Plot revenue by region", files=[SPREADSHEET, REPORT])
+        run_stream(tmp_path / intent, monkeypatch, request, graph)
+        assert parsed == [("sales.xlsx", keep_full_data), ("report.pdf", keep_full_data)]
+        assert graph.inputs["intent"] == intent
+
+
+def test_router_runs_while_documents_are_extracted(tmp_path, monkeypatch):
+    log = []
+
+    async def parse_file(self, filename, data, **kwargs):
+        return "Q3 revenue grew 12%"
+
+    async def extract_and_summarize(self, text, **kwargs):
+        log.append("extraction started")
+        await asyncio.sleep(0.2)
+        log.append("extraction finished")
+        yield {"index": -1, "content": "Revenue summary", "status": "running"}
+        yield {"index": -1, "content": "", "status": "done"}
+
+    async def pre_route(messages, model_config=None):
+        log.append("router started")
+        await asyncio.sleep(0.05)
+        log.append("router finished")
+        return "charts"
+
+    class Graph(RecordingGraph):
+        async def astream_events(self, inputs, version):
+            log.append("agent started")
+            self.inputs = inputs
+            return
+            yield
+
+    monkeypatch.setattr(file_service.FileParsingService, "parse_file", parse_file)
+    monkeypatch.setattr(file_service.LLMExtractionService, "extract_and_summarize", extract_and_summarize)
+    monkeypatch.setattr(routes, "pre_route", pre_route)
+    graph = Graph()
+    run_stream(tmp_path, monkeypatch, ChatRequest(prompt="Chart this report", files=[REPORT]), graph)
+
+    # The router's round trip overlaps extraction; its decision waits for the document context
+    assert log.index("router finished") < log.index("extraction finished")
+    assert log[-2:] == ["extraction finished", "agent started"]
+    assert graph.inputs["intent"] == "charts"
+    assert "Document Context:\nRevenue summary" in graph.inputs["messages"][-1].content
+
+
+def test_draft_is_inserted_once_then_updated_and_finalized(tmp_path, monkeypatch):
+    monkeypatch.setattr(routes.settings, "DRAFT_CHECKPOINT_SECONDS", 0.02)
+    calls = record_checkpoints(monkeypatch)
+    graph = StreamingGraph([f"part {i}. " for i in range(8)], delay=0.03)
+    events = run_stream(tmp_path, monkeypatch, ChatRequest(prompt="Explain queues"), graph)
+    assert events[-1] == "message_created"
+
+    draft_id = calls[0][1]
+    assert calls[0][0] is None and len(calls) > 2
+    assert all(call[:2] == (draft_id, draft_id) for call in calls[1:])
+    assert [call[2] for call in calls] == [MESSAGE_STREAMING] * (len(calls) - 1) + [MESSAGE_COMPLETE]
+    rows = query(tmp_path, "SELECT id, content, status, draft_output FROM chatmessage WHERE role = 'assistant'")
+    assert rows == [(draft_id, "".join(graph.chunks), MESSAGE_COMPLETE, None)]
+
+
+def test_interrupted_reply_keeps_its_draft_and_can_be_resumed(tmp_path, monkeypatch):
+    monkeypatch.setattr(routes.settings, "DRAFT_CHECKPOINT_SECONDS", 0.02)
+    graph = StreamingGraph(["Queues decouple ", "producers from "], delay=0.03, error=RuntimeError("connection reset"))
+    assert run_stream(tmp_path, monkeypatch, ChatRequest(prompt="Explain queues"), graph)[-1] == "error"
+
+    [(session_id, user_id)] = query(tmp_path, "SELECT session_id, id FROM chatmessage WHERE role = 'user'")
+    [(draft_id, status, draft_output)] = query(
+        tmp_path, "SELECT id, status, draft_output FROM chatmessage WHERE role = 'assistant'")
+    assert status == MESSAGE_INTERRUPTED and draft_output == "Queues decouple producers from "
+
+    graph = StreamingGraph(["consumers."])
+    request = ChatRequest(prompt="Explain queues", session_id=session_id, is_retry=True, parent_id=user_id,
+                          resume_message_id=draft_id)
+    assert run_stream(tmp_path, monkeypatch, request, graph)[-1] == "message_created"
+    assert [m.content for m in graph.inputs["messages"][-2:]] == [draft_output, CONTINUE_PROMPT]
+    assert graph.inputs["intent"] == "general"
+    resumed = query(tmp_path, f"SELECT content, status, parent_id FROM chatmessage WHERE id > {draft_id}")
+    assert resumed == [("Queues decouple producers from consumers.", MESSAGE_COMPLETE, user_id)]
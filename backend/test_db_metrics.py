@@ -0,0 +1,80 @@
+import time
+
+from sqlalchemy import bindparam, create_engine, event, text
+
+from app.core.db_metrics import PoolMetrics, QueryMetrics, query_shape
+
+
+def instrumented_engine(tmp_path, slow_query_ms):
+    """A file-backed SQLite engine (QueuePool, 5 + 10 connections) wired up like app.core.database."""
+    engine = create_engine(f"sqlite:///{tmp_path}/metrics.db")
+    event.listen(engine, "connect", lambda conn, record: conn.create_function(
+        "sleep_ms", 1, lambda ms: time.sleep(ms / 1000) or ms))
+    pool_metrics = PoolMetrics(engine.pool)
+    event.listen(engine.pool, "checkout", pool_metrics.on_checkout)
+    event.listen(engine.pool, "checkin", pool_metrics.on_checkin)
+    query_metrics = QueryMetrics(slow_query_ms=slow_query_ms)
+    event.listen(engine, "before_cursor_execute", query_metrics.before_execute)
+    event.listen(engine, "after_cursor_execute", query_metrics.after_execute)
+    event.listen(engine, "handle_error", query_metrics.on_error)
+    return engine, pool_metrics, query_metrics
+
+
+def test_literals_and_in_lists_share_a_shape():
+    shape = "SELECT * FROM message WHERE session_id = ? AND id IN (...)"
+    assert query_shape("SELECT * FROM message\n  WHERE session_id = ? AND id IN (?, ?, ?)") == shape
+    assert query_shape("SELECT * FROM message WHERE session_id = 7 AND id IN (1, 2)") == shape
+    assert query_shape("SELECT * FROM message WHERE session_id = $1 AND id IN ($2::int, $3::int)") \
+        == shape.replace("= ?", "= $1")
+    assert query_shape("SELECT * FROM message WHERE title = 'it''s' AND v2 > 0.5") \
+        == "SELECT * FROM message WHERE title = ? AND v2 > ?"
+
+
+def test_query_shapes_and_slow_query_threshold(tmp_path):
+    engine, _, metrics = instrumented_engine(tmp_path, slow_query_ms=50)
+    try:
+        with engine.connect() as conn:
+            conn.execute(text("CREATE TABLE item (id INTEGER PRIMARY KEY)"))
+            conn.execute(text("INSERT INTO item (id) VALUES (1), (2), (3), (4)"))
+            lookup = text("SELECT id FROM item WHERE id IN :ids").bindparams(bindparam("ids", expanding=True))
+            for ids in ([1], [1, 2], [1, 2, 3, 4]):
+                conn.execute(lookup, {"ids": ids})
+            conn.execute(text("SELECT id FROM item WHERE id IN (2, 3)"))
+            assert metrics.slow_queries == 0
+
+            conn.execute(text("SELECT sleep_ms(80)"))
+            assert metrics.slow_queries == 1
+    finally:
+        engine.dispose()
+
+    shapes = {shape["query"]: shape for shape in metrics.snapshot()["shapes"]}
+    assert shapes["SELECT id FROM item WHERE id IN (...)"]["count"] == 4
+    assert shapes["SELECT sleep_ms(...)"]["max_ms"] >= 80
+    assert shapes["SELECT sleep_ms(...)"]["p50_ms"] == 100
+
+    # A threshold of 0 turns slow-query logging off
+    engine, _, disabled = instrumented_engine(tmp_path, slow_query_ms=0)
+    try:
+        with engine.connect() as conn:
+            conn.execute(text("SELECT sleep_ms(80)"))
+    finally:
+        engine.dispose()
+    assert disabled.slow_queries == 0
+
+
+def test_pool_checkout_and_checkin_counters(tmp_path):
+    engine, metrics, _ = instrumented_engine(tmp_path, slow_query_ms=0)
+    try:
+        assert metrics.capacity == 15
+        first, second = engine.connect(), engine.connect()
+        assert (metrics.checkouts, metrics.in_use, metrics.peak_in_use) == (2, 2, 2)
+        first.close()
+        assert (metrics.checkouts, metrics.in_use) == (2, 1)
+        second.close()
+        with engine.connect():
+            pass
+        snapshot = metrics.snapshot()
+        assert (snapshot["checkouts"], snapshot["in_use"], snapshot["peak_in_use"]) == (3, 0, 2)
+        assert snapshot["avg_hold_ms"] is not None and snapshot["saturated_checkouts"] == 0
+    finally:
+        engine.dispose()
@@ -0,0 +1,88 @@
+import xml.etree.ElementTree as ET
+
+from app.services.drawio_dsl import expand_drawio_dsl, is_drawio_dsl, parse_drawio_dsl
+from app.services.partial_artifact import partial_artifact
+
+DSL = """```
+direction LR
+users: Customers [user]
+users -> api: HTTPS
+group vpc: VPC [vpc] {
+  api: API <Gateway> [gateway]
+  group svc: Services {
+    orders: Order\\nService
+    pay: Payments [lambda]
+  }
+  # comment
+}
+db: Orders DB [db]
+api -> orders -> db
+orders --> pay <-> stripe: "charge"
+"""
+
+
+def cells(xml):
+    return {cell.get("id"): cell for cell in ET.fromstring(xml).iter("mxCell")}
+
+
+def box(cell):
+    geometry = cell.find("mxGeometry")
+    return tuple(float(geometry.get(key)) for key in ("x", "y", "width", "height"))
+
+
+def test_parse_resolves_groups_kinds_and_forward_references():
+    diagram = parse_drawio_dsl(DSL)
+    assert diagram.direction == "LR"
+    assert diagram.children == ["users", "vpc", "db", "stripe"]
+    assert diagram.groups["svc"].parent == "vpc" and diagram.groups["svc"].children == ["orders", "pay"]
+    # `api` was first named in an edge at the top level; its declaration moves it into the VPC
+    assert diagram.nodes["api"].group == "vpc" and diagram.nodes["api"].kind == "gateway"
+    assert (diagram.nodes["db"].kind, diagram.nodes["pay"].kind, diagram.nodes["stripe"].kind) == ("database", "function", "service")
+    assert [(e.source, e.target, e.dashed, e.both) for e in diagram.edges][-2:] == [
+        ("orders", "pay", True, False), ("pay", "stripe", False, True)]
+
+
+def test_expansion_is_valid_xml_with_nested_non_overlapping_geometry():
+    by_id = cells(expand_drawio_dsl(DSL))
+    assert by_id["api"].get("value") == "API &lt;Gateway&gt;"
+    assert by_id["orders"].get("value") == "Order<br>Service"
+    assert by_id["orders"].get("parent") == "svc" and by_id["svc"].get("parent") == "vpc"
+    edges = [cell for cell in by_id.values() if cell.get("edge")]
+    assert {(e.get("source"), e.get("target")) for e in edges} >= {("users", "api"), ("orders", "db")}
+
+    # Children sit inside their group (coordinates are relative to it), below its title bar
+    for child, group in (("orders", "svc"), ("pay", "svc"), ("api", "vpc"), ("svc", "vpc")):
+        x, y, width, height = box(by_id[child])
+        _, _, group_width, group_height = box(by_id[group])
+        assert x >= 0 and y >= 30 and x + width <= group_width and y + height <= group_height
+
+    def overlap(a, b):
+        return a[0] < b[0] + b[2] and b[0] < a[0] + a[2] and a[1] < b[1] + b[3] and b[1] < a[1] + a[3]
+    for parent in ("1", "vpc", "svc"):
+        siblings = [box(cell) for cell in by_id.values() if cell.get("vertex") and cell.get("parent") == parent]
+        assert len(siblings) >= 2
+        assert not any(overlap(a, b) for i, a in enumerate(siblings) for b in siblings[i + 1:])
+
+
+def test_streamed_dsl_snapshots_and_format_detection():
+    assert is_drawio_dsl("") is None and is_drawio_dsl("```xml\n") is None
+    assert is_drawio_dsl("```xml\n<mxfile>") is False and is_drawio_dsl("  direction LR") is True
+
+    artifact, seen = partial_artifact("drawio"), []
+    for position in range(0, len(DSL), 5):
+        artifact.feed(DSL[position:position + 5])
+        seen.append(artifact.snapshot())
+    assert artifact.repairer is None
+    snapshots = [snapshot for snapshot in seen if snapshot]
+    assert all(ET.fromstring(snapshot) is not None for snapshot in snapshots)
+    assert snapshots[-1] == expand_drawio_dsl(DSL)
+
+
+def test_generated_ids_never_collide_with_node_names():
+    xml = expand_drawio_dsl("e1: Start\ne2: End\n0: Root\nn-0: Other\ne1 -> e2\ne2 -> 0\n0 -> n-0")
+    ids = [cell.get("id") for cell in ET.fromstring(xml).iter("mxCell")]
+    assert len(ids) == len(set(ids)) == 2 + 4 + 3
+    by_id = cells(xml)
+    assert by_id["e1"].get("vertex") and by_id["e2"].get("vertex") and by_id["n-0"].get("value") == "Other"
+    edges = [cell for cell in by_id.values() if cell.get("edge")]
+    assert [(e.get("source"), e.get("target")) for e in edges] == [("e1", "e2"), ("e2", "n-0-2"), ("n-0-2", "n-0")]
@@ -0,0 +1,84 @@
+import random
+import xml.etree.ElementTree as ET
+
+from app.services.drawio_repair import DrawioRepairer, repair_drawio_xml
+
+BROKEN = """<mxfile host="app.diagrams.net">
+  <diagram name="Page-1">
+    <mxGraphModel>
+      <root>
+        <mxCell id="0" />
+        <mxCell id="1" parent="0" />
+        <mxCell id="2" value="a &gt; b" vertex="1" parent="1">
+          <mxGeometry x="100" y="100" width="120" height="60" as="geometry" />
+        </mxCell>
+        <mxCell id="2" value='x > y' vertex="1" parent="1">
+          <mxGeometry x="300" y="100" width="120" height="60" as="geometry" />
+        </mxCell>
+        <!-- <mxCell id="9"/> -->
+        <mxCell id="e1" edge="1" parent="1" source="2" target="9">
+          <mxGeometry relative="1" as="geometry">
+            <Array as="points"><mxPoint x="1" y="2" /></Array>
+          </mxGeometry>
+        </mxCell></mxGeometry>
+        <mxCell id="3" value="trunc"""
+
+
+def kinds(result):
+    return {diagnostic["kind"]: diagnostic["count"] for diagnostic in result.diagnostics}
+
+
+def test_repair_produces_valid_mxgraph():
+    result = repair_drawio_xml(BROKEN)
+    root = ET.fromstring(result.xml)
+    cells = root.findall(".//mxCell")
+    assert [cell.get("id") for cell in cells] == ["0", "1", "2", "2-2", "e1"]
+    assert cells[-1].get("source") == "2" and cells[-1].get("target") is None
+    assert root.find(".//Array") is None and root.find(".//mxPoint") is None
+    assert kinds(result) == {
+        "array_removed": 1, "duplicate_id": 1, "dangling_reference": 1, "stray_end_tag": 1,
+        "unclosed_tag": 4, "truncated_tag": 1,
+    }
+
+
+def test_streamed_chunks_give_the_same_result():
+    expected = repair_drawio_xml(BROKEN)
+    for seed in range(50):
+        rng = random.Random(seed)
+        repairer, position = DrawioRepairer(), 0
+        while position < len(BROKEN):
+            size = rng.randint(1, 12)
+            repairer.feed(BROKEN[position:position + size])
+            position += size
+        result = repairer.finish()
+        assert repairer.received == len(BROKEN)
+        assert (result.xml, result.diagnostics) == (expected.xml, expected.diagnostics)
+
+
+def test_valid_and_non_drawio_output_is_unchanged():
+    valid = BROKEN.split("<!--")[0].replace('id="2" value=\'', 'id="3" value=\'') + "</root></mxGraphModel></diagram></mxfile>"
+    result = repair_drawio_xml(valid)
+    assert result.xml == valid and result.diagnostics == []
+    assert repair_drawio_xml("graph TD; a --> b <").xml == "graph TD; a --> b <"
+
+
+def test_object_wrapped_cells_keep_their_ids_and_edges():
+    wrapped = """<mxfile><diagram><mxGraphModel><root>
+        <mxCell id="0" /><mxCell id="1" parent="0" />
+        <UserObject label="API" link="https://example.com" id="a">
+          <mxCell style="rounded=1;" vertex="1" parent="1"><mxGeometry width="120" height="60" as="geometry" /></mxCell>
+        </UserObject>
+        <object label="DB" owner="data team" id="b">
+          <mxCell vertex="1" parent="1"><mxGeometry x="200" width="120" height="60" as="geometry" /></mxCell>
+        </object>
+        <object label="reads" id="c">
+          <mxCell edge="1" parent="1" source="a" target="b"><mxGeometry relative="1" as="geometry" /></mxCell>
+        </object>
+    </root></mxGraphModel></diagram></mxfile>"""
+    result = repair_drawio_xml(wrapped)
+    assert result.xml == wrapped and result.diagnostics == []
+
+    duplicate = wrapped.replace('id="c"', 'id="a"').replace('target="b"', 'target="missing"')
+    result = repair_drawio_xml(duplicate)
+    assert [item["kind"] for item in result.diagnostics] == ["duplicate_id", "dangling_reference"]
+    assert '<object id="a-2" label="reads">' in result.xml and 'source="a"' in result.xml
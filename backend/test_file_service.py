@@ -0,0 +1,132 @@
+import asyncio
+import ipaddress
+from types import SimpleNamespace
+
+import fitz
+import pytest
+from pydantic import ValidationError
+from starlette.requests import Request
+
+import app.api.routes as routes
+import app.services.file_service as file_service
+from app.api.routes import ChatRequest, get_client_id
+from app.services.extraction_scheduler import ExtractionScheduler
+from app.services.pdf_service import extract_pdf_text
+
+
+class MockLLM:
+    """Fake streaming LLM that never finishes on its own and tracks open calls."""
+
+    def __init__(self):
+        self.in_flight = 0
+        self.started = 0
+
+    async def astream(self, messages):
+        self.in_flight += 1
+        self.started += 1
+        try:
+            while True:
+                yield SimpleNamespace(content="token ")
+                await asyncio.sleep(0.01)
+        finally:
+            self.in_flight -= 1
+
+
+def make_service(monkeypatch, llm):
+    monkeypatch.setattr(file_service, "get_llm", lambda **kwargs: llm)
+    service = file_service.LLMExtractionService()
+    service.chunk_size = 10
+    return service
+
+
+def test_extraction_tasks_cancelled_on_generator_close(monkeypatch):
+    llm = MockLLM()
+    service = make_service(monkeypatch, llm)
+
+    async def run():
+        stream = service.extract_and_summarize("x" * 50, concurrency=3)
+        await stream.__anext__()
+        await asyncio.sleep(0.05)
+        assert llm.in_flight == 3
+
+        # Client goes away: the route closes the extraction generator
+        await stream.aclose()
+        assert llm.in_flight == 0
+
+    asyncio.run(run())
+
+
+def test_extraction_tasks_cancelled_on_consumer_cancel(monkeypatch):
+    llm = MockLLM()
+    service = make_service(monkeypatch, llm)
+
+    async def consume():
+        async for _ in service.extract_and_summarize("x" * 30, concurrency=2):
+            pass
+
+    async def run():
+        consumer = asyncio.create_task(consume())
+        await asyncio.sleep(0.05)
+        assert llm.in_flight == 2
+
+        # Starlette cancels the response task when the SSE client disconnects
+        consumer.cancel()
+        await asyncio.gather(consumer, return_exceptions=True)
+        assert llm.in_flight == 0
+        # Queued chunks waiting on the semaphore never reach the LLM
+        assert llm.started == 2
+
+    asyncio.run(run())
+
+
+def test_pdf_page_bound_must_be_positive():
+    with fitz.open() as doc:
+        for number in range(1, 4):
+            doc.new_page().insert_text((72, 72), f"Body text of page {number}")
+        pdf = doc.tobytes()
+
+    text = asyncio.run(extract_pdf_text(pdf, max_pages=2))
+    assert "page 2" in text and "page 3" not in text
+    with pytest.raises(ValueError):
+        asyncio.run(extract_pdf_text(pdf, max_pages=-1))
+    with pytest.raises(ValidationError):
+        ChatRequest(prompt="summarize", pdf_max_pages=0)
+
+
+def test_scheduler_shares_budget_round_robin_across_users():
+    scheduler = ExtractionScheduler(max_workers=2)
+    granted, peak = [], 0
+
+    async def call(user):
+        nonlocal peak
+        async with scheduler.slot(user):
+            granted.append(user)
+            peak = max(peak, scheduler.active)
+            await asyncio.sleep(0.01)
+
+    async def run():
+        # A big upload queues six calls before a second user asks for two
+        heavy = [asyncio.create_task(call("heavy")) for _ in range(6)]
+        await asyncio.sleep(0)
+        light = [asyncio.create_task(call("light")) for _ in range(2)]
+        await asyncio.gather(*heavy, *light)
+
+    asyncio.run(run())
+    assert peak == 2 and scheduler.active == 0
+    # FIFO would serve "light" last; round-robin interleaves it right after the running calls
+    assert granted == ["heavy", "heavy", "heavy", "light", "heavy", "light", "heavy", "heavy"]
+
+
+def test_client_id_ignores_forwarded_for_unless_peer_is_trusted_proxy(monkeypatch):
+    def request(peer, forwarded=None):
+        headers = [(b"x-forwarded-for", forwarded.encode())] if forwarded else []
+        return Request({"type": "http", "headers": headers, "client": (peer, 1234)})
+
+    assert get_client_id(request("203.0.113.7", "1.2.3.4")) == "203.0.113.7"
+
+    monkeypatch.setattr(routes, "TRUSTED_PROXY_NETWORKS", [ipaddress.ip_network("10.0.0.0/8")])
+    # The proxy appends the address it saw; the spoofed entry on the left is ignored
+    assert get_client_id(request("10.0.0.2", "1.2.3.4, 198.51.100.9")) == "198.51.100.9"
+    assert get_client_id(request("10.0.0.2", "198.51.100.9, 10.0.0.5")) == "198.51.100.9"
+    assert get_client_id(request("10.0.0.2")) == "10.0.0.2"
+    assert get_client_id(request("203.0.113.7", "1.2.3.4")) == "203.0.113.7"
@@ -0,0 +1,88 @@
+import json
+import random
+import time
+
+from app.agents.flow import FLOW_AUTO_LAYOUT_SYSTEM_PROMPT
+from app.services.flow_layout import flow_node_size, layout_flow_code
+from app.services.layout import layered_layout
+from app.services.partial_artifact import partial_artifact
+
+FLOW = {
+    "nodes": [
+        {"id": "1", "type": "start", "data": {"label": "Start"}},
+        {"id": "2", "type": "process", "data": {"label": "Validate order and reserve inventory"}},
+        {"id": "3", "type": "decision", "data": {"label": "In stock?"}},
+        {"id": "4", "type": "process", "data": {"label": "Backorder"}},
+        {"id": "5", "type": "process", "data": {"label": "Charge card"}},
+        {"id": "6", "type": "end", "data": {"label": "Done"}},
+    ],
+    "edges": [
+        {"id": "e1", "source": "1", "target": "2"},
+        {"id": "e2", "source": "2", "target": "3"},
+        {"id": "e3", "source": "3", "target": "4", "label": "No"},
+        {"id": "e4", "source": "3", "target": "5", "label": "Yes"},
+        {"id": "e5", "source": "4", "target": "2", "label": "Retry"},
+        {"id": "e6", "source": "5", "target": "6"},
+        {"id": "e7", "source": "1", "target": "6"},
+    ],
+}
+
+
+def boxes(data):
+    return {node["id"]: (node["position"]["x"], node["position"]["y"], *flow_node_size(node)) for node in data["nodes"]}
+
+
+def overlaps(placed):
+    items = list(placed.values())
+    return [(a, b) for i, a in enumerate(items) for b in items[i + 1:]
+            if a[0] < b[0] + b[2] and b[0] < a[0] + a[2] and a[1] < b[1] + b[3] and b[1] < a[1] + a[3]]
+
+
+def test_flow_without_positions_is_laid_out_top_down():
+    data = json.loads(layout_flow_code(json.dumps(FLOW)))
+    placed = boxes(data)
+    assert not overlaps(placed)
+    # Forward edges point down; the retry loop is the only edge going back up
+    for edge in data["edges"]:
+        going_down = placed[edge["target"]][1] > placed[edge["source"]][1]
+        assert going_down == (edge["id"] != "e5")
+    # The two branches of the decision share a layer, either side of it
+    assert placed["4"][1] == placed["5"][1]
+    centers = sorted(placed[branch][0] + placed[branch][2] / 2 for branch in "45")
+    assert centers[0] < placed["3"][0] + placed["3"][2] / 2 < centers[1]
+
+    positioned = json.dumps(data)
+    assert layout_flow_code(positioned) == positioned
+    assert layout_flow_code("not json {") == "not json {"
+    assert '"position"' not in FLOW_AUTO_LAYOUT_SYSTEM_PROMPT
+
+
+def test_layout_uncrosses_edges_and_scales():
+    layout = layered_layout({n: (50, 30) for n in "abcd"}, [("a", "d"), ("b", "c")])
+    x = {node: position[0] for node, position in layout.positions.items()}
+    assert (x["a"] < x["b"]) == (x["d"] < x["c"])
+
+    # Random edges make long edges (many dummy points) and deep layering: the expensive case
+    rng = random.Random(7)
+    sizes = {i: (200, 80) for i in range(500)}
+    edges = [(rng.randrange(500), rng.randrange(500)) for _ in range(1000)]
+    timings = []
+    for _ in range(3):
+        started = time.perf_counter()
+        layout = layered_layout(sizes, edges)
+        timings.append(time.perf_counter() - started)
+    assert min(timings) < 0.1
+    placed = {node: (x, y, *sizes[node]) for node, (x, y) in layout.positions.items()}
+    assert len(placed) == 500 and not overlaps(placed)
+
+
+def test_streamed_flow_snapshots_have_positions():
+    code = json.dumps(FLOW, indent=1)
+    artifact, seen = partial_artifact("flowchart"), []
+    for position in range(0, len(code), 9):
+        artifact.feed(code[position:position + 9])
+        snapshot = artifact.snapshot()
+        if snapshot and json.loads(snapshot).get("nodes"):
+            seen.append(json.loads(snapshot))
+    assert seen and all("position" in node for data in seen for node in data["nodes"])
+    assert seen[-1] == json.loads(layout_flow_code(code))
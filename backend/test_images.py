@@ -0,0 +1,94 @@
+import asyncio
+import base64
+import io
+from types import SimpleNamespace
+
+from PIL import Image
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+import app.core.database as database
+import app.services.blob_store as blob_store
+import app.services.image_service as image_service
+from app.core.config import settings
+from app.core.database import create_db_engine, migrate
+from app.services.blob_store import LocalBlobStore
+from app.services.image_service import (
+    MISSING_CAPTION, ImageCaptionService, normalize_image, select_pixel_images, store_image,
+)
+
+
+def image_bytes(size, mode="RGB", fmt="PNG"):
+    buffer = io.BytesIO()
+    Image.new(mode, size, (200, 30, 30, 128) if mode == "RGBA" else (200, 30, 30)).save(buffer, fmt)
+    return buffer.getvalue()
+
+
+def data_uri(data, content_type="image/png"):
+    return f"data:{content_type};base64,{base64.b64encode(data).decode()}"
+
+
+class FakeVisionModel:
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.calls = 0
+
+    async def ainvoke(self, messages):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        return SimpleNamespace(content=f"A red square, caption {self.calls}")
+
+
+def test_images_are_downscaled_and_newest_kept_as_pixels(monkeypatch):
+    monkeypatch.setattr(settings, "IMAGE_MAX_EDGE", 400)
+    data, content_type = normalize_image(image_bytes((1600, 800)), "image/png")
+    assert content_type == "image/jpeg" and Image.open(io.BytesIO(data)).size == (400, 200)
+    data, content_type = normalize_image(image_bytes((1600, 800), "RGBA"), "image/png")
+    assert content_type == "image/png" and Image.open(io.BytesIO(data)).size == (400, 200)
+    small = image_bytes((10, 10))
+    assert normalize_image(small, "image/png") == (small, "image/png")
+    assert normalize_image(b"not an image", "image/png") == (b"not an image", "image/png")
+
+    history = [["a1", "a2"], ["b1"], [], ["c1", "c2"]]
+    assert select_pixel_images(history, 3) == {"c1", "c2", "b1"}
+    assert select_pixel_images(history, 1) == {"c2"}
+    assert select_pixel_images(history, 0) == set()
+
+
+def test_captions_are_cached_capped_and_bounded(tmp_path, monkeypatch):
+    engine = create_db_engine(f"sqlite+aiosqlite:///{tmp_path}/deepdiagram.db")
+    monkeypatch.setattr(database, "async_session_factory",
+                        async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False))
+    monkeypatch.setattr(image_service, "session_scope", database.session_scope)
+    monkeypatch.setattr(blob_store, "_store", LocalBlobStore(str(tmp_path / "blobs")))
+    monkeypatch.setattr(settings, "IMAGE_CAPTIONS_PER_REQUEST", 2)
+    monkeypatch.setattr(settings, "IMAGE_CAPTION_WAIT_SECONDS", 5)
+    model = FakeVisionModel()
+    monkeypatch.setattr(image_service, "get_llm", lambda **kwargs: model)
+
+    async def run():
+        await migrate(engine)
+        try:
+            refs = [await store_image(data_uri(image_bytes((20 + i, 20)))) for i in range(4)]
+            service = ImageCaptionService()
+
+            # Only the newest two missing captions are generated for this request
+            captions = await service.captions(refs)
+            assert [captions[ref] == MISSING_CAPTION for ref in refs] == [True, True, False, False]
+            assert model.calls == 2
+            captions = await service.captions(refs)
+            assert model.calls == 4 and MISSING_CAPTION not in captions.values()
+            # Cache hits: no more model calls
+            assert await service.captions(refs) == captions and model.calls == 4
+
+            # A slow caption doesn't hold up the request; it finishes in the background
+            model.delay = 0.3
+            monkeypatch.setattr(settings, "IMAGE_CAPTION_WAIT_SECONDS", 0.05)
+            slow = await store_image(data_uri(image_bytes((50, 20))))
+            assert (await service.captions([slow]))[slow] == MISSING_CAPTION
+            await asyncio.sleep(0.4)
+            assert (await service.captions([slow]))[slow] != MISSING_CAPTION and model.calls == 5
+        finally:
+            await engine.dispose()
+
+    asyncio.run(run())
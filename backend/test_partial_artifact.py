@@ -0,0 +1,63 @@
+import json
+import xml.etree.ElementTree as ET
+
+from app.services.partial_artifact import partial_artifact
+
+FLOW = json.dumps({
+    "nodes": [{"id": str(i), "position": {"x": 0, "y": i * 100}, "data": {"label": f"Step \"{i}\" \\ {{x}}"}}
+              for i in range(4)],
+    "edges": [{"id": f"e{i}", "source": str(i), "target": str(i + 1)} for i in range(3)],
+}, indent=1)
+
+MERMAID = """flowchart TD
+    subgraph API [API layer]
+        A[Gateway] --> B{Auth?}
+    end
+    subgraph Data
+        B --> C[(DB)]
+        B --> D[Cache]
+    end
+"""
+
+DRAWIO = """<mxfile><diagram><mxGraphModel><root><mxCell id="0"/><mxCell id="1" parent="0"/>
+<mxCell id="2" value="A" vertex="1" parent="1"><mxGeometry x="0" y="0" width="80" height="40" as="geometry"/></mxCell>
+<mxCell id="e" edge="1" parent="1" source="2" target="3"><mxGeometry relative="1" as="geometry"/></mxCell>
+<mxCell id="3" value="B" vertex="1" parent="1"><mxGeometry x="200" y="0" width="80" height="40" as="geometry"/></mxCell>
+</root></mxGraphModel></diagram></mxfile>"""
+
+
+def snapshots(agent, code, size=3):
+    artifact = partial_artifact(agent)
+    result = []
+    for position in range(0, len(code), size):
+        artifact.feed(code[position:position + size])
+        result.append(artifact.snapshot())
+    return result
+
+
+def test_json_snapshots_parse_and_only_hold_complete_items():
+    seen = [json.loads(snapshot) for snapshot in snapshots("flowchart", FLOW) if snapshot]
+    assert seen[-1] == json.loads(FLOW)
+    for data in seen:
+        assert all(node == json.loads(FLOW)["nodes"][i] for i, node in enumerate(data.get("nodes", [])))
+    assert len({json.dumps(data) for data in seen}) > 5
+
+
+def test_mermaid_snapshots_close_open_blocks():
+    seen = [snapshot for snapshot in snapshots("mermaid", MERMAID) if snapshot]
+    assert seen[-1] == MERMAID.rstrip()
+    inside_data = next(snapshot for snapshot in seen if "B --> C" in snapshot)
+    assert inside_data.endswith("B --> C[(DB)]\nend")
+    for snapshot in seen:
+        lines = [line.strip() for line in snapshot.splitlines()]
+        assert lines.count("end") == sum(line.startswith("subgraph") for line in lines)
+
+
+def test_drawio_snapshots_are_well_formed():
+    seen = [snapshot for snapshot in snapshots("drawio", DRAWIO, size=7) if snapshot]
+    assert seen and all(ET.fromstring(snapshot) is not None for snapshot in seen)
+    # The edge target arrives after the edge; until then the reference is left out
+    early = next(snapshot for snapshot in seen if 'id="e"' in snapshot)
+    assert 'target="3"' not in early
+    assert 'target="3"' in seen[-1]
+    assert partial_artifact("general") is None
@@ -0,0 +1,428 @@
+import asyncio
+import json
+
+import pytest
+from sqlalchemy import text
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app.core.database import create_db_engine, migrate
+from app.core.migrations import applied_migrations, check_migrations, migration_files
+from app.models.chat import MESSAGE_COMPLETE, MESSAGE_INTERRUPTED, MESSAGE_STREAMING
+from app.services.archive_service import ArchiveService
+from app.services.chat import ChatService
+from app.services.search_service import SearchService
+
+DIAGRAM = "<mxfile>" + "".join(f'<mxCell id="{i}" value="Node {i}" vertex="1" parent="1"/>' for i in range(20)) + "</mxfile>"
+
+
+def sqlite_engine(tmp_path):
+    return create_db_engine(f"sqlite+aiosqlite:///{tmp_path}/deepdiagram.db")
+
+
+def test_fresh_sqlite_database_is_migrated(tmp_path):
+    engine = sqlite_engine(tmp_path)
+
+    async def run():
+        await migrate(engine)
+        await migrate(engine)  # second start: nothing left to apply
+        async with engine.connect() as conn:
+            assert (await conn.execute(text("PRAGMA journal_mode"))).scalar() == "wal"
+            assert (await conn.execute(text("PRAGMA foreign_keys"))).scalar() == 1
+            applied = await applied_migrations(conn)
+            assert applied == migration_files("sqlite")
+            assert await check_migrations(conn) == []
+        await engine.dispose()
+
+    asyncio.run(run())
+
+
+def test_chat_service_on_sqlite(tmp_path):
+    engine = sqlite_engine(tmp_path)
+
+    async def run():
+        await migrate(engine)
+        async with AsyncSession(engine, expire_on_commit=False) as db:
+            chat = ChatService(db)
+            chat_session = await chat.create_session("SQLite")
+            user = await chat.add_message(chat_session.id, "user", "draw a flowchart")
+
+            draft = await chat.checkpoint_message(None, chat_session.id, "", agent="drawio", parent_id=user.id)
+            assert draft.status == MESSAGE_STREAMING and draft.turn_index == user.turn_index + 1
+            steps = [{"type": "tool_end", "name": "render_drawio_xml", "content": DIAGRAM}]
+            final = await chat.checkpoint_message(
+                draft.id, chat_session.id, "done", steps=steps, agent="drawio", parent_id=user.id,
+                status=MESSAGE_COMPLETE
+            )
+            assert final.id == draft.id and final.steps[0]["content"] == ""
+
+            history = await chat.get_history(chat_session.id)
+            assert [m.id for m in history] == [user.id, draft.id]
+            assert history[1].steps[0]["content"] == DIAGRAM
+
+            page, cursor = await chat.get_messages_page(chat_session.id, limit=1)
+            assert len(page) == 1 and cursor
+            rest, _ = await chat.get_messages_page(chat_session.id, limit=10, cursor=cursor)
+            assert {m["id"] for m in page + rest} == {user.id, draft.id}
+
+            await chat.delete_session(chat_session.id)
+            assert await chat.get_session(chat_session.id) is None
+        await engine.dispose()
+
+    asyncio.run(run())
+
+
+def test_search_on_sqlite(tmp_path):
+    engine = sqlite_engine(tmp_path)
+
+    async def run():
+        await migrate(engine)
+        async with AsyncSession(engine, expire_on_commit=False) as db:
+            chat = ChatService(db)
+            checkout = await chat.create_session("Checkout flow")
+            user = await chat.add_message(checkout.id, "user", "payment service architecture")
+            steps = [
+                {"type": "design_concept", "content": "Layered layout with the gateway on top"},
+                {"type": "tool_end", "name": "create_drawio", "content": DIAGRAM.replace("Node 3", "Payment Gateway")},
+            ]
+            draft = await chat.checkpoint_message(None, checkout.id, "", steps=steps, parent_id=user.id)
+            other = await chat.create_session("Team mindmap")
+            await chat.add_message(other.id, "user", "mindmap of the platform team")
+
+            search = SearchService(db)
+            hits, _ = await search.search("gateway", limit=10)
+            assert {hit["kind"] for hit in hits} == set()  # the draft is not indexed yet
+            await chat.checkpoint_message(draft.id, checkout.id, "done", steps=steps, parent_id=user.id,
+                                          status=MESSAGE_COMPLETE)
+            hits, _ = await search.search("gateway", limit=10)
+            assert {hit["kind"] for hit in hits} == {"design_concept", "artifact"}
+            assert all(hit["message_id"] == draft.id and hit["session_title"] == "Checkout flow" for hit in hits)
+            assert "<mark>" in hits[0]["snippet"]
+
+            hits, next_offset = await search.search('"payment*', limit=1)  # FTS5 syntax is ignored
+            assert len(hits) == 1 and next_offset == 1
+            hits, _ = await search.search("mxCell", limit=10)
+            assert hits == []  # markup is not indexed, only labels
+
+            await chat.delete_session(checkout.id)
+            hits, _ = await search.search("payment", limit=10)
+            assert hits == []
+            hits, _ = await search.search("mindmap", limit=10)
+            assert {hit["kind"] for hit in hits} == {"title", "prompt"}
+        await engine.dispose()
+
+    asyncio.run(run())
+
+
+def test_diagram_with_empty_labels_is_saved_and_indexed(tmp_path):
+    engine = sqlite_engine(tmp_path)
+    diagram = '<mxfile><mxCell id="0"/><mxCell id="1" value="" parent="0"/>' \
+              '<mxCell id="2" value="Queue" vertex="1" parent="1"/><mxCell id="3" label="" edge="1" parent="1"/></mxfile>'
+
+    async def run():
+        await migrate(engine)
+        async with AsyncSession(engine, expire_on_commit=False) as db:
+            chat = ChatService(db)
+            session = await chat.create_session("Messaging")
+            steps = [{"type": "tool_end", "name": "create_drawio", "content": diagram}]
+            message = await chat.add_message(session.id, "assistant", "done", steps=steps, agent="drawio")
+            assert message.id
+
+            hits, _ = await SearchService(db).search("queue", limit=10)
+            assert [hit["kind"] for hit in hits] == ["artifact"]
+        await engine.dispose()
+
+    asyncio.run(run())
+
+
+def test_search_index_backfilled_for_existing_database(tmp_path):
+    engine = sqlite_engine(tmp_path)
+
+    async def run():
+        await migrate(engine)
+        async with AsyncSession(engine, expire_on_commit=False) as db:
+            chat = ChatService(db)
+            chat_session = await chat.create_session("Old session")
+            await chat.add_message(chat_session.id, "user", "legacy kubernetes cluster")
+        async with engine.begin() as conn:
+            await conn.execute(text("DROP TABLE searchdocument_fts"))
+            await conn.execute(text("DROP TABLE searchdocument"))
+
+        await migrate(engine)
+        async with AsyncSession(engine) as db:
+            hits, _ = await SearchService(db).search("kubernetes", limit=10)
+            assert [hit["kind"] for hit in hits] == ["prompt"]
+            hits, _ = await SearchService(db).search("old session", limit=10)
+            assert [hit["kind"] for hit in hits] == ["title"]
+        await engine.dispose()
+
+    asyncio.run(run())
+
+
+def test_archive_and_restore_on_sqlite(tmp_path, monkeypatch):
+    from datetime import timedelta
+    import app.services.archive_service as archive_service
+    from app.models.chat import ArtifactRevision, ChatMessage, ChatSession, utc_now
+    from app.services.blob_store import LocalBlobStore
+    from sqlmodel import func, select, update
+
+    monkeypatch.setattr(archive_service, "get_blob_store", lambda: LocalBlobStore(str(tmp_path / "blobs")))
+    monkeypatch.setattr(archive_service.settings, "DB_DELETE_BATCH_SIZE", 2)
+    monkeypatch.setattr(archive_service.settings, "ARCHIVE_AFTER_DAYS", 90)
+    engine = sqlite_engine(tmp_path)
+
+    async def run():
+        await migrate(engine)
+        async with AsyncSession(engine, expire_on_commit=False) as db:
+            chat = ChatService(db)
+            old_id = (await chat.create_session("Old architecture")).id
+            parent_id = None
+            for i in range(3):
+                user = await chat.add_message(old_id, "user", f"revision {i} of the cache layer", parent_id=parent_id)
+                steps = [{"type": "tool_end", "name": "create_drawio", "content": DIAGRAM.replace("Node 1", f"Cache {i}")}]
+                reply = await chat.add_message(old_id, "assistant", "done", steps=steps, parent_id=user.id)
+                parent_id = reply.id
+            recent_id = (await chat.create_session("Recent")).id
+            await db.exec(update(ChatSession).where(ChatSession.id == old_id).values(updated_at=utc_now() - timedelta(days=400)))
+            await db.commit()
+            before = [(m.id, m.parent_id, m.steps) for m in await chat.get_history(old_id)]
+
+            archiver = ArchiveService(db)
+            assert await archiver.archive_idle_sessions(limit=10) == 1
+            assert (await db.exec(select(func.count()).select_from(ChatMessage))).one() == 0
+            assert (await db.exec(select(func.count()).select_from(ArtifactRevision))).one() == 0
+            assert (await chat.get_session(recent_id)).archive_key is None
+            hits, _ = await SearchService(db).search("cache", limit=10)
+            assert hits and all(hit["session_id"] == old_id and hit["message_id"] is None for hit in hits)
+
+            assert await archiver.restore_if_archived(old_id)
+            assert [(m.id, m.parent_id, m.steps) for m in await chat.get_history(old_id)] == before
+            hits, _ = await SearchService(db).search("cache", limit=10)
+            assert hits and all(hit["message_id"] for hit in hits)
+            # Restoring counts as activity, so the session is not archived again right away
+            assert await archiver.archive_idle_sessions(limit=10) == 0
+            assert not await archiver.restore_if_archived(old_id)
+
+            await chat.delete_session(old_id)
+            assert (await db.exec(select(func.count()).select_from(ChatMessage))).one() == 0
+
+            # Deleting an archived session deletes its archive, once no other session references it
+            await chat.add_message(recent_id, "user", "keep this")
+            await db.exec(update(ChatSession).where(ChatSession.id == recent_id).values(updated_at=utc_now() - timedelta(days=400)))
+            await db.commit()
+            assert await archiver.archive_idle_sessions(limit=10) == 1
+            archive_key = (await chat.get_session(recent_id)).archive_key
+            store = archive_service.get_blob_store()
+            copy_id = (await chat.create_session("Copy")).id
+            await db.exec(update(ChatSession).where(ChatSession.id == copy_id).values(archive_key=archive_key))
+            await db.commit()
+            await chat.delete_session(recent_id)
+            assert await store.stat(archive_key)
+            await chat.delete_session(copy_id)
+            assert await store.stat(archive_key) is None
+        await engine.dispose()
+
+    asyncio.run(run())
+
+
+def test_history_snapshot_patched_on_write(tmp_path):
+    import gzip
+    import json
+    from app.services.snapshot_service import SessionSnapshotService
+
+    engine = sqlite_engine(tmp_path)
+
+    async def run():
+        await migrate(engine)
+        async with AsyncSession(engine, expire_on_commit=False) as db:
+            chat = ChatService(db)
+            snapshots = SessionSnapshotService(db)
+            chat_session = await chat.create_session("Snapshot")
+            user = await chat.add_message(chat_session.id, "user", "draw a flowchart")
+            assert await snapshots.get(chat_session.id) is None
+            first = await snapshots.build(chat_session.id)
+            assert (await snapshots.get(chat_session.id)).etag == first.etag
+
+            steps = [{"type": "tool_end", "name": "create_drawio", "content": DIAGRAM}]
+            reply = await chat.add_message(chat_session.id, "assistant", "done", steps=steps, parent_id=user.id)
+            await chat.update_message(user.id, content="draw a sequence diagram")
+            patched = await snapshots.get(chat_session.id)
+            assert patched and patched.etag != first.etag
+            history = json.loads(gzip.decompress(patched.data))
+            assert [m["id"] for m in history["messages"]] == [user.id, reply.id]
+            assert history["messages"][0]["content"] == "draw a sequence diagram"
+            assert history["messages"][1]["steps"][0]["content"] == DIAGRAM
+
+            # Patching gives exactly what a rebuild from the tables gives
+            await snapshots.delete(chat_session.id)
+            await db.commit()
+            assert (await snapshots.build(chat_session.id)).data == patched.data
+
+            # Draft checkpoints leave the stored snapshot alone (stale); the final write patches it
+            stored = (await db.exec(text(f"SELECT data FROM sessionsnapshot WHERE session_id = {chat_session.id}"))).scalar()
+            draft = await chat.checkpoint_message(None, chat_session.id, "", parent_id=reply.id, draft_output="partial")
+            await chat.checkpoint_message(draft.id, chat_session.id, "", parent_id=reply.id, draft_output="partial output")
+            assert await snapshots.get(chat_session.id) is None
+            assert (await db.exec(text(f"SELECT data FROM sessionsnapshot WHERE session_id = {chat_session.id}"))).scalar() == stored
+            await chat.checkpoint_message(draft.id, chat_session.id, "all done", parent_id=reply.id, status=MESSAGE_COMPLETE)
+            final = await snapshots.get(chat_session.id)
+            assert final and json.loads(gzip.decompress(final.data))["messages"][-1]["content"] == "all done"
+            await snapshots.delete(chat_session.id)
+            await db.commit()
+            assert (await snapshots.build(chat_session.id)).data == final.data
+            interrupted = await chat.add_message(chat_session.id, "assistant", "", parent_id=reply.id,
+                                                 status=MESSAGE_INTERRUPTED, draft_output="raw model output")
+            messages = json.loads(gzip.decompress((await snapshots.get(chat_session.id)).data))["messages"]
+            assert messages[-1]["id"] == interrupted.id and "draft_output" not in messages[-1]
+
+            await chat.delete_session(chat_session.id)
+            assert await snapshots.get(chat_session.id) is None
+        await engine.dispose()
+
+    asyncio.run(run())
+
+
+def test_only_raster_image_blobs_are_served_inline(tmp_path, monkeypatch):
+    import app.api.routes as routes
+    from app.services.blob_store import LocalBlobStore
+    from starlette.requests import Request
+
+    store = LocalBlobStore(str(tmp_path / "blobs"))
+    monkeypatch.setattr(routes, "get_blob_store", lambda: store)
+
+    async def fetch(data, content_type):
+        digest = await store.put(data, content_type)
+        return await routes.get_blob(digest, Request({"type": "http", "headers": []}))
+
+    async def run():
+        image = await fetch(b"\x89PNG\r\n\x1a\n", "image/png")
+        assert image.media_type == "image/png" and "content-disposition" not in image.headers
+        assert image.headers["x-content-type-options"] == "nosniff"
+
+        for content_type in ("text/html", "image/svg+xml"):
+            page = await fetch(f"<script>alert('{content_type}')</script>".encode(), content_type)
+            assert page.media_type == "application/octet-stream"
+            assert page.headers["content-disposition"] == "attachment"
+            assert page.headers["x-content-type-options"] == "nosniff"
+
+    asyncio.run(run())
+
+
+def test_user_message_is_announced_before_a_stream_error(tmp_path, monkeypatch):
+    import app.api.routes as routes
+    import app.core.database as database
+    from app.api.routes import ChatRequest, event_generator
+    from sqlalchemy.ext.asyncio import async_sessionmaker
+
+    class FailingGraph:
+        async def astream_events(self, inputs, version):
+            raise RuntimeError("provider 401")
+            yield
+
+    engine = sqlite_engine(tmp_path)
+    monkeypatch.setattr(database, "async_session_factory",
+                        async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False))
+    monkeypatch.setattr(routes, "graph", FailingGraph())
+    monkeypatch.setattr(routes.settings, "DB_WRITE_BEHIND", True)
+
+    async def run():
+        await migrate(engine)
+        try:
+            events = [event async for event in event_generator(ChatRequest(prompt="hi there", agent_id="mindmap"))]
+            async with AsyncSession(engine) as db:
+                rows = (await db.exec(text("SELECT id, role, content FROM chatmessage"))).all()
+        finally:
+            await engine.dispose()
+        names = [event.split("\n")[0].removeprefix("event: ") for event in events]
+        assert names == ["session_created", "message_created", "error"]
+        created = json.loads(events[1].split("data: ")[1])
+        assert [tuple(row) for row in rows] == [(created["id"], "user", "hi there")]
+
+    asyncio.run(run())
+
+
+def test_write_behind_survives_its_queue_and_keeps_order(tmp_path, monkeypatch):
+    import gc
+    import app.core.database as database
+    import app.services.write_behind as write_behind
+    from sqlalchemy.ext.asyncio import async_sessionmaker
+
+    engine = sqlite_engine(tmp_path)
+    monkeypatch.setattr(database, "async_session_factory",
+                        async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False))
+    monkeypatch.setattr(write_behind, "session_scope", database.session_scope)
+
+    async def run():
+        await migrate(engine)
+        try:
+            writer = write_behind.WriteBehindQueue(label="test")
+            created = writer.submit(lambda chat: chat.create_session("Write-behind"))
+            session_id = (await created).id
+            failed = writer.submit(lambda chat: chat.add_message("missing-session", "user", "lost"))
+            for i in range(3):
+                writer.submit(lambda chat, i=i: chat.add_message(session_id, "user", f"message {i}"))
+            # The request (and its queue) may go away before the writes are done
+            del writer
+            gc.collect()
+            while write_behind._workers:
+                await asyncio.sleep(0.01)
+
+            assert isinstance(failed.exception(), Exception)
+            async with AsyncSession(engine) as db:
+                rows = (await db.exec(text("SELECT content FROM chatmessage ORDER BY turn_index"))).all()
+            assert [row[0] for row in rows] == ["message 0", "message 1", "message 2"]
+        finally:
+            await engine.dispose()
+
+    asyncio.run(run())
+
+
+def test_migrations_baseline_skip_applied_and_detect_edits(tmp_path, monkeypatch):
+    import app.core.migrations as migrations
+
+    migrations_dir = tmp_path / "migrations"
+    migrations_dir.mkdir()
+    monkeypatch.setattr(migrations, "MIGRATIONS_DIR", str(migrations_dir))
+    (migrations_dir / "001_create_marker.sql").write_text("CREATE TABLE marker (id INTEGER)")
+    engine = sqlite_engine(tmp_path)
+
+    async def tables(conn):
+        return {row[0] for row in (await conn.execute(text("SELECT name FROM sqlite_master WHERE type = 'table'")))}
+
+    async def run():
+        try:
+            # Fresh database: the schema comes from the models, existing migrations are only recorded
+            await migrate(engine)
+            async with engine.connect() as conn:
+                assert "marker" not in await tables(conn)
+                assert await applied_migrations(conn) == migration_files("sqlite")
+
+            # Later migrations run once; applied ones are skipped on every start
+            (migrations_dir / "002_create_widget.sql").write_text("CREATE TABLE widget (id INTEGER)")
+            (migrations_dir / "003_seed_widget.sql").write_text("INSERT INTO widget (id) VALUES (1)")
+            async with engine.connect() as conn:
+                assert await check_migrations(conn) == ["002_create_widget.sql", "003_seed_widget.sql"]
+            await migrate(engine)
+            await migrate(engine)
+            async with engine.connect() as conn:
+                assert (await conn.execute(text("SELECT count(*) FROM widget"))).scalar() == 1
+                assert await check_migrations(conn) == []
+                # Rows recorded before checksums existed are filled in from the current file
+                await conn.execute(text("UPDATE schema_migrations SET checksum = NULL WHERE filename = '002_create_widget.sql'"))
+                await conn.commit()
+            await migrate(engine)
+            async with engine.connect() as conn:
+                assert await applied_migrations(conn) == migration_files("sqlite")
+
+            # Editing an applied migration is reported instead of silently diverging
+            (migrations_dir / "003_seed_widget.sql").write_text("INSERT INTO widget (id) VALUES (2)")
+            async with engine.connect() as conn:
+                with pytest.raises(migrations.MigrationError, match="003_seed_widget.sql was modified"):
+                    await check_migrations(conn)
+            with pytest.raises(migrations.MigrationError):
+                await migrate(engine)
+            async with engine.connect() as conn:
+                assert (await conn.execute(text("SELECT count(*) FROM widget"))).scalar() == 1
+        finally:
+            await engine.dispose()
+
+    asyncio.run(run())
@@ -0,0 +1,58 @@
+import asyncio
+import base64
+
+from app.services.retrieval_service import DocumentIndex, RetrievalService, chunk_document
+
+REPORT = "\n\n".join([
+    "# Overview\n\nThe platform serves web and mobile clients through a single API.",
+    "# Billing\n\nInvoices are generated monthly. Payment failures trigger three retries with exponential backoff.",
+    "# Storage\n\nObjects live in a replicated bucket; metadata is kept in PostgreSQL.",
+    "# 部署\n\n服务通过 Kubernetes 部署在两个可用区。",
+])
+
+
+def as_file(name, text):
+    return {"name": name, "data": "data:text/plain;base64," + base64.b64encode(text.encode()).decode()}
+
+
+def retrieve(monkeypatch, files, query, top_k, chunk_size=200):
+    RetrievalService._cache.clear()
+    service = RetrievalService(chunk_size=chunk_size)
+
+    async def parse_file(filename, data):
+        return base64.b64decode(data.split(",")[1]).decode()
+
+    monkeypatch.setattr(service.parsing_service, "parse_file", parse_file)
+    return asyncio.run(service.retrieve_context(files, query, top_k))
+
+
+def test_relevant_chunk_ranks_first():
+    index = DocumentIndex.build("report.md", REPORT, chunk_size=200)
+    assert [chunk.heading for chunk in index.chunks] == ["Overview", "Billing", "Storage", "部署"]
+
+    assert index.search("how are payment retries handled", top_k=3)[0][1].heading == "Billing"
+    assert index.search("kubernetes", top_k=3)[0][1].heading == "部署"
+    assert index.search("可用区", top_k=3)[0][1].heading == "部署"  # CJK bigrams
+    assert index.search("the what how", top_k=3) == []  # only stopwords
+
+
+def test_chunks_and_context_respect_budget(monkeypatch):
+    long_paragraph = "\n".join(f"line {i} about queue consumers" for i in range(200))
+    chunks = chunk_document(long_paragraph + "\n\n" + "x" * 1000, chunk_size=300)
+    assert len(chunks) > 1 and all(len(chunk.text) <= 300 for chunk in chunks)
+
+    text = "\n\n".join(f"## Section {i}\n\nqueue consumer notes {i}" for i in range(30))
+    context = retrieve(monkeypatch, [as_file("notes.md", text)], "queue consumer", top_k=4)
+    assert context.count("[notes.md §") == 4
+
+
+def test_empty_and_short_documents(monkeypatch):
+    assert chunk_document("", chunk_size=100) == []
+    assert chunk_document("\n\n  \n", chunk_size=100) == []
+    assert DocumentIndex.build("empty.txt", "", chunk_size=100).search("anything", top_k=3) == []
+
+    assert retrieve(monkeypatch, [], "anything", top_k=3) == ""
+    assert retrieve(monkeypatch, [as_file("empty.txt", "")], "anything", top_k=3) == ""
+    # Nothing matches: the leading chunk of a short document is used as is
+    assert retrieve(monkeypatch, [as_file("memo.txt", "Ship on Friday.")], "summarize this", top_k=3) \
+        == "[memo.txt]\nShip on Friday."
@@ -0,0 +1,68 @@
+import io
+from datetime import datetime
+
+from openpyxl import Workbook
+
+from app.core.config import settings
+from app.services.spreadsheet_service import profile_rows, profile_spreadsheet, render_profile
+
+
+def workbook_bytes(sheets):
+    workbook = Workbook()
+    workbook.remove(workbook.active)
+    for name, rows in sheets.items():
+        sheet = workbook.create_sheet(name)
+        for row in rows:
+            sheet.append(row)
+    buffer = io.BytesIO()
+    workbook.save(buffer)
+    return buffer.getvalue()
+
+
+def test_profile_types_columns_and_skips_blanks():
+    rows = [
+        (None, None, None, None, None),
+        ("Date", "Region", "Revenue", "Active", "Region"),
+        (datetime(2024, 1, 1), "North", 120, True, "n"),
+        (None, None, None, None, None),
+        (datetime(2024, 2, 1), "South", 80.5, False, ""),
+        (datetime(2024, 3, 1), "North", "n/a", True, None),
+    ]
+    sheet = profile_rows("Sales", rows, keep_full_rows=50)
+    assert sheet.header == ["Date", "Region", "Revenue", "Active", "Region_2"]
+    assert sheet.row_count == 3
+    assert [col.kind for col in sheet.columns] == ["datetime", "text", "numeric", "boolean", "text"]
+    assert [col.non_null for col in sheet.columns] == [3, 3, 3, 3, 1]
+
+    revenue = sheet.columns[2].summary()
+    assert "min 80.5" in revenue and "max 120" in revenue and "sum 200.5" in revenue
+    assert sheet.columns[0].summary() == "from 2024-01-01 to 2024-03-01"
+    assert sheet.columns[1].summary() == "2 distinct; top: North (2), South (1)"
+    assert "## Sheet: Sales (3 rows x 5 columns)" in render_profile(sheet)
+
+    assert profile_rows("Blank", [(None, ""), ("", None)], keep_full_rows=50) is None
+
+
+def test_full_data_only_under_row_cap(monkeypatch):
+    monkeypatch.setattr(settings, "SPREADSHEET_FULL_DATA_ROWS", 10)
+    monkeypatch.setattr(settings, "SPREADSHEET_CHART_MAX_ROWS", 100)
+    monkeypatch.setattr(settings, "SPREADSHEET_SAMPLE_ROWS", 2)
+    monkeypatch.setattr(settings, "SPREADSHEET_BATCH_ROWS", 7)
+    data = workbook_bytes({
+        "Small": [("month", "value")] + [(f"m{i}", i) for i in range(5)],
+        "Large": [("day", "value")] + [(f"d{i}", i) for i in range(40)],
+        "Empty": [],
+    })
+
+    profile = profile_spreadsheet(data, "xlsx")
+    small, large = profile.split("## Sheet: ")[1:]
+    assert "Data (CSV, all rows)" in small and "m4,4" in small
+    # Over the cap: head and tail samples only, statistics still cover every row (in batches)
+    assert "Sample (CSV, first 2 and last 2 rows)" in large
+    assert "d1,1\n...\nd38,38\nd39,39" in large and "d20,20" not in large
+    assert "| value | numeric | 40 | min 0, max 39, mean 19.5" in large
+    assert "Empty" not in profile
+
+    charted = profile_spreadsheet(data, "xlsx", keep_full_data=True)
+    assert "Data (CSV, all rows)" in charted.split("## Sheet: Large")[1] and "d20,20" in charted
+    assert profile_spreadsheet(workbook_bytes({"Empty": []}), "xlsx") == "[Empty spreadsheet]"
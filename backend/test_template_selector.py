@@ -0,0 +1,65 @@
+import asyncio
+
+from langchain_core.language_models.fake_chat_models import GenericFakeChatModel
+from langchain_core.messages import AIMessage, HumanMessage
+
+import app.agents.infographic as infographic
+from app.core.config import settings
+from app.data.template_syntax import ALL_TEMPLATES
+from app.services.template_selector import select_template_locally
+
+
+def test_local_selection_covers_guide_use_cases_in_both_languages():
+    expected = {
+        "SWOT analysis of our startup": "compare-swot",
+        "Pie chart of market share by region": "chart-pie-",
+        "iPhone vs Android": "compare-binary-",
+        "History of the internet": "sequence-timeline-",
+        "Word cloud of customer feedback": "chart-wordcloud",
+        "Onboarding steps for new hires": "sequence-",
+        "公司组织架构图": "hierarchy-",
+        "用户转化漏斗": "sequence-funnel-",
+        "产品优缺点对比": "compare-",
+        "PDCA 循环": "sequence-circular-",
+    }
+    for request, prefix in expected.items():
+        template = select_template_locally(request)
+        assert template in ALL_TEMPLATES and template.startswith(prefix), (request, template)
+    assert select_template_locally("Explain how photosynthesis works") is None
+
+
+CALLS = []
+
+
+class CountingModel(GenericFakeChatModel):
+    async def _astream(self, messages, *args, **kwargs):
+        CALLS.append(("astream", messages[0].content))
+        async for chunk in super()._astream(messages, *args, **kwargs):
+            yield chunk
+
+    async def _agenerate(self, messages, *args, **kwargs):
+        CALLS.append(("ainvoke", messages[0].content))
+        return await super()._agenerate(messages, *args, **kwargs)
+
+
+def run_agent(request, mode, monkeypatch):
+    CALLS.clear()
+    replies = iter([AIMessage(content="compare-swot"), AIMessage(content="<code>infographic compare-swot</code>")])
+    monkeypatch.setattr(settings, "INFOGRAPHIC_TEMPLATE_SELECTION", mode)
+    monkeypatch.setattr(infographic, "get_configured_llm", lambda state: CountingModel(messages=replies))
+    asyncio.run(infographic.infographic_agent_node({"messages": [HumanMessage(content=request)]}))
+    return list(CALLS)
+
+
+def test_infographic_generation_takes_one_call_unless_llm_selection(monkeypatch):
+    calls = run_agent("SWOT analysis of our startup", "local", monkeypatch)
+    assert [kind for kind, _ in calls] == ["astream"]
+    assert "for the template: compare-swot" in calls[0][1]
+
+    # Nothing matches locally: the model picks from the catalogue in the same call
+    calls = run_agent("Explain how photosynthesis works", "local", monkeypatch)
+    assert [kind for kind, _ in calls] == ["astream"]
+    assert "### TEMPLATE CATALOGUE" in calls[0][1] and "sequence-funnel-simple" in calls[0][1]
+
+    calls = run_agent("SWOT analysis of our startup", "llm", monkeypatch)
+    assert [kind for kind, _ in calls] == ["ainvoke", "astream"]
@@ -19,6 +19,8 @@ export const CanvasPanel = () => {
     const activeMessageId = useChatStore(state => state.activeMessageId);
     const allMessages = useChatStore(state => state.allMessages);
     const isLoading = useChatStore(state => state.isLoading);
+    const isStreamingCode = useChatStore(state => state.isStreamingCode);
+    const artifactSnapshot = useChatStore(state => state.artifactSnapshot);
     const [showDownloadMenu, setShowDownloadMenu] = useState(false);
 
     const agentRef = useRef<AgentRef>(null);
@@ -134,6 +136,9 @@ export const CanvasPanel = () => {
                             const getCode = () => {
                                 if (!activeMsg) return '';
 
+                                // While code streams, render the latest renderable snapshot from the backend
+                                if (isStreamingCode && artifactSnapshot && !activeMessageId) return artifactSnapshot;
+
                                 // Mindmap 特殊逻辑：只有 tool_start 后才开始渲染
                                 if (activeAgent === 'mindmap') {
                                     const hasToolStart = activeMsg.steps?.some(s => s.type === 'tool_start');
@@ -2,7 +2,7 @@ import { useEffect, useRef, useState } from 'react';
 import {
     Sparkles, ChevronDown, ChevronUp, Loader2, Workflow, Network,
     Code2, BarChart3, PenTool, Brain, Send, Paperclip, X, FileText,
-    Settings, Command, Square, Copy, Check, RotateCcw, Zap, Github,
+    Settings, Command, Square, Copy, Check, RotateCcw, StepForward, Zap, Github,
     Plus, History as HistoryIcon, MessageSquare, Trash2, AlertCircle,
     ChevronRight, ChevronLeft
 } from 'lucide-react';
@@ -227,11 +227,14 @@ export const ChatPanel = () => {
         addStepToLastMessage,
         updateLastStepContent,
         setStreamingCode,
+        setArtifactSnapshot,
         toast,
         clearToast,
         sessions,
+        sessionsCursor,
         allMessages,
         loadSessions,
+        loadMoreSessions,
         selectSession,
         createNewChat,
         deleteSession,
@@ -319,7 +322,7 @@ export const ChatPanel = () => {
         }
     };
 
-    const handleRetry = (index: number, errorMessage?: string) => {
+    const handleRetry = (index: number, errorMessage?: string, resume?: boolean) => {
         if (isLoading) return;
         const msgs = [...messages];
         let retryPrompt = '';
@@ -344,7 +347,8 @@ export const ChatPanel = () => {
             // We don't slice history anymore to support linear versioning
             // The logic will be handled by Turn Index and Version switching
             const isAssistantRetry = msgs[index].role === 'assistant';
-            void triggerSubmit(retryPrompt, retryImages, parentId, isAssistantRetry, errorMessage);
+            const resumeMessageId = resume && isAssistantRetry ? msgs[index].id : undefined;
+            void triggerSubmit(retryPrompt, retryImages, parentId, isAssistantRetry, errorMessage, resumeMessageId);
         }
     };
 
@@ -536,7 +540,7 @@ export const ChatPanel = () => {
         }
     };
 
-    const triggerSubmit = async (customPrompt?: string, customImages?: string[], parentId?: number | null, isRetry?: boolean, errorMessage?: string) => {
+    const triggerSubmit = async (customPrompt?: string, customImages?: string[], parentId?: number | null, isRetry?: boolean, errorMessage?: string, resumeMessageId?: number) => {
         let promptToUse = customPrompt ?? input;
         const imagesToUse = customImages ?? [...inputImages];
         const filesToUse = [...inputFiles];
@@ -624,6 +628,7 @@ export const ChatPanel = () => {
                     context: {},
                     parent_id: effectiveParentId,
                     is_retry: isRetry,
+                    resume_message_id: resumeMessageId,
                     concurrency: concurrency,
                     model_id: activeModel?.modelId,
                     api_key: activeModel?.apiKey,
@@ -866,6 +871,13 @@ export const ChatPanel = () => {
                                     }
                                     break;
 
+                                case 'artifact_snapshot':
+                                    // Repaired, parseable prefix of the streaming code: the canvas renders it right away
+                                    if (data.content) {
+                                        setArtifactSnapshot(data.content);
+                                    }
+                                    break;
+
                                 case 'tool_args_stream':
                                     if (data.args) {
                                         const stateArgs = useChatStore.getState();
@@ -1067,6 +1079,14 @@ export const ChatPanel = () => {
                                             </div>
                                         ))
                                     )}
+                                    {sessionsCursor && (
+                                        <button
+                                            onClick={() => void loadMoreSessions()}
+                                            className="w-full p-2 text-xs font-medium text-slate-500 hover:text-blue-600 hover:bg-blue-50/50 rounded-xl transition-all"
+                                        >
+                                            Load more
+                                        </button>
+                                    )}
                                 </div>
                             </div>
                         )}
@@ -1451,6 +1471,16 @@ export const ChatPanel = () => {
                                         <RotateCcw className="w-3.5 h-3.5" />
                                     </button>
                                 )}
+                                {msg.role === 'assistant' && msg.id && msg.id > 0 && (msg.status === 'interrupted' || msg.status === 'streaming') && (
+                                    <button
+                                        onClick={(e) => { e.stopPropagation(); handleRetry(idx, undefined, true); }}
+                                        disabled={isLoading}
+                                        className="p-1 text-slate-400 hover:text-blue-600 transition-colors cursor-pointer disabled:opacity-30 disabled:cursor-not-allowed"
+                                        title="Continue from here"
+                                    >
+                                        <StepForward className="w-3.5 h-3.5" />
+                                    </button>
+                                )}
                                 {msg.created_at && (
                                     <span className="text-[10px] text-slate-300 ml-1 font-medium select-none whitespace-nowrap">
                                         {new Date(msg.created_at).toLocaleString([], {
@@ -300,7 +300,7 @@ const StepItem = ({ step, activeAgent, messageIndex, associatedResult, onRetry,
 export const ExecutionTrace = ({ steps, thoughts = [], messageIndex, onRetry, onSync }: ExecutionTraceProps) => {
     // Determine if we should show the block at all
     const visibleSteps = steps.filter(s => {
-        if (s.type === 'doc_analysis') return false;
+        if (s.type === 'doc_analysis' || s.type === 'diagnostics') return false;
         if (s.type === 'agent_select' && (s.name === 'general' || s.name === 'general_agent')) return false;
         if (s.type === 'agent_end') return false;
         return true;
@@ -351,7 +351,7 @@ export const ExecutionTrace = ({ steps, thoughts = [], messageIndex, onRetry, on
 
                         for (let idx = 0; idx < steps.length; idx++) {
                             const step = steps[idx];
-                            if (step.type === 'doc_analysis') continue;
+                            if (step.type === 'doc_analysis' || step.type === 'diagnostics') continue;
 
                             // Render design_concept with special component
                             if (step.type === 'design_concept') {
@@ -6,7 +6,7 @@ import type { AgentRef, AgentProps } from './types';
 import { AlertCircle } from 'lucide-react';
 
 export const ChartsAgent = forwardRef<AgentRef, AgentProps>(({ content }, ref) => {
-    const { isStreamingCode } = useChatStore();
+    const { isStreamingCode, artifactSnapshot } = useChatStore();
     let currentCode = cleanContent(content);
     // Fix double-escaped newlines from LLM output
     if (currentCode.includes('\\n') && !currentCode.includes('\n')) {
@@ -39,7 +39,7 @@ export const ChartsAgent = forwardRef<AgentRef, AgentProps>(({ content }, ref) =
 
     useEffect(() => {
         if (!currentCode || !chartRef.current) return;
-        if (isStreamingCode) return;
+        if (isStreamingCode && !artifactSnapshot) return;
 
         // Initialize or get existing instance
         let chart = chartInstanceRef.current;
@@ -145,7 +145,7 @@ export const ChartsAgent = forwardRef<AgentRef, AgentProps>(({ content }, ref) =
                 chartInstanceRef.current = null;
             }
         }
-    }, [currentCode, isStreamingCode]);
+    }, [currentCode, isStreamingCode, artifactSnapshot]);
 
     // Cleanup on unmount
     useEffect(() => {
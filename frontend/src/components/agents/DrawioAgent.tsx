@@ -24,7 +24,7 @@ function sanitizeDrawioXml(xml: string): string {
 }
 
 export const DrawioAgent = forwardRef<AgentRef, AgentProps>(({ content }, ref) => {
-    const { isStreamingCode } = useChatStore();
+    const { isStreamingCode, artifactSnapshot } = useChatStore();
     let currentCode = cleanContent(content);
     // Fix double-escaped newlines from LLM output
     if (currentCode.includes('\\n') && !currentCode.includes('\n')) {
@@ -109,7 +109,7 @@ export const DrawioAgent = forwardRef<AgentRef, AgentProps>(({ content }, ref) =
     }, []);
 
     useEffect(() => {
-        if (!isStreamingCode && iframeReady && currentCode && drawioIframeRef.current) {
+        if ((!isStreamingCode || artifactSnapshot) && iframeReady && currentCode && drawioIframeRef.current) {
             let cleanXml = currentCode.replace(/```xml\s?/, '').replace(/```/, '').trim();
 
             // Handle nested JSON structure: {"design_concept": "...", "code": "..."}
@@ -145,7 +145,7 @@ export const DrawioAgent = forwardRef<AgentRef, AgentProps>(({ content }, ref) =
                 }, 1200);
             }
         }
-    }, [iframeReady, currentCode, isStreamingCode]);
+    }, [iframeReady, currentCode, isStreamingCode, artifactSnapshot]);
 
     // Use ui=atlas with explicit sidebar=0 and format=0 which are more reliable
     const drawioUrl = "https://embed.diagrams.net/?" + new URLSearchParams({
@@ -214,7 +214,7 @@ const nodeTypes = {
 };
 
 export const FlowAgent = forwardRef<AgentRef, AgentProps>(({ content }, ref) => {
-    const { isStreamingCode } = useChatStore();
+    const { isStreamingCode, artifactSnapshot } = useChatStore();
     let currentCode = cleanContent(content);
     // Fix double-escaped newlines from LLM output
     if (currentCode.includes('\\n') && !currentCode.includes('\n')) {
@@ -324,7 +324,7 @@ export const FlowAgent = forwardRef<AgentRef, AgentProps>(({ content }, ref) =>
                 isInternalUpdate.current = false;
                 return;
             }
-            if (isStreamingCode) return;
+            if (isStreamingCode && !artifactSnapshot) return;
 
             try {
                 let jsonStr = currentCode;
@@ -413,7 +413,7 @@ export const FlowAgent = forwardRef<AgentRef, AgentProps>(({ content }, ref) =>
             setNodes([]);
             setEdges([]);
         }
-    }, [currentCode, isStreamingCode]);
+    }, [currentCode, isStreamingCode, artifactSnapshot]);
 
     return (
         <div className="w-full h-full bg-[#fcfcfc] relative">
@@ -46,7 +46,7 @@ const ZoomControls = ({ onFit }: { onFit: () => void }) => {
 };
 
 export const MermaidAgent = forwardRef<AgentRef, AgentProps>(({ content }, ref) => {
-    const { isStreamingCode } = useChatStore();
+    const { isStreamingCode, artifactSnapshot } = useChatStore();
     let currentCode = cleanContent(content);
     // Fix double-escaped newlines from LLM output
     if (currentCode.includes('\\n') && !currentCode.includes('\n')) {
@@ -164,7 +164,7 @@ export const MermaidAgent = forwardRef<AgentRef, AgentProps>(({ content }, ref)
                 return;
             }
             // 移除 isStreamingCode 检查，总是渲染
-            if (isStreamingCode) return;  // 流式期间不渲染
+            if (isStreamingCode && !artifactSnapshot) return;  // 流式期间只渲染快照
             try {
                 setError(null);
 
@@ -228,7 +228,7 @@ export const MermaidAgent = forwardRef<AgentRef, AgentProps>(({ content }, ref)
         };
 
         renderDiagram();
-    }, [currentCode, isStreamingCode]);
+    }, [currentCode, isStreamingCode, artifactSnapshot]);
 
     useEffect(() => {
         if (!wrapperRef.current || !isLoaded || !dimensions) return;
@@ -2,6 +2,8 @@ import { create } from 'zustand';
 import type { ChatState, Message, AgentType, Step, DocAnalysisBlock } from '../types';
 import { setCanvasState, getCanvasState } from './canvasState';
 
+const SESSIONS_PAGE_SIZE = 30;
+
 export const useChatStore = create<ChatState>((set, get) => ({
     messages: [],
     input: '',
@@ -9,9 +11,11 @@ export const useChatStore = create<ChatState>((set, get) => ({
     isLoading: false,
     sessionId: null,
     sessions: [],
+    sessionsCursor: null,
     allMessages: [],
     inputImages: [],
     isStreamingCode: false,
+    artifactSnapshot: null,
     activeMessageId: null,
     selectedVersions: {},
     activeStepRef: null,
@@ -25,7 +29,9 @@ export const useChatStore = create<ChatState>((set, get) => ({
         setCanvasState({ activeAgent: agent });
     },
     setLoading: (loading) => set({ isLoading: loading }),
-    setStreamingCode: (streaming) => set({ isStreamingCode: streaming }),
+    // A snapshot only stands in for code that is still streaming
+    setStreamingCode: (streaming) => set(streaming ? { isStreamingCode: true } : { isStreamingCode: false, artifactSnapshot: null }),
+    setArtifactSnapshot: (code) => set({ artifactSnapshot: code }),
     setSessionId: (id) => set({ sessionId: id }),
     setMessages: (messages) => set({ messages }),
     setActiveMessageId: (id) => {
@@ -411,16 +417,34 @@ export const useChatStore = create<ChatState>((set, get) => ({
 
     loadSessions: async () => {
         try {
-            const response = await fetch('/api/sessions');
+            const response = await fetch(`/api/sessions?limit=${SESSIONS_PAGE_SIZE}`);
             if (response.ok) {
                 const data = await response.json();
-                set({ sessions: data });
+                set({ sessions: data.items, sessionsCursor: data.next_cursor });
             }
         } catch (error) {
             console.error('Failed to load sessions:', error);
         }
     },
 
+    loadMoreSessions: async () => {
+        const { sessionsCursor } = get();
+        if (!sessionsCursor) return;
+        try {
+            const response = await fetch(`/api/sessions?limit=${SESSIONS_PAGE_SIZE}&cursor=${encodeURIComponent(sessionsCursor)}`);
+            if (response.ok) {
+                const data = await response.json();
+                const known = new Set(get().sessions.map(s => s.id));
+                set({
+                    sessions: [...get().sessions, ...data.items.filter((s: { id: number }) => !known.has(s.id))],
+                    sessionsCursor: data.next_cursor
+                });
+            }
+        } catch (error) {
+            console.error('Failed to load more sessions:', error);
+        }
+    },
+
     selectSession: async (sessionId: number) => {
         set({ isLoading: true, sessionId, messages: [], allMessages: [], selectedVersions: {} });
         try {
@@ -604,7 +628,8 @@ export const useChatStore = create<ChatState>((set, get) => ({
             selectedVersions: newSelectedVersions,
             activeAgent: lastAgent,
             activeMessageId: messageId,
-            isStreamingCode: false
+            isStreamingCode: false,
+            artifactSnapshot: null
         };
 
         set(newState);
@@ -722,6 +747,7 @@ export const useChatStore = create<ChatState>((set, get) => ({
             allMessages: [],
             inputImages: [],
             isStreamingCode: false,
+            artifactSnapshot: null,
             activeMessageId: null,
             selectedVersions: {},
             activeAgent: 'mindmap',
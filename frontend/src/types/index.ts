@@ -1,7 +1,7 @@
 export type AgentType = 'mindmap' | 'flowchart' | 'charts' | 'drawio' | 'mermaid' | 'infographic' | 'general';
 
 export interface Step {
-    type: 'agent_select' | 'tool_start' | 'tool_end' | 'doc_analysis' | 'agent_end' | 'design_concept';
+    type: 'agent_select' | 'tool_start' | 'tool_end' | 'doc_analysis' | 'agent_end' | 'design_concept' | 'diagnostics';
     name?: string; // e.g. "mindmap_agent", "create_chart"
     content?: string; // Input or Output
     status: 'running' | 'done' | 'error';
@@ -37,6 +37,7 @@ export interface Message {
     steps?: Step[]; // Execution trace
     agent?: AgentType | string;
     turn_index?: number;
+    status?: 'streaming' | 'interrupted' | 'complete'; // assistant replies are checkpointed while streaming
     created_at?: string;
     error?: string; // Optional error message
     docAnalysisBlocks?: DocAnalysisBlock[];
@@ -61,9 +62,11 @@ export interface ChatState {
     isLoading: boolean;
     sessionId: number | null;
     sessions: ChatSession[];
+    sessionsCursor: string | null; // keyset cursor of the next sessions page, null when all are loaded
     allMessages: Message[];
     inputImages: string[]; // Base64 data URLs
     isStreamingCode: boolean;
+    artifactSnapshot: string | null; // latest renderable prefix of the code being streamed
     activeMessageId: number | null;
     selectedVersions: Record<number, number>; // turnIndex -> selected messageId
     inputFiles: { name: string, data: string }[];
@@ -74,6 +77,7 @@ export interface ChatState {
     addMessage: (message: Message) => void;
     setLoading: (loading: boolean) => void;
     setStreamingCode: (streaming: boolean) => void;
+    setArtifactSnapshot: (code: string | null) => void;
     setSessionId: (id: number | null) => void;
     setMessages: (messages: Message[]) => void;
     updateLastMessage: (content: string, isStreaming?: boolean, status?: 'running' | 'done' | 'error', sessionId?: number, skipCanvasSync?: boolean) => void;
@@ -100,6 +104,7 @@ export interface ChatState {
 
     // Session management
     loadSessions: () => Promise<void>;
+    loadMoreSessions: () => Promise<void>;
     selectSession: (sessionId: number) => Promise<void>;
     createNewChat: () => void;
     deleteSession: (sessionId: number) => Promise<void>;